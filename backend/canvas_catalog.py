@@ -0,0 +1,169 @@
+"""Shared Canvas course catalogue.
+
+Classmates sync the same courses, so the assignment list of a course is
+crawled once per freshness window and stored once in ``canvas_courses``,
+keyed by ``(canvas_domain, course_id)``. Each student's ``assignments``
+entry for a Canvas item is a small overlay (``course_key``, ``canvas_id``,
+``completed`` and a mirrored ``due_date`` for the due-date index), and
+``hydrate`` fills in title, description and course name from the catalogue
+when the assignments are read.
+
+Concurrent syncs of a stale course in one worker share a single crawl. A
+crawl that fails (an expired token, Canvas down) falls back to the last
+good copy. Canvas can return per-student due dates (overrides); the
+catalogue keeps the list as seen by whichever student's token crawled it,
+minus unpublished items (the token may belong to a teacher or TA).
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import metrics
+from workload import invalidate_course
+
+logger = logging.getLogger(__name__)
+
+catalog_lookups = metrics.REGISTRY.counter(
+    "canvas_catalog_lookups_total", "Course catalogue lookups by outcome.", ("result",)
+)
+
+MAX_PAGES = 50
+
+
+def course_key(canvas_domain: str, course_id) -> str:
+    return f"{canvas_domain.rstrip('/')}|{course_id}"
+
+
+def _due_date(due_at: Optional[str]) -> Optional[str]:
+    if not due_at:
+        return None
+    return datetime.fromisoformat(due_at.replace("Z", "+00:00")).isoformat()
+
+
+class CanvasCatalog:
+    def __init__(self, db, fetch: Callable[..., Awaitable], ttl_seconds: float = 900):
+        """``fetch(endpoint_label, url, **kwargs)`` performs one Canvas GET."""
+        self.db = db
+        self.fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.inflight: Dict[str, asyncio.Future] = {}
+
+    async def course(self, canvas_domain: str, course: dict, headers: dict) -> Optional[dict]:
+        """The catalogue entry for a course, crawling Canvas only when stale."""
+        key = course_key(canvas_domain, course["id"])
+        cached = await self.db.canvas_courses.find_one({"key": key}, {"_id": 0})
+        if cached is not None and self._fresh(cached):
+            catalog_lookups.inc("hit")
+            return cached
+        if key in self.inflight:
+            catalog_lookups.inc("shared")
+            return await asyncio.shield(self.inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            entry = await self._crawl(key, canvas_domain, course, headers, cached)
+        except Exception as e:
+            logger.error(f"Canvas catalogue crawl error for {key}: {str(e)}")
+            entry = cached
+        except BaseException:
+            # Cancelled mid-crawl: callers sharing it get the last good copy
+            future.set_result(cached)
+            raise
+        finally:
+            del self.inflight[key]
+        if entry is cached:
+            catalog_lookups.inc("stale" if cached is not None else "error")
+        else:
+            catalog_lookups.inc("miss")
+        future.set_result(entry)
+        return entry
+
+    def _fresh(self, entry: dict) -> bool:
+        fetched_at = datetime.fromisoformat(entry["fetched_at"])
+        return datetime.now(timezone.utc) - fetched_at < timedelta(seconds=self.ttl_seconds)
+
+    async def _crawl(self, key: str, canvas_domain: str, course: dict, headers: dict, cached: Optional[dict]):
+        items = []
+        url = f"{canvas_domain}/api/v1/courses/{course['id']}/assignments"
+        params = {"per_page": 100}
+        for _ in range(MAX_PAGES):
+            response = await self.fetch("course_assignments", url, headers=headers, params=params)
+            if response.status_code != 200:
+                return cached
+            items.extend(response.json())
+            url = response.links.get("next", {}).get("url")
+            params = None  # the next link carries the query string
+            if not url:
+                break
+
+        assignments = [
+            {
+                "canvas_id": item["id"],
+                "title": item["name"],
+                "description": item.get("description") or "",
+                "due_date": _due_date(item.get("due_at")),
+            }
+            for item in items
+            # The crawling token may be a teacher's or TA's; students only
+            # ever see published items
+            if item.get("published", True)
+        ]
+        entry = {
+            "key": key,
+            "canvas_domain": canvas_domain.rstrip("/"),
+            "course_id": course["id"],
+            "name": course.get("name", "Unknown Course"),
+            "assignments": assignments,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await self.db.canvas_courses.update_one({"key": key}, {"$set": entry}, upsert=True)
+
+        # Keep the due dates mirrored on student overlays in step with Canvas
+        if cached is not None:
+            previous = {a["canvas_id"]: a["due_date"] for a in cached.get("assignments", [])}
+            moved = False
+            for assignment in assignments:
+                old = previous.get(assignment["canvas_id"])
+                if old is not None and assignment["due_date"] is not None and old != assignment["due_date"]:
+                    await self.db.assignments.update_many(
+                        {"course_key": key, "canvas_id": assignment["canvas_id"]},
+                        {"$set": {"due_date": assignment["due_date"]}}
+                    )
+                    moved = True
+            if moved:
+                # Per-day workload counts of the course's students are now off
+                await invalidate_course(self.db, key)
+        return entry
+
+
+async def hydrate(db, docs: Iterable[dict]) -> List[dict]:
+    """Fill catalogue fields into overlay assignment documents.
+
+    Documents without a ``course_key`` (manual and legacy Canvas entries) pass
+    through untouched; overlays whose course or item left the catalogue are
+    dropped.
+    """
+    docs = list(docs)
+    keys = {doc["course_key"] for doc in docs if doc.get("course_key")}
+    if not keys:
+        return docs
+    items = {}
+    async for course in db.canvas_courses.find({"key": {"$in": list(keys)}}, {"_id": 0}):
+        for item in course.get("assignments", []):
+            items[(course["key"], item["canvas_id"])] = (course, item)
+
+    hydrated = []
+    for doc in docs:
+        if doc.get("course_key"):
+            found = items.get((doc["course_key"], doc.get("canvas_id")))
+            if found is None:
+                continue
+            course, item = found
+            doc["title"] = item["title"]
+            doc["description"] = item["description"]
+            doc["course_name"] = course["name"]
+            doc["due_date"] = item["due_date"] or doc.get("due_date")
+        hydrated.append(doc)
+    return hydrated
@@ -0,0 +1,258 @@
+"""Negotiated response compression for the YOUNIVITY API.
+
+Message histories and assignment lists can run to hundreds of kilobytes of
+JSON, which is slow to ship over mobile links. ``CompressionMiddleware``
+picks the best encoding the client accepts (zstd, brotli or gzip, depending
+on what is installed), skips bodies below a size threshold and hands very
+large bodies to the thread pool so compression never stalls the event loop.
+
+Run ``python compression.py`` to print the CPU-versus-bytes trade-off of each
+codec on payloads shaped like our real responses.
+"""
+import gzip
+import os
+from typing import Dict, List, Mapping, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional: pip install zstandard
+    zstandard = None
+
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+    "text/",
+)
+
+
+class Codec:
+    """A content-coding and the function that produces it."""
+
+    def __init__(self, name: str, level: int):
+        self.name = name
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        if self.name == "br":
+            return brotli.compress(data, quality=self.level)
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+
+def available_codecs(levels: Optional[Dict[str, int]] = None) -> List[Codec]:
+    """Codecs usable in this process, in server preference order."""
+    levels = levels or {}
+    codecs = []
+    if zstandard is not None:
+        codecs.append(Codec("zstd", levels.get("zstd", 3)))
+    if brotli is not None:
+        codecs.append(Codec("br", levels.get("br", 4)))
+    codecs.append(Codec("gzip", levels.get("gzip", 6)))
+    return codecs
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    accepted = {}
+    for item in value.split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            key, _, raw = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(raw)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def negotiate(accept_encoding: str, codecs: List[Codec]) -> Optional[Codec]:
+    """Pick the codec with the highest client q-value, ties broken by our order."""
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_encoding(accept_encoding)
+    best_q, best = 0.0, None
+    for codec in codecs:
+        q = accepted.get(codec.name, accepted.get("*", 0.0))
+        if q > best_q:
+            best_q, best = q, codec
+    return best
+
+
+class CompressionMiddleware:
+    """Compress HTTP responses using the encoding negotiated per request.
+
+    Bodies smaller than ``minimum_size`` are sent as-is, since the headers
+    would cost more than the savings. Bodies of ``offload_size`` bytes or
+    more are compressed in the thread pool. Streaming responses are passed
+    through untouched.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        offload_size: int = 32 * 1024,
+        levels: Optional[Dict[str, int]] = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.codecs = available_codecs(levels)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        codec = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.codecs)
+        if codec is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, codec, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, codec: Codec, send):
+        self.middleware = middleware
+        self.codec = codec
+        self.downstream = send
+        self.start_message = None
+        self.started = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.started:
+            await self.downstream(message)
+            return
+
+        self.started = True
+        headers = Headers(raw=self.start_message["headers"])
+        body = message.get("body", b"")
+
+        if (
+            message.get("more_body", False)
+            or "content-encoding" in headers
+            or len(body) < self.middleware.minimum_size
+            or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+        ):
+            await self.downstream(self.start_message)
+            await self.downstream(message)
+            return
+
+        if len(body) >= self.middleware.offload_size:
+            body = await run_in_threadpool(self.codec.compress, body)
+        else:
+            body = self.codec.compress(body)
+
+        mutable = MutableHeaders(raw=self.start_message["headers"])
+        mutable["Content-Encoding"] = self.codec.name
+        mutable["Content-Length"] = str(len(body))
+        mutable.add_vary_header("Accept-Encoding")
+
+        await self.downstream(self.start_message)
+        await self.downstream({"type": "http.response.body", "body": body})
+
+
+def levels_from_env(env: Optional[Mapping[str, str]] = None) -> Dict[str, int]:
+    env = os.environ if env is None else env
+    return {
+        "zstd": int(env.get("COMPRESSION_ZSTD_LEVEL", "3")),
+        "br": int(env.get("COMPRESSION_BROTLI_LEVEL", "4")),
+        "gzip": int(env.get("COMPRESSION_GZIP_LEVEL", "6")),
+    }
+
+
+def _sample_payloads() -> Dict[str, bytes]:
+    import json
+    import uuid
+    from datetime import datetime, timedelta, timezone
+
+    now = datetime.now(timezone.utc)
+    group_id = str(uuid.uuid4())
+    user_ids = [str(uuid.uuid4()) for _ in range(20)]
+    messages = [
+        {
+            "id": str(uuid.uuid4()),
+            "group_id": group_id,
+            "user_id": user_ids[i % 20],
+            "user_name": f"Student {i % 20}",
+            "content": f"Has anyone started problem {i % 12} of the homework yet?",
+            "created_at": (now - timedelta(minutes=1000 - i)).isoformat(),
+        }
+        for i in range(1000)
+    ]
+    assignments = [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": user_ids[0],
+            "title": f"Homework {i}",
+            "description": "<p>Read chapter %d and answer the review questions.</p>" % (i % 30),
+            "due_date": (now + timedelta(days=i % 120)).isoformat(),
+            "source": "canvas",
+            "course_name": f"CS {100 + i % 8}",
+            "completed": i % 3 == 0,
+            "created_at": now.isoformat(),
+        }
+        for i in range(1000)
+    ]
+    return {
+        "messages_1000": json.dumps(messages).encode(),
+        "assignments_1000": json.dumps(assignments).encode(),
+    }
+
+
+def benchmark(repeat: int = 20) -> List[dict]:
+    """Measure compressed size and CPU time for every codec and a few levels."""
+    import time
+
+    levels = {"zstd": [1, 3, 9], "br": [1, 4, 9], "gzip": [1, 6, 9]}
+    results = []
+    for payload_name, payload in _sample_payloads().items():
+        for codec in available_codecs():
+            for level in levels[codec.name]:
+                candidate = Codec(codec.name, level)
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    compressed = candidate.compress(payload)
+                elapsed = (time.perf_counter() - start) / repeat
+                results.append({
+                    "payload": payload_name,
+                    "encoding": codec.name,
+                    "level": level,
+                    "raw_bytes": len(payload),
+                    "compressed_bytes": len(compressed),
+                    "ratio": round(len(payload) / len(compressed), 2),
+                    "cpu_ms": round(elapsed * 1000, 3),
+                    "mb_per_s": round(len(payload) / elapsed / 1e6, 1),
+                })
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'payload':<18}{'enc':<6}{'lvl':>4}{'raw':>10}{'comp':>9}{'ratio':>8}{'cpu ms':>9}{'MB/s':>8}")
+    for row in benchmark():
+        print(
+            f"{row['payload']:<18}{row['encoding']:<6}{row['level']:>4}{row['raw_bytes']:>10}"
+            f"{row['compressed_bytes']:>9}{row['ratio']:>8}{row['cpu_ms']:>9}{row['mb_per_s']:>8}"
+        )
@@ -0,0 +1,161 @@
+"""Typed application settings, read once per app instance.
+
+``Settings.from_env()`` merges ``backend/.env`` with the process environment
+(real environment variables win) without writing anything back to
+``os.environ``, so building settings has no side effects and tests can pass
+their own mapping.
+"""
+import os
+from pathlib import Path
+from typing import List, Mapping, Optional
+
+from compression import levels_from_env
+from database import MongoSettings
+from message_store import MessageStoreSettings
+from presence import PresenceSettings
+from profiling import ProfilingSettings
+from reminders import ReminderSettings
+
+ROOT_DIR = Path(__file__).parent
+
+DEFAULT_CORS_ORIGINS = [
+    "https://endearing-tulumba-a4d24e.netlify.app",  # your frontend
+    "http://localhost:3000",  # local testing
+]
+
+
+def load_env(env_file: Optional[Path] = ROOT_DIR / ".env") -> dict:
+    from dotenv import dotenv_values
+
+    values = {}
+    if env_file is not None and env_file.exists():
+        values.update({k: v for k, v in dotenv_values(env_file).items() if v is not None})
+    values.update(os.environ)
+    return values
+
+
+def _bool(value: Optional[str], default: bool) -> bool:
+    if value is None or value == "":
+        return default
+    return value.lower() == "true"
+
+
+class Settings:
+    def __init__(
+        self,
+        mongodb_uri: Optional[str] = None,
+        mongo: Optional[MongoSettings] = None,
+        messages: Optional[MessageStoreSettings] = None,
+        jwt_secret_key: Optional[str] = None,
+        jwt_algorithm: str = "HS256",
+        access_token_expire_minutes: int = 60,
+        cors_origins: Optional[List[str]] = None,
+        compression_min_size: int = 1024,
+        compression_offload_size: int = 32 * 1024,
+        compression_levels: Optional[dict] = None,
+        ws_per_message_deflate: bool = True,
+        ws_replay_buffer_size: int = 100,
+        ws_replay_max_groups: int = 10_000,
+        rate_limit_login: str = "10/minute",
+        rate_limit_register: str = "5/minute",
+        rate_limit_lms_sync: str = "3/minute",
+        rate_limit_messages: str = "30/10",
+        rate_limit_trust_forwarded: bool = False,
+        rate_limit_redis_url: Optional[str] = None,
+        fanout_redis_url: Optional[str] = None,
+        background_jobs: bool = True,
+        profiling: Optional[ProfilingSettings] = None,
+        reminders: Optional[ReminderSettings] = None,
+        presence: Optional[PresenceSettings] = None,
+        debug_token: Optional[str] = None,
+        canvas_client_id: Optional[str] = None,
+        canvas_client_secret: Optional[str] = None,
+        canvas_redirect_uri: Optional[str] = None,
+        canvas_base_url: str = "https://canvas.instructure.com",
+        canvas_pool_size: int = 20,
+        canvas_timeout_seconds: float = 30.0,
+        canvas_catalog_ttl_seconds: float = 900.0,
+        profile_cache_size: int = 10_000,
+        profile_cache_ttl_seconds: float = 300.0,
+        free_slot_cache_ttl_seconds: float = 60.0,
+    ):
+        self.mongodb_uri = mongodb_uri
+        self.mongo = mongo or MongoSettings(uri=mongodb_uri or "")
+        self.messages = messages or MessageStoreSettings()
+        self.jwt_secret_key = jwt_secret_key
+        self.jwt_algorithm = jwt_algorithm
+        self.access_token_expire_minutes = access_token_expire_minutes
+        self.cors_origins = cors_origins if cors_origins is not None else list(DEFAULT_CORS_ORIGINS)
+        self.compression_min_size = compression_min_size
+        self.compression_offload_size = compression_offload_size
+        self.compression_levels = compression_levels or {}
+        self.ws_per_message_deflate = ws_per_message_deflate
+        self.ws_replay_buffer_size = ws_replay_buffer_size
+        self.ws_replay_max_groups = ws_replay_max_groups
+        self.rate_limit_login = rate_limit_login
+        self.rate_limit_register = rate_limit_register
+        self.rate_limit_lms_sync = rate_limit_lms_sync
+        self.rate_limit_messages = rate_limit_messages
+        self.rate_limit_trust_forwarded = rate_limit_trust_forwarded
+        self.rate_limit_redis_url = rate_limit_redis_url
+        # Cross-worker delivery of WebSocket frames (fanout.py)
+        self.fanout_redis_url = fanout_redis_url
+        # Reminder engine and message retention; serve.py runs them on one worker
+        self.background_jobs = background_jobs
+        self.profiling = profiling or ProfilingSettings()
+        self.reminders = reminders or ReminderSettings()
+        self.presence = presence or PresenceSettings()
+        self.debug_token = debug_token
+        self.canvas_client_id = canvas_client_id
+        self.canvas_client_secret = canvas_client_secret
+        self.canvas_redirect_uri = canvas_redirect_uri
+        self.canvas_base_url = canvas_base_url
+        self.canvas_pool_size = canvas_pool_size
+        self.canvas_timeout_seconds = canvas_timeout_seconds
+        self.canvas_catalog_ttl_seconds = canvas_catalog_ttl_seconds
+        self.profile_cache_size = profile_cache_size
+        self.profile_cache_ttl_seconds = profile_cache_ttl_seconds
+        self.free_slot_cache_ttl_seconds = free_slot_cache_ttl_seconds
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "Settings":
+        env = load_env() if env is None else env
+        mongodb_uri = env.get("MONGODB_URI")
+        return cls(
+            mongodb_uri=mongodb_uri,
+            mongo=MongoSettings.from_env(mongodb_uri or "", env),
+            messages=MessageStoreSettings.from_env(env),
+            jwt_secret_key=env.get("JWT_SECRET_KEY"),
+            access_token_expire_minutes=int(env.get("ACCESS_TOKEN_EXPIRE_MINUTES", 60)),
+            compression_min_size=int(env.get("COMPRESSION_MIN_SIZE", 1024)),
+            compression_offload_size=int(env.get("COMPRESSION_OFFLOAD_SIZE", 32 * 1024)),
+            compression_levels=levels_from_env(env),
+            ws_per_message_deflate=_bool(env.get("WS_PER_MESSAGE_DEFLATE"), True),
+            ws_replay_buffer_size=int(env.get("WS_REPLAY_BUFFER_SIZE", 100)),
+            ws_replay_max_groups=int(env.get("WS_REPLAY_MAX_GROUPS", 10_000)),
+            rate_limit_login=env.get("RATE_LIMIT_LOGIN", "10/minute"),
+            rate_limit_register=env.get("RATE_LIMIT_REGISTER", "5/minute"),
+            rate_limit_lms_sync=env.get("RATE_LIMIT_LMS_SYNC", "3/minute"),
+            rate_limit_messages=env.get("RATE_LIMIT_MESSAGES", "30/10"),
+            # A configured proxy (serve.py's FORWARDED_ALLOW_IPS) means the peer
+            # address is the proxy's, so key the buckets on X-Forwarded-For
+            rate_limit_trust_forwarded=_bool(
+                env.get("RATE_LIMIT_TRUST_FORWARDED"), bool(env.get("FORWARDED_ALLOW_IPS"))
+            ),
+            rate_limit_redis_url=env.get("RATE_LIMIT_REDIS_URL") or None,
+            fanout_redis_url=env.get("FANOUT_REDIS_URL") or None,
+            profiling=ProfilingSettings.from_env(env),
+            reminders=ReminderSettings.from_env(env),
+            presence=PresenceSettings.from_env(env),
+            debug_token=env.get("DEBUG_TOKEN") or None,
+            canvas_client_id=env.get("CANVAS_CLIENT_ID"),
+            canvas_client_secret=env.get("CANVAS_CLIENT_SECRET"),
+            canvas_redirect_uri=env.get("CANVAS_REDIRECT_URI"),
+            canvas_base_url=env.get("CANVAS_BASE_URL", "https://canvas.instructure.com"),
+            canvas_pool_size=int(env.get("CANVAS_POOL_SIZE", 20)),
+            canvas_timeout_seconds=float(env.get("CANVAS_TIMEOUT_SECONDS", 30)),
+            canvas_catalog_ttl_seconds=float(env.get("CANVAS_CATALOG_TTL_SECONDS", 900)),
+            profile_cache_size=int(env.get("PROFILE_CACHE_SIZE", 10_000)),
+            profile_cache_ttl_seconds=float(env.get("PROFILE_CACHE_TTL_SECONDS", 300)),
+            free_slot_cache_ttl_seconds=float(env.get("FREE_SLOT_CACHE_TTL_SECONDS", 60)),
+        )
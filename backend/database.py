@@ -0,0 +1,185 @@
+"""MongoDB client configuration.
+
+Pool sizing, timeouts, wire compression and read preferences all come from
+the environment so they can be tuned per deployment without code changes.
+Read-heavy endpoints (group lists, message history) read through
+``read_heavy`` handles, which can be pointed at secondaries with
+``MONGO_READ_HEAVY_PREFERENCE`` while writes and membership checks stay on
+the primary.
+"""
+import os
+from typing import List, Mapping, Optional
+
+READ_PREFERENCES = ("primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest")
+
+
+def _int_env(env: Mapping[str, str], name: str, default: Optional[int]) -> Optional[int]:
+    value = env.get(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def available_compressors(requested: List[str]) -> List[str]:
+    """Drop compressors whose Python package is missing; pymongo would refuse them."""
+    available = []
+    for name in requested:
+        if name == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                continue
+        elif name == "snappy":
+            try:
+                import snappy  # noqa: F401
+            except ImportError:
+                continue
+        elif name != "zlib":
+            continue
+        available.append(name)
+    return available
+
+
+def read_preference(name: str, max_staleness_seconds: int = -1):
+    from pymongo import read_preferences
+
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}")
+    if name == "primary":
+        return read_preferences.Primary()
+    cls = getattr(read_preferences, name[0].upper() + name[1:])
+    return cls(max_staleness=max_staleness_seconds)
+
+
+class MongoSettings:
+    def __init__(
+        self,
+        uri: str,
+        db_name: str = "Younivity",
+        app_name: str = "younivity-api",
+        max_pool_size: int = 100,
+        min_pool_size: int = 0,
+        max_connecting: int = 2,
+        max_idle_time_ms: Optional[int] = 300_000,
+        wait_queue_timeout_ms: Optional[int] = 5_000,
+        server_selection_timeout_ms: int = 5_000,
+        connect_timeout_ms: int = 10_000,
+        socket_timeout_ms: Optional[int] = 30_000,
+        compressors: Optional[List[str]] = None,
+        zlib_level: int = 6,
+        read_preference: str = "primary",
+        read_heavy_preference: str = "primary",
+        max_staleness_seconds: int = -1,
+    ):
+        self.uri = uri
+        self.db_name = db_name
+        self.app_name = app_name
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.max_connecting = max_connecting
+        self.max_idle_time_ms = max_idle_time_ms
+        self.wait_queue_timeout_ms = wait_queue_timeout_ms
+        self.server_selection_timeout_ms = server_selection_timeout_ms
+        self.connect_timeout_ms = connect_timeout_ms
+        self.socket_timeout_ms = socket_timeout_ms
+        self.compressors = compressors if compressors is not None else ["zstd", "snappy", "zlib"]
+        self.zlib_level = zlib_level
+        self.read_preference = read_preference
+        self.read_heavy_preference = read_heavy_preference
+        self.max_staleness_seconds = max_staleness_seconds
+
+    @classmethod
+    def from_env(cls, uri: str, env: Optional[Mapping[str, str]] = None) -> "MongoSettings":
+        env = os.environ if env is None else env
+        compressors = env.get("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+        return cls(
+            uri=uri,
+            db_name=env.get("MONGO_DB_NAME", "Younivity"),
+            app_name=env.get("MONGO_APP_NAME", "younivity-api"),
+            max_pool_size=_int_env(env, "MONGO_MAX_POOL_SIZE", 100),
+            min_pool_size=_int_env(env, "MONGO_MIN_POOL_SIZE", 0),
+            max_connecting=_int_env(env, "MONGO_MAX_CONNECTING", 2),
+            max_idle_time_ms=_int_env(env, "MONGO_MAX_IDLE_TIME_MS", 300_000),
+            wait_queue_timeout_ms=_int_env(env, "MONGO_WAIT_QUEUE_TIMEOUT_MS", 5_000),
+            server_selection_timeout_ms=_int_env(env, "MONGO_SERVER_SELECTION_TIMEOUT_MS", 5_000),
+            connect_timeout_ms=_int_env(env, "MONGO_CONNECT_TIMEOUT_MS", 10_000),
+            socket_timeout_ms=_int_env(env, "MONGO_SOCKET_TIMEOUT_MS", 30_000),
+            compressors=[c.strip() for c in compressors.split(",") if c.strip()],
+            zlib_level=_int_env(env, "MONGO_ZLIB_LEVEL", 6),
+            read_preference=env.get("MONGO_READ_PREFERENCE", "primary"),
+            read_heavy_preference=env.get("MONGO_READ_HEAVY_PREFERENCE", "primary"),
+            max_staleness_seconds=_int_env(env, "MONGO_MAX_STALENESS_SECONDS", -1),
+        )
+
+    def client_kwargs(self) -> dict:
+        kwargs = {
+            "appname": self.app_name,
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "maxConnecting": self.max_connecting,
+            "maxIdleTimeMS": self.max_idle_time_ms,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+            "read_preference": read_preference(self.read_preference, self.max_staleness_seconds),
+        }
+        compressors = available_compressors(self.compressors)
+        if compressors:
+            kwargs["compressors"] = ",".join(compressors)
+            if "zlib" in compressors:
+                kwargs["zlibCompressionLevel"] = self.zlib_level
+        return kwargs
+
+
+def create_client(settings: MongoSettings, event_listeners=None):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    return AsyncIOMotorClient(settings.uri, event_listeners=event_listeners or [], **settings.client_kwargs())
+
+
+# Indexes backing the hot queries, created (idempotently) at startup
+INDEXES = {
+    "users": [("id", {}), ("email", {})],
+    "groups": [("id", {}), ("member_ids", {})],
+    "messages": [
+        ([("group_id", 1), ("seq", 1)], {}),
+        ([("group_id", 1), ("created_at", 1)], {}),
+        ("created_at", {}),
+    ],
+    "message_buckets": [
+        ([("group_id", 1), ("start", 1)], {}),
+        ([("group_id", 1), ("last_at", -1)], {}),
+        ([("group_id", 1), ("last_seq", 1)], {}),
+        ("end", {}),
+    ],
+    "message_archive": [([("group_id", 1), ("first_id", 1)], {})],
+    "assignments": [
+        ([("user_id", 1), ("due_date", 1)], {}),
+        ([("user_id", 1), ("course_key", 1)], {}),
+        ([("course_key", 1), ("canvas_id", 1)], {}),
+        ("id", {}),
+        ("due_date", {}),
+    ],
+    "busy_blocks": [([("user_id", 1), ("start", 1)], {}), ("id", {})],
+    "canvas_courses": [("key", {"unique": True})],
+    "workload_buckets": [([("user_id", 1), ("day", 1), ("course", 1)], {"unique": True})],
+    "workload_summaries": [("user_id", {"unique": True}), ("course_keys", {})],
+    "pending_reminders": [("user_id", {}), ("expires_at", {"expireAfterSeconds": 0})],
+    "lms_configs": [("user_id", {})],
+}
+
+
+async def ensure_indexes(db) -> None:
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            await db[collection].create_index(keys, **options)
+
+
+def read_heavy(db, settings: MongoSettings):
+    """A view of ``db`` whose reads follow the read-heavy preference."""
+    if settings.read_heavy_preference == settings.read_preference:
+        return db
+    return db.with_options(
+        read_preference=read_preference(settings.read_heavy_preference, settings.max_staleness_seconds)
+    )
@@ -0,0 +1,122 @@
+"""Delivery of WebSocket frames and reminder updates to every worker.
+
+Sockets live in the worker that accepted them, so a chat message posted to
+one worker has to reach the members connected to the others. Anything meant
+for sockets goes through ``Fanout.publish(kind, target, message)``:
+
+- ``group``: a frame for everyone in a group (chat messages, profile frames),
+- ``user``: a frame for every socket a user holds (deadline reminders),
+- ``reminders``: schedule/cancel updates for the worker that runs the
+  reminder engine.
+
+Each worker registers a handler per kind and the handler delivers to the
+sockets it holds. ``InMemoryFanout`` calls the handlers directly (one
+worker). ``RedisFanout`` publishes on one pub/sub channel that every worker,
+the publisher included, listens on, so each message reaches each worker
+once. If Redis cannot be reached, the publisher delivers to its own sockets
+and logs a warning, like the rate limiter and presence backends.
+"""
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, dict], Awaitable[int]]
+
+fanout_errors = metrics.REGISTRY.counter(
+    "fanout_errors_total", "Cross-worker fan-out calls that failed.", ("operation",)
+)
+
+
+class InMemoryFanout:
+    """Single worker: publishing is delivering."""
+
+    shared = False
+
+    def __init__(self, handlers: Dict[str, Handler]):
+        self.handlers = handlers
+
+    def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, kind: str, target: str, message: dict) -> int:
+        """Deliver to this worker's sockets; returns how many got it."""
+        return await self.handlers[kind](target, message)
+
+
+class RedisFanout:
+    """Every worker subscribes to one Redis channel and delivers locally.
+
+    Needs the optional ``redis`` package. ``publish`` cannot tell how many
+    sockets other workers reached, so it returns 0; callers that need a
+    delivery guarantee (reminders) queue first and let the delivering worker
+    acknowledge.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, handlers: Dict[str, Handler], channel: str = "fanout"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.handlers = handlers
+        self.channel = channel
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self.redis.aclose()
+
+    async def publish(self, kind: str, target: str, message: dict) -> int:
+        data = json.dumps({"kind": kind, "target": target, "message": message}, separators=(",", ":"))
+        try:
+            await self.redis.publish(self.channel, data)
+            return 0
+        except Exception as e:
+            fanout_errors.inc("publish")
+            logger.warning(f"Fan-out unavailable, delivering locally only: {str(e)}")
+            return await self.handlers[kind](target, message)
+
+    async def _deliver(self, data) -> None:
+        try:
+            envelope = json.loads(data)
+            await self.handlers[envelope["kind"]](envelope["target"], envelope["message"])
+        except Exception as e:
+            fanout_errors.inc("deliver")
+            logger.warning(f"Fan-out delivery error: {str(e)}")
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        await self._deliver(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                fanout_errors.inc("subscribe")
+                logger.warning(f"Fan-out subscription lost: {str(e)}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+def create_fanout(redis_url: Optional[str], handlers: Dict[str, Handler]):
+    return RedisFanout(redis_url, handlers) if redis_url else InMemoryFanout(handlers)
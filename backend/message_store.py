@@ -0,0 +1,250 @@
+"""Group message storage: one document per message, or time buckets.
+
+``document`` mode keeps the original layout (one ``messages`` document per
+message). ``bucketed`` mode appends messages to one ``message_buckets``
+document per group per time window, capped at ``bucket_max`` messages, so a
+history read touches a handful of documents and index entries instead of one
+per message. Messages written before switching to buckets stay readable: the
+bucketed store tops up from ``messages`` when the buckets run out.
+
+With ``retention_days`` set, a background task moves messages older than the
+retention window out of the hot collections into ``message_archive``, either
+as plain documents or as zlib-compressed JSON blobs (``archive="compressed"``).
+Recent-history reads only ever touch the hot set.
+"""
+import asyncio
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODES = ("document", "bucketed")
+ARCHIVE_MODES = ("collection", "compressed")
+
+
+class MessageStoreSettings:
+    def __init__(
+        self,
+        mode: str = "document",
+        bucket_seconds: int = 86_400,
+        bucket_max: int = 500,
+        history_limit: int = 1000,
+        retention_days: float = 0,
+        archive: str = "collection",
+        retention_interval_seconds: float = 3600,
+        archive_batch: int = 1000,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown message storage mode: {mode}")
+        if archive not in ARCHIVE_MODES:
+            raise ValueError(f"Unknown message archive mode: {archive}")
+        self.mode = mode
+        self.bucket_seconds = bucket_seconds
+        self.bucket_max = bucket_max
+        self.history_limit = history_limit
+        self.retention_days = retention_days
+        self.archive = archive
+        self.retention_interval_seconds = retention_interval_seconds
+        self.archive_batch = archive_batch
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "MessageStoreSettings":
+        env = os.environ if env is None else env
+        return cls(
+            mode=env.get("MESSAGE_STORAGE", "document"),
+            bucket_seconds=int(env.get("MESSAGE_BUCKET_SECONDS", 86_400)),
+            bucket_max=int(env.get("MESSAGE_BUCKET_MAX", 500)),
+            history_limit=int(env.get("MESSAGE_HISTORY_LIMIT", 1000)),
+            retention_days=float(env.get("MESSAGE_RETENTION_DAYS", 0)),
+            archive=env.get("MESSAGE_ARCHIVE", "collection"),
+            retention_interval_seconds=float(env.get("MESSAGE_RETENTION_INTERVAL_SECONDS", 3600)),
+            archive_batch=int(env.get("MESSAGE_ARCHIVE_BATCH", 1000)),
+        )
+
+
+def window(created_at: str, bucket_seconds: int) -> Tuple[str, str]:
+    """The ``[start, end)`` window (ISO strings) a message timestamp falls in."""
+    ts = datetime.fromisoformat(created_at).timestamp()
+    start = int(ts // bucket_seconds * bucket_seconds)
+    return (
+        datetime.fromtimestamp(start, timezone.utc).isoformat(),
+        datetime.fromtimestamp(start + bucket_seconds, timezone.utc).isoformat(),
+    )
+
+
+def archive_document(group_id: str, messages: List[dict], settings: MessageStoreSettings, **fields) -> dict:
+    """Archive record for a run of messages from one group."""
+    doc = {
+        "group_id": group_id,
+        "first_id": messages[0]["id"],
+        "count": len(messages),
+        "first_seq": messages[0].get("seq"),
+        "last_seq": messages[-1].get("seq"),
+        "first_at": messages[0]["created_at"],
+        "last_at": messages[-1]["created_at"],
+        "archived_at": datetime.now(timezone.utc).isoformat(),
+        **fields,
+    }
+    if settings.archive == "compressed":
+        doc["codec"] = "zlib+json"
+        doc["data"] = zlib.compress(json.dumps(messages, separators=(",", ":")).encode(), 9)
+    else:
+        doc["messages"] = messages
+    return doc
+
+
+def archived_messages(doc: dict) -> List[dict]:
+    """Messages held by a ``message_archive`` document, whatever its format."""
+    if doc.get("codec") == "zlib+json":
+        return json.loads(zlib.decompress(doc["data"]))
+    return doc.get("messages", [])
+
+
+def _strip(message: dict) -> dict:
+    message.pop("_id", None)
+    return message
+
+
+async def _archive(db, doc: dict) -> None:
+    # Keyed on the first message, so a retry after a crash does not duplicate
+    key = {"group_id": doc.pop("group_id"), "first_id": doc.pop("first_id")}
+    await db.message_archive.update_one(key, {"$setOnInsert": doc}, upsert=True)
+
+
+class DocumentMessageStore:
+    """One ``messages`` document per message (the original layout)."""
+
+    def __init__(self, db, db_reads, settings: MessageStoreSettings):
+        self.db = db
+        self.db_reads = db_reads
+        self.settings = settings
+
+    async def append(self, doc: dict) -> None:
+        await self.db.messages.insert_one(doc)
+
+    async def recent(self, group_id: str, limit: Optional[int] = None) -> List[dict]:
+        """The newest ``limit`` messages of a group, oldest first."""
+        limit = limit or self.settings.history_limit
+        messages = await self.db_reads.messages.find(
+            {"group_id": group_id},
+            {"_id": 0}
+        ).sort("created_at", -1).to_list(limit)
+        messages.reverse()
+        return messages
+
+    async def after_seq(self, group_id: str, seq: int, limit: Optional[int] = None) -> List[dict]:
+        """Messages of a group with a sequence number above ``seq``, in order."""
+        limit = limit or self.settings.history_limit
+        return await self.db_reads.messages.find(
+            {"group_id": group_id, "seq": {"$gt": seq}},
+            {"_id": 0}
+        ).sort("seq", 1).to_list(limit)
+
+    async def archive_cold(self, now: Optional[datetime] = None) -> int:
+        """Move messages older than the retention window to the archive."""
+        cutoff = ((now or datetime.now(timezone.utc)) - timedelta(days=self.settings.retention_days)).isoformat()
+        archived = 0
+        while True:
+            cold = await self.db.messages.find(
+                {"created_at": {"$lt": cutoff}}
+            ).sort([("created_at", 1)]).to_list(self.settings.archive_batch)
+            if not cold:
+                return archived
+            # Delete by _id (messages has no index on id)
+            object_ids = [message["_id"] for message in cold]
+            runs: Dict[Tuple[str, str], List[dict]] = {}
+            for message in cold:
+                start, _ = window(message["created_at"], self.settings.bucket_seconds)
+                runs.setdefault((message["group_id"], start), []).append(_strip(message))
+            for (group_id, start), messages in runs.items():
+                await _archive(self.db, archive_document(group_id, messages, self.settings, start=start))
+            await self.db.messages.delete_many({"_id": {"$in": object_ids}})
+            archived += len(cold)
+
+
+class BucketedMessageStore(DocumentMessageStore):
+    """One ``message_buckets`` document per group per time window."""
+
+    async def append(self, doc: dict) -> None:
+        start, end = window(doc["created_at"], self.settings.bucket_seconds)
+        # A full bucket no longer matches, so the upsert opens a fresh one
+        # for the same window
+        await self.db.message_buckets.update_one(
+            {"group_id": doc["group_id"], "start": start, "count": {"$lt": self.settings.bucket_max}},
+            {
+                "$push": {"messages": doc},
+                "$inc": {"count": 1},
+                "$min": {"first_at": doc["created_at"]},
+                "$max": {"last_at": doc["created_at"], "last_seq": doc.get("seq") or 0},
+                "$setOnInsert": {"end": end},
+            },
+            upsert=True
+        )
+
+    async def recent(self, group_id: str, limit: Optional[int] = None) -> List[dict]:
+        limit = limit or self.settings.history_limit
+        messages: List[dict] = []
+        cursor = self.db_reads.message_buckets.find(
+            {"group_id": group_id},
+            {"_id": 0, "messages": 1}
+        ).sort([("last_at", -1)])
+        async for bucket in cursor:
+            messages.extend(bucket["messages"])
+            if len(messages) >= limit:
+                break
+        if len(messages) < limit:
+            # Messages stored before bucketing was switched on
+            messages.extend(await super().recent(group_id, limit - len(messages)))
+        messages.sort(key=lambda m: (m["created_at"], m.get("seq") or 0))
+        return messages[-limit:]
+
+    async def after_seq(self, group_id: str, seq: int, limit: Optional[int] = None) -> List[dict]:
+        limit = limit or self.settings.history_limit
+        messages = await super().after_seq(group_id, seq, limit)
+        cursor = self.db_reads.message_buckets.find(
+            {"group_id": group_id, "last_seq": {"$gt": seq}},
+            {"_id": 0, "messages": 1}
+        )
+        async for bucket in cursor:
+            messages.extend(m for m in bucket["messages"] if (m.get("seq") or 0) > seq)
+        messages.sort(key=lambda m: m.get("seq") or 0)
+        return messages[:limit]
+
+    async def archive_cold(self, now: Optional[datetime] = None) -> int:
+        archived = await super().archive_cold(now)
+        cutoff = ((now or datetime.now(timezone.utc)) - timedelta(days=self.settings.retention_days)).isoformat()
+        while True:
+            buckets = await self.db.message_buckets.find(
+                {"end": {"$lte": cutoff}}
+            ).to_list(max(1, self.settings.archive_batch // max(1, self.settings.bucket_max)))
+            if not buckets:
+                return archived
+            for bucket in buckets:
+                await _archive(self.db, archive_document(
+                    bucket["group_id"], bucket["messages"], self.settings,
+                    start=bucket["start"], end=bucket["end"],
+                ))
+                await self.db.message_buckets.delete_one({"_id": bucket["_id"]})
+                archived += bucket["count"]
+
+
+def create_message_store(db, db_reads, settings: MessageStoreSettings):
+    if settings.mode == "bucketed":
+        return BucketedMessageStore(db, db_reads, settings)
+    return DocumentMessageStore(db, db_reads, settings)
+
+
+async def run_retention(store, interval_seconds: float) -> None:
+    """Archive cold messages every ``interval_seconds`` until cancelled."""
+    while True:
+        try:
+            archived = await store.archive_cold()
+            if archived:
+                logger.info(f"Archived {archived} messages past retention")
+        except Exception as e:
+            logger.error(f"Message retention error: {str(e)}")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,215 @@
+"""Prometheus-compatible metrics for the YOUNIVITY API.
+
+A small in-process registry rendered in the Prometheus text format at
+``/metrics``. Recording is a dict lookup plus a few integer updates under a
+lock, cheap enough for every request, Mongo command and WebSocket broadcast.
+Mongo timings come from the pymongo listeners in ``mongo_monitoring``, which
+call back from driver threads, hence the locks.
+
+The registry is per process. Under ``serve.py`` with several workers a
+scrape of ``/metrics`` sees only the worker that accepted it; every series is
+labelled the same in each worker, so dashboards should aggregate with
+``sum``/``rate`` over scrapes and treat single values as a sample.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def _check(self, labels: Tuple) -> None:
+        for label in labels:
+            if not isinstance(label, str):
+                # Usually an amount passed positionally: inc(1, "hit")
+                raise TypeError(f"{self.name}: label values must be str, got {label!r}")
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._check(labels)
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        self._check(labels)
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        self._check(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self.values.items()]
+        lines = self.header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route and status.", ["method", "route", "status"]
+)
+http_latency = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ["method", "route"]
+)
+http_in_flight = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being served.")
+mongo_latency = REGISTRY.histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by command name.", ["command"]
+)
+mongo_failures = REGISTRY.counter(
+    "mongodb_command_failures_total", "MongoDB commands that failed.", ["command"]
+)
+canvas_latency = REGISTRY.histogram(
+    "canvas_request_duration_seconds", "Canvas API call latency.", ["endpoint", "status"]
+)
+websocket_connections = REGISTRY.gauge(
+    "websocket_connections", "Open chat WebSocket connections."
+)
+websocket_fanout = REGISTRY.histogram(
+    "websocket_broadcast_recipients", "Sockets addressed per chat broadcast.", buckets=SIZE_BUCKETS
+)
+
+
+class MetricsMiddleware:
+    """Count, time and track in-flight HTTP requests per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            # FastAPI puts the matched route in the scope, and middleware that
+            # answers before routing (the rate limiter) sets "route_path";
+            # other paths share one label so scanners cannot blow up the
+            # cardinality.
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or scope.get("route_path") or "unmatched"
+            method = scope["method"]
+            http_requests.inc(method, route_path, str(status_code))
+            http_latency.observe(elapsed, method, route_path)
+
+
+pool_checkout_wait = REGISTRY.histogram(
+    "mongodb_pool_checkout_wait_seconds", "Time spent waiting to check a connection out of the pool."
+)
+pool_checkout_failures = REGISTRY.counter(
+    "mongodb_pool_checkout_failures_total", "Connection checkouts that failed, by reason.", ["reason"]
+)
+pool_waiting = REGISTRY.gauge("mongodb_pool_waiting", "Operations currently waiting for a pooled connection.")
+pool_checked_out = REGISTRY.gauge("mongodb_pool_checked_out", "Connections currently checked out.", ["address"])
+pool_connections = REGISTRY.gauge("mongodb_pool_connections", "Open pooled connections.", ["address"])
@@ -0,0 +1,118 @@
+"""pymongo event listeners feeding ``metrics`` and ``profiling``.
+
+Kept apart from ``metrics`` so that importing the app does not import
+pymongo; the app lifespan imports this module when it opens the client.
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+from pymongo import monitoring
+
+from metrics import (
+    mongo_failures,
+    mongo_latency,
+    pool_checked_out,
+    pool_checkout_failures,
+    pool_checkout_wait,
+    pool_connections,
+    pool_waiting,
+)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Record the duration of every command the Motor client runs."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name)
+        mongo_failures.inc(event.command_name)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Record pool size, checkouts and checkout wait times.
+
+    A checkout starts and finishes on the same driver thread, so the start
+    time is keyed by thread.
+    """
+
+    def __init__(self):
+        self.checkout_started: Dict[tuple, float] = {}
+
+    def _address(self, event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pool_connections.inc(self._address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pool_connections.dec(self._address(event))
+
+    def connection_check_out_started(self, event):
+        self.checkout_started[(event.address, threading.get_ident())] = time.perf_counter()
+        pool_waiting.inc()
+
+    def connection_check_out_failed(self, event):
+        started = self.checkout_started.pop((event.address, threading.get_ident()), None)
+        if started is not None:
+            pool_waiting.dec()
+            pool_checkout_wait.observe(time.perf_counter() - started)
+        pool_checkout_failures.inc(str(event.reason))
+
+    def connection_checked_out(self, event):
+        started = self.checkout_started.pop((event.address, threading.get_ident()), None)
+        if started is not None:
+            pool_waiting.dec()
+            pool_checkout_wait.observe(time.perf_counter() - started)
+        pool_checked_out.inc(self._address(event))
+
+    def connection_checked_in(self, event):
+        pool_checked_out.dec(self._address(event))
+
+
+class SlowCommandListener(monitoring.CommandListener):
+    """Feed Mongo command timings to the profiler when it is enabled."""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.pending: Dict[tuple, dict] = {}
+
+    def started(self, event):
+        if self.profiler.settings.enabled:
+            self.pending[(event.connection_id, event.request_id)] = event.command
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+    def _finish(self, event, failed: bool):
+        command: Optional[dict] = self.pending.pop((event.connection_id, event.request_id), None)
+        if self.profiler.settings.enabled:
+            self.profiler.command_finished(event, command, failed=failed)
+
+
+def listeners(profiler) -> list:
+    return [MongoCommandMetrics(), MongoPoolMetrics(), SlowCommandListener(profiler)]
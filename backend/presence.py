@@ -0,0 +1,342 @@
+"""Online and typing indicators for group chats, never written to MongoDB.
+
+Presence is derived from the group WebSockets in ``ConnectionManager``: a
+student is online in a group while they hold an authenticated socket on it,
+and typing while their ``{"type": "typing", "typing": true}`` frames keep
+arriving. Both are kept as expiring entries (``ttl_seconds`` for online,
+``typing_ttl_seconds`` for typing), so a crashed worker or a client that
+never sends ``typing: false`` ages out on its own.
+
+Changes are not pushed one by one. Every ``broadcast_interval_ms`` the
+tracker looks at the groups that changed, compares each one's state with
+what it last sent and broadcasts one ``{"type": "presence", ...}`` frame per
+group when it differs. A burst of keystrokes from a whole group costs one
+frame per interval, and an unchanged state costs nothing.
+
+Entries live in process by default. With ``redis_url`` set they are kept in
+Redis sorted sets (score = expiry) and changes are announced on a pub/sub
+channel, so every worker sees the students connected to the others. Online
+entries are per worker, so closing a socket on one worker does not hide a
+student who is still connected to another.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+presence_broadcasts = metrics.REGISTRY.counter(
+    "presence_broadcasts_total", "Presence frames broadcast to group sockets."
+)
+presence_backend_errors = metrics.REGISTRY.counter(
+    "presence_backend_errors_total", "Presence backend calls that failed."
+)
+
+
+class PresenceSettings:
+    def __init__(
+        self,
+        enabled: bool = True,
+        ttl_seconds: float = 60,
+        typing_ttl_seconds: float = 6,
+        broadcast_interval_ms: float = 250,
+        redis_url: Optional[str] = None,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.typing_ttl_seconds = typing_ttl_seconds
+        self.broadcast_interval_ms = broadcast_interval_ms
+        self.redis_url = redis_url
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "PresenceSettings":
+        env = os.environ if env is None else env
+        return cls(
+            enabled=env.get("PRESENCE_ENABLED", "true").lower() == "true",
+            ttl_seconds=float(env.get("PRESENCE_TTL_SECONDS", 60)),
+            typing_ttl_seconds=float(env.get("PRESENCE_TYPING_TTL_SECONDS", 6)),
+            broadcast_interval_ms=float(env.get("PRESENCE_BROADCAST_INTERVAL_MS", 250)),
+            redis_url=env.get("PRESENCE_REDIS_URL") or None,
+        )
+
+
+class InMemoryPresenceBackend:
+    """Expiring set members per key, for a single worker."""
+
+    def __init__(self):
+        self.entries: Dict[str, Dict[str, float]] = {}
+
+    async def touch(self, key: str, member: str, expires_at: float) -> bool:
+        """Add or extend a member; True when it was not live before."""
+        members = self.entries.setdefault(key, {})
+        added = members.get(member, 0.0) <= time.time()
+        members[member] = expires_at
+        return added
+
+    async def touch_many(self, items: Iterable[Tuple[str, str]], expires_at: float) -> None:
+        for key, member in items:
+            await self.touch(key, member, expires_at)
+
+    async def remove(self, key: str, member: str) -> bool:
+        members = self.entries.get(key)
+        if not members or members.pop(member, None) is None:
+            return False
+        if not members:
+            del self.entries[key]
+        return True
+
+    async def live(self, key: str, now: float) -> List[str]:
+        members = self.entries.get(key)
+        if not members:
+            return []
+        for member in [m for m, expires_at in members.items() if expires_at <= now]:
+            del members[member]
+        if not members:
+            del self.entries[key]
+        return list(members)
+
+    async def publish(self, group_id: str) -> None:
+        pass  # one worker: the tracker already knows
+
+    async def listen(self, on_change: Callable[[str], None]) -> None:
+        await asyncio.Event().wait()
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisPresenceBackend:
+    """Presence shared by every worker through Redis sorted sets.
+
+    Needs the optional ``redis`` package. Like the rate limiter, a Redis
+    outage degrades the feature (stale or empty indicators) instead of
+    failing the socket.
+    """
+
+    def __init__(self, url: str, prefix: str = "presence:"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.prefix = prefix
+        self.channel = prefix + "changed"
+
+    async def touch(self, key: str, member: str, expires_at: float) -> bool:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zscore(self.prefix + key, member)
+            pipe.zadd(self.prefix + key, {member: expires_at})
+            pipe.expireat(self.prefix + key, int(expires_at) + 1)
+            previous, _, _ = await pipe.execute()
+        return previous is None or float(previous) <= time.time()
+
+    async def touch_many(self, items: Iterable[Tuple[str, str]], expires_at: float) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, member in items:
+                pipe.zadd(self.prefix + key, {member: expires_at})
+                pipe.expireat(self.prefix + key, int(expires_at) + 1)
+            await pipe.execute()
+
+    async def remove(self, key: str, member: str) -> bool:
+        return bool(await self.redis.zrem(self.prefix + key, member))
+
+    async def live(self, key: str, now: float) -> List[str]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.prefix + key, "-inf", now)
+            pipe.zrangebyscore(self.prefix + key, now, "+inf")
+            _, members = await pipe.execute()
+        return [m.decode() if isinstance(m, bytes) else m for m in members]
+
+    async def publish(self, group_id: str) -> None:
+        await self.redis.publish(self.channel, group_id)
+
+    async def listen(self, on_change: Callable[[str], None]) -> None:
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    data = message["data"]
+                    on_change(data.decode() if isinstance(data, bytes) else data)
+        finally:
+            await pubsub.aclose()
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+class PresenceTracker:
+    def __init__(
+        self,
+        broadcast: Callable[[dict, str], Awaitable],
+        settings: Optional[PresenceSettings] = None,
+        backend=None,
+    ):
+        self.broadcast = broadcast
+        self.settings = settings or PresenceSettings()
+        self.backend = backend or InMemoryPresenceBackend()
+        self.worker_id = uuid.uuid4().hex[:12]
+        # Sockets this worker holds, per group and user
+        self.local: Dict[str, Dict[str, int]] = {}
+        # Last time a user's typing entry was written, to throttle keystrokes
+        self.typing_touched: Dict[Tuple[str, str], float] = {}
+        self.dirty: Set[str] = set()
+        self.last_sent: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {}
+        self.tasks: List[asyncio.Task] = []
+
+    # Lifecycle
+
+    def start(self) -> None:
+        self.tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._listen())]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        for task in self.tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.backend.close()
+
+    # Socket events
+
+    async def join(self, group_id: str, user_id: str) -> None:
+        users = self.local.setdefault(group_id, {})
+        users[user_id] = users.get(user_id, 0) + 1
+        if users[user_id] == 1:
+            await self._call(self._touch(group_id, "online", self._member(user_id), self.settings.ttl_seconds))
+
+    async def leave(self, group_id: str, user_id: str) -> None:
+        users = self.local.get(group_id, {})
+        if user_id not in users:
+            return
+        users[user_id] -= 1
+        if users[user_id] > 0:
+            return
+        del users[user_id]
+        if not users:
+            del self.local[group_id]
+        self.typing_touched.pop((group_id, user_id), None)
+        await self._call(self._remove(group_id, "online", self._member(user_id)))
+        await self._call(self._remove(group_id, "typing", user_id))
+
+    async def typing(self, group_id: str, user_id: str, is_typing: bool) -> None:
+        if user_id not in self.local.get(group_id, {}):
+            return
+        if not is_typing:
+            if self.typing_touched.pop((group_id, user_id), None) is not None:
+                await self._call(self._remove(group_id, "typing", user_id))
+            return
+        # Keystrokes arrive many times a second; refresh the entry a few
+        # times per TTL at most
+        now = time.time()
+        if now - self.typing_touched.get((group_id, user_id), 0.0) < self.settings.typing_ttl_seconds / 3:
+            return
+        self.typing_touched[(group_id, user_id)] = now
+        await self._call(self._touch(group_id, "typing", user_id, self.settings.typing_ttl_seconds))
+
+    async def state(self, group_id: str, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        online = await self.backend.live(f"{group_id}:online", now)
+        typing = await self.backend.live(f"{group_id}:typing", now)
+        online_users = sorted({member.rsplit("|", 1)[0] for member in online})
+        return {
+            "type": "presence",
+            "group_id": group_id,
+            "online": online_users,
+            "typing": sorted(set(typing) & set(online_users)),
+        }
+
+    # Internals
+
+    def _member(self, user_id: str) -> str:
+        return f"{user_id}|{self.worker_id}"
+
+    async def _touch(self, group_id: str, kind: str, member: str, ttl: float) -> None:
+        if await self.backend.touch(f"{group_id}:{kind}", member, time.time() + ttl):
+            await self._changed(group_id)
+
+    async def _remove(self, group_id: str, kind: str, member: str) -> None:
+        if await self.backend.remove(f"{group_id}:{kind}", member):
+            await self._changed(group_id)
+
+    async def _changed(self, group_id: str) -> None:
+        self.dirty.add(group_id)
+        await self.backend.publish(group_id)
+
+    async def _call(self, operation) -> None:
+        try:
+            await operation
+        except Exception as e:
+            presence_backend_errors.inc()
+            logger.warning(f"Presence backend unavailable: {str(e)}")
+
+    def _on_remote_change(self, group_id: str) -> None:
+        if group_id in self.local:
+            self.dirty.add(group_id)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                await self.backend.listen(self._on_remote_change)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                presence_backend_errors.inc()
+                logger.warning(f"Presence subscription lost: {str(e)}")
+                await asyncio.sleep(5)
+
+    async def _run(self) -> None:
+        interval = self.settings.broadcast_interval_ms / 1000
+        next_refresh = 0.0
+        next_sweep = 0.0
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            try:
+                if now >= next_refresh:
+                    # Keep this worker's online entries alive in one batch
+                    await self.backend.touch_many(
+                        [
+                            (f"{group_id}:online", self._member(user_id))
+                            for group_id, users in self.local.items() for user_id in users
+                        ],
+                        now + self.settings.ttl_seconds,
+                    )
+                    next_refresh = now + self.settings.ttl_seconds / 3
+                if now >= next_sweep:
+                    # Expiries announce nothing, so look at every local group
+                    self.dirty.update(self.local)
+                    next_sweep = now + self.settings.typing_ttl_seconds / 2
+                await self.flush(now)
+            except Exception as e:
+                presence_backend_errors.inc()
+                logger.warning(f"Presence update error: {str(e)}")
+
+    async def flush(self, now: Optional[float] = None) -> int:
+        """Broadcast the state of every changed group whose state differs
+        from what was last sent; returns how many frames went out."""
+        dirty, self.dirty = self.dirty, set()
+        sent = 0
+        for group_id in dirty:
+            if group_id not in self.local:
+                self.last_sent.pop(group_id, None)
+                continue
+            state = await self.state(group_id, now)
+            snapshot = (tuple(state["online"]), tuple(state["typing"]))
+            if self.last_sent.get(group_id) == snapshot:
+                continue
+            self.last_sent[group_id] = snapshot
+            await self.broadcast(state, group_id)
+            presence_broadcasts.inc()
+            sent += 1
+        return sent
+
+
+def create_presence_tracker(broadcast, settings: PresenceSettings) -> PresenceTracker:
+    backend = RedisPresenceBackend(settings.redis_url) if settings.redis_url else InMemoryPresenceBackend()
+    return PresenceTracker(broadcast, settings, backend)
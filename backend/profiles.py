@@ -0,0 +1,107 @@
+"""Batched, cached lookups of public user profiles.
+
+Member lists and message authors need a few public fields of many users.
+``UserLoader`` is created per request: every ``load`` made while the request
+runs is collected and resolved on the next event-loop tick with a single
+``users.find({"id": {"$in": [...]}})``, and repeated ids are answered from a
+request-local memo. Misses are filled from, and written back to, a
+process-wide ``ProfileCache`` (LRU with a TTL), so a busy group's member list
+usually costs no query at all.
+
+Messages keep the ``user_name`` copied in at write time, but reads replace it
+with the current name from the loader, so a rename shows up everywhere
+without rewriting old messages. The worker that handles the rename drops the
+cache entry at once; other workers pick it up within ``ttl_seconds``. Misses
+are read from the primary: a lagging secondary could hand back the old name
+right after a rename and it would be cached for the whole TTL.
+"""
+import asyncio
+from typing import Dict, Iterable, Optional, Set
+
+import metrics
+
+PUBLIC_FIELDS = ("id", "full_name", "email")
+
+profile_lookups = metrics.REGISTRY.counter(
+    "profile_cache_lookups_total", "User profile lookups by outcome.", ("result",)
+)
+
+
+class ProfileCache:
+    def __init__(self, maxsize: int = 10_000, ttl_seconds: float = 300):
+        from cachetools import TTLCache
+
+        self.profiles = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+
+    def get(self, user_id: str) -> Optional[dict]:
+        return self.profiles.get(user_id)
+
+    def put(self, profile: dict) -> None:
+        self.profiles[profile["id"]] = profile
+
+    def invalidate(self, user_id: str) -> None:
+        self.profiles.pop(user_id, None)
+
+
+class UserLoader:
+    def __init__(self, db, cache: ProfileCache):
+        self.db = db
+        self.cache = cache
+        self.memo: Dict[str, Optional[dict]] = {}
+        self.pending: Dict[str, asyncio.Future] = {}
+        # The loop only keeps weak references to tasks; a batch in flight must
+        # not be collected or its waiters would hang
+        self.dispatches: Set[asyncio.Task] = set()
+
+    async def load(self, user_id: str) -> Optional[dict]:
+        """The public profile of a user, or None if there is no such user."""
+        if user_id in self.memo:
+            return self.memo[user_id]
+        profile = self.cache.get(user_id)
+        if profile is not None:
+            profile_lookups.inc("hit")
+            self.memo[user_id] = profile
+            return profile
+        future = self.pending.get(user_id)
+        if future is None:
+            if not self.pending:
+                # The task first runs after the lookups already scheduled in
+                # this tick, so they all join the batch
+                task = asyncio.create_task(self._dispatch())
+                self.dispatches.add(task)
+                task.add_done_callback(self.dispatches.discard)
+            future = self.pending[user_id] = asyncio.get_running_loop().create_future()
+        return await future
+
+    async def load_many(self, user_ids: Iterable[str]) -> Dict[str, dict]:
+        """Profiles by id for the users that exist."""
+        user_ids = list(dict.fromkeys(user_ids))
+        profiles = await asyncio.gather(*(self.load(user_id) for user_id in user_ids))
+        return {user_id: profile for user_id, profile in zip(user_ids, profiles) if profile is not None}
+
+    async def _dispatch(self) -> None:
+        batch, self.pending = self.pending, {}
+        profile_lookups.inc("miss", amount=len(batch))
+        try:
+            found = {
+                doc["id"]: doc for doc in await self.db.users.find(
+                    {"id": {"$in": list(batch)}},
+                    {"_id": 0, **{field: 1 for field in PUBLIC_FIELDS}}
+                ).to_list(None)
+            }
+        except BaseException as e:
+            for future in batch.values():
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                else:
+                    future.cancel()
+            if not isinstance(e, Exception):
+                raise
+            return
+        for user_id, future in batch.items():
+            profile = found.get(user_id)
+            if profile is not None:
+                self.cache.put(profile)
+            self.memo[user_id] = profile
+            future.set_result(profile)
+
@@ -0,0 +1,332 @@
+"""Opt-in profiling hooks for slow requests, slow Mongo commands and loop lag.
+
+Everything here is controlled by one ``ProfilingSettings`` object that can be
+changed while the server runs (see ``/api/debug/profiling``). With profiling
+disabled the hooks cost an attribute check per request and per Mongo command,
+and the loop monitor and watchdog thread sleep until profiling is turned on.
+
+When enabled:
+
+* a loop-lag monitor ticks on the event loop and a watchdog thread notices
+  when it stops ticking, dumping the loop thread's stack while it is blocked
+  (bcrypt, synchronous ``requests`` calls, heavy JSON encoding, ...);
+* requests still running after half the slow threshold are sampled: the
+  watchdog collects the loop thread's stack and, when the loop is free, the
+  stack the request's task is awaiting on. Requests that finish over the
+  threshold are kept with their collapsed stack samples;
+* Mongo commands slower than their threshold are logged with the command
+  name, collection and the *shape* of the filter (values replaced by types).
+"""
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Mapping, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+loop_lag = metrics.REGISTRY.histogram("event_loop_lag_seconds", "Delay of the event loop monitor tick.")
+
+SHAPE_FIELDS = ("filter", "query", "q", "pipeline", "updates", "deletes")
+
+
+class ProfilingSettings:
+    FIELDS = {
+        "enabled": bool,
+        "slow_request_ms": float,
+        "slow_mongo_ms": float,
+        "loop_lag_ms": float,
+        "sample_interval_ms": float,
+        "max_traces": int,
+    }
+
+    def __init__(self, **values):
+        self.enabled = False
+        self.slow_request_ms = 1000.0
+        self.slow_mongo_ms = 100.0
+        self.loop_lag_ms = 100.0
+        self.sample_interval_ms = 20.0
+        self.max_traces = 50
+        self.update(**values)
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "ProfilingSettings":
+        env = os.environ if env is None else env
+        return cls(
+            enabled=env.get("PROFILING_ENABLED", "false").lower() == "true",
+            slow_request_ms=env.get("PROFILING_SLOW_REQUEST_MS", 1000),
+            slow_mongo_ms=env.get("PROFILING_SLOW_MONGO_MS", 100),
+            loop_lag_ms=env.get("PROFILING_LOOP_LAG_MS", 100),
+            sample_interval_ms=env.get("PROFILING_SAMPLE_INTERVAL_MS", 20),
+            max_traces=env.get("PROFILING_MAX_TRACES", 50),
+        )
+
+    def update(self, **values) -> None:
+        for key, value in values.items():
+            if key not in self.FIELDS:
+                raise ValueError(f"Unknown profiling setting: {key}")
+            cast = self.FIELDS[key]
+            if cast is bool and isinstance(value, str):
+                value = value.lower() == "true"
+            setattr(self, key, cast(value))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+
+def collapse_frames(frames) -> str:
+    """Collapse frames (outermost first) into one flamegraph-style line."""
+    return ";".join(f"{os.path.basename(f.f_code.co_filename)}:{f.f_code.co_name}:{f.f_lineno}" for f in frames)
+
+
+def thread_stack(thread_id: int, limit: int = 40) -> Optional[str]:
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return None
+    frames = []
+    while frame is not None and len(frames) < limit:
+        frames.append(frame)
+        frame = frame.f_back
+    return collapse_frames(reversed(frames))
+
+
+def filter_shape(value: Any, depth: int = 0) -> Any:
+    """Replace literal values in a query document with their type names."""
+    if depth > 6:
+        return "..."
+    if isinstance(value, dict):
+        return {k: filter_shape(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(not isinstance(v, (dict, list)) for v in value):
+            return f"[{len(value)} x {type(value[0]).__name__}]"
+        return [filter_shape(v, depth + 1) for v in value[:5]]
+    return type(value).__name__
+
+
+class _InFlight:
+    __slots__ = ("id", "method", "path", "start", "task", "loop_samples", "await_samples")
+
+    def __init__(self, request_id, method, path, task):
+        self.id = request_id
+        self.method = method
+        self.path = path
+        self.start = time.perf_counter()
+        self.task = task
+        self.loop_samples: Counter = Counter()
+        self.await_samples: Counter = Counter()
+
+
+class Profiler:
+    def __init__(self, settings: Optional[ProfilingSettings] = None):
+        self.settings = settings or ProfilingSettings()
+        self.in_flight: Dict[int, _InFlight] = {}
+        self.slow_requests = deque(maxlen=self.settings.max_traces)
+        self.slow_commands = deque(maxlen=self.settings.max_traces)
+        self.loop_stalls = deque(maxlen=self.settings.max_traces)
+        self.ids = itertools.count(1)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self.last_tick = time.perf_counter()
+        self.tick_interval = 1.0
+        self.monitor_task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        # Set while profiling is enabled; the watchdog and monitor park on it
+        self.active = threading.Event()
+        self.active_async: Optional[asyncio.Event] = None
+
+    # Lifecycle
+
+    def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.stopping.clear()
+        self.active_async = asyncio.Event()
+        self._sync_active()
+        self.monitor_task = asyncio.create_task(self._monitor())
+        self.watchdog = threading.Thread(target=self._watch, name="profiling-watchdog", daemon=True)
+        self.watchdog.start()
+
+    async def stop(self) -> None:
+        self.stopping.set()
+        self.active.set()  # unpark the watchdog so it sees stopping
+        if self.monitor_task is not None:
+            self.monitor_task.cancel()
+            try:
+                await self.monitor_task
+            except asyncio.CancelledError:
+                pass
+
+    def apply(self, **changes) -> None:
+        self.settings.update(**changes)
+        self._sync_active()
+        for name in ("slow_requests", "slow_commands", "loop_stalls"):
+            old = getattr(self, name)
+            if old.maxlen != self.settings.max_traces:
+                setattr(self, name, deque(old, maxlen=self.settings.max_traces))
+
+    def _sync_active(self) -> None:
+        if self.settings.enabled:
+            self.active.set()
+            if self.active_async is not None:
+                self.active_async.set()
+        else:
+            self.active.clear()
+            if self.active_async is not None:
+                self.active_async.clear()
+
+    def clear(self) -> None:
+        self.slow_requests.clear()
+        self.slow_commands.clear()
+        self.loop_stalls.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "settings": self.settings.as_dict(),
+            "in_flight": len(self.in_flight),
+            "slow_requests": list(self.slow_requests),
+            "slow_mongo_commands": list(self.slow_commands),
+            "loop_stalls": list(self.loop_stalls),
+        }
+
+    # Event loop lag
+
+    async def _monitor(self) -> None:
+        while True:
+            if not self.settings.enabled:
+                await self.active_async.wait()
+            interval = self.settings.sample_interval_ms / 1000
+            self.tick_interval = interval
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            self.last_tick = now
+            if self.settings.enabled:
+                lag = max(0.0, now - started - interval)
+                loop_lag.observe(lag)
+                if lag * 1000 >= self.settings.loop_lag_ms:
+                    logger.warning(f"Event loop lagged {lag * 1000:.0f} ms")
+
+    def _watch(self) -> None:
+        stall_stack: Counter = Counter()
+        stall_started = None
+        while not self.stopping.wait(self.settings.sample_interval_ms / 1000):
+            if not self.settings.enabled:
+                self.active.wait()
+                self.last_tick = time.perf_counter()  # the monitor was parked too
+                stall_stack, stall_started = Counter(), None
+                continue
+            now = time.perf_counter()
+            blocked_for = now - self.last_tick - self.tick_interval
+            loop_stack = thread_stack(self.loop_thread_id)
+            if loop_stack and loop_stack.rsplit(";", 1)[-1].startswith("selectors.py:select:"):
+                loop_stack = None  # idle, waiting for I/O
+
+            if loop_stack and blocked_for * 1000 >= self.settings.loop_lag_ms:
+                stall_started = stall_started or self.last_tick
+                stall_stack[loop_stack] += 1
+            elif stall_started is not None:
+                self.loop_stalls.append({
+                    "at": datetime.now(timezone.utc).isoformat(),
+                    "blocked_ms": round((now - stall_started) * 1000, 1),
+                    "stacks": stall_stack.most_common(5),
+                })
+                stall_stack = Counter()
+                stall_started = None
+
+            sample_after = self.settings.slow_request_ms / 2000
+            candidates = [r for r in list(self.in_flight.values()) if now - r.start >= sample_after]
+            if not candidates:
+                continue
+            for request in candidates:
+                if loop_stack:
+                    request.loop_samples[loop_stack] += 1
+            try:
+                self.loop.call_soon_threadsafe(self._sample_awaits, candidates)
+            except RuntimeError:
+                return
+
+    def _sample_awaits(self, candidates) -> None:
+        for request in candidates:
+            if request.task is None or request.task.done():
+                continue
+            frames = request.task.get_stack(limit=40)
+            if frames:
+                request.await_samples[collapse_frames(frames)] += 1
+
+    # Requests
+
+    def request_started(self, method: str, path: str) -> Optional[_InFlight]:
+        if not self.settings.enabled:
+            return None
+        request = _InFlight(next(self.ids), method, path, asyncio.current_task())
+        self.in_flight[request.id] = request
+        return request
+
+    def request_finished(self, request: _InFlight, status_code: int) -> None:
+        self.in_flight.pop(request.id, None)
+        elapsed_ms = (time.perf_counter() - request.start) * 1000
+        if elapsed_ms < self.settings.slow_request_ms:
+            return
+        logger.warning(f"Slow request {request.method} {request.path} took {elapsed_ms:.0f} ms")
+        self.slow_requests.append({
+            "method": request.method,
+            "path": request.path,
+            "status": status_code,
+            "duration_ms": round(elapsed_ms, 1),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "loop_samples": request.loop_samples.most_common(10),
+            "await_samples": request.await_samples.most_common(10),
+        })
+
+    # Mongo
+
+    def command_finished(self, event, command: Optional[dict], failed: bool = False) -> None:
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.settings.slow_mongo_ms:
+            return
+        entry = {
+            "command": event.command_name,
+            "duration_ms": round(duration_ms, 1),
+            "at": datetime.now(timezone.utc).isoformat(),
+            "failed": failed,
+        }
+        if command is not None:
+            entry["collection"] = command.get(event.command_name)
+            entry["shape"] = {k: filter_shape(command[k]) for k in SHAPE_FIELDS if k in command}
+            if "sort" in command:
+                entry["shape"]["sort"] = command["sort"]
+        logger.warning(f"Slow Mongo {event.command_name} took {duration_ms:.0f} ms: {entry.get('shape')}")
+        self.slow_commands.append(entry)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.settings.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        request = self.profiler.request_started(scope["method"], scope["path"])
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.profiler.request_finished(request, status_code)
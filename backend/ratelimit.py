@@ -0,0 +1,216 @@
+"""Token-bucket rate limiting for expensive API routes.
+
+Login and register burn bcrypt time, ``/lms/sync`` crawls Canvas and message
+posts fan out over WebSockets, so each of those routes gets its own bucket
+keyed by client IP or authenticated user. Buckets live in process by default;
+``RedisRateLimitBackend`` shares them between workers. A rejected request is
+answered straight from the middleware: one bucket lookup, no database or
+password hashing.
+"""
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(spec: str) -> Tuple[float, int]:
+    """Turn ``"10/minute"`` into ``(tokens_per_second, burst)``."""
+    count, _, period = spec.partition("/")
+    burst = int(count)
+    seconds = PERIODS.get(period.strip().rstrip("s"), None)
+    if seconds is None:
+        seconds = float(period)
+    return burst / seconds, burst
+
+
+class RateLimitResult:
+    __slots__ = ("allowed", "remaining", "retry_after")
+
+    def __init__(self, allowed: bool, remaining: int, retry_after: float):
+        self.allowed = allowed
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+
+class InMemoryRateLimitBackend:
+    """Per-process token buckets in an LRU-bounded dict."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: int, now: Optional[float] = None) -> RateLimitResult:
+        now = time.monotonic() if now is None else now
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = [float(burst), now]
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return RateLimitResult(True, int(bucket[0]), 0.0)
+        return RateLimitResult(False, 0, (1.0 - bucket[0]) / rate)
+
+    async def hit(self, key: str, rate: float, burst: int) -> RateLimitResult:
+        return self.take(key, rate, burst)
+
+
+TOKEN_BUCKET_LUA = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimitBackend:
+    """Token buckets shared by every worker through one Redis round trip.
+
+    Needs the optional ``redis`` package. If Redis is unreachable the
+    request is let through and a warning is logged, so a cache outage never
+    locks users out.
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.prefix = prefix
+        self.script = self.redis.register_script(TOKEN_BUCKET_LUA)
+
+    async def hit(self, key: str, rate: float, burst: int) -> RateLimitResult:
+        try:
+            allowed, tokens = await self.script(
+                keys=[self.prefix + key], args=[rate, burst, time.time()]
+            )
+        except Exception as e:
+            logger.warning(f"Rate limit backend unavailable: {str(e)}")
+            return RateLimitResult(True, burst, 0.0)
+        tokens = float(tokens)
+        if allowed:
+            return RateLimitResult(True, int(tokens), 0.0)
+        return RateLimitResult(False, 0, (1.0 - tokens) / rate)
+
+
+class RateLimitRule:
+    """A bucket applied to one method and path template.
+
+    ``key`` is ``"ip"`` or ``"user"``; user-keyed rules fall back to the
+    client IP when the request carries no valid bearer token.
+    """
+
+    def __init__(self, method: str, path: str, limit: str, key: str = "ip"):
+        self.method = method.upper()
+        self.path = path
+        self.pattern = re.compile("^" + re.sub(r"\{[^/]+\}", "[^/]+", path) + "$")
+        self.rate, self.burst = parse_rate(limit)
+        self.key = key
+
+    def matches(self, method: str, path: str) -> bool:
+        return method == self.method and self.pattern.match(path) is not None
+
+
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app,
+        rules: List[RateLimitRule],
+        backend=None,
+        user_key: Optional[Callable[[str], Optional[str]]] = None,
+        trust_forwarded: bool = False,
+    ):
+        self.app = app
+        self.rules = rules
+        self.backend = backend or InMemoryRateLimitBackend()
+        self.user_key = user_key
+        self.trust_forwarded = trust_forwarded
+        self.warned_forwarded = False
+
+    def client_ip(self, scope, headers: Headers) -> str:
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded and self.trust_forwarded:
+            # Our proxy appends the address it saw; earlier entries come from
+            # the client and can be forged
+            return forwarded.rsplit(",", 1)[-1].strip()
+        if forwarded and not self.warned_forwarded:
+            self.warned_forwarded = True
+            logger.warning(
+                "X-Forwarded-For is set but RATE_LIMIT_TRUST_FORWARDED is off: "
+                "all clients behind the proxy share one rate-limit bucket"
+            )
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def identity(self, rule: RateLimitRule, scope, headers: Headers) -> str:
+        if rule.key == "user" and self.user_key is not None:
+            authorization = headers.get("authorization", "")
+            if authorization.lower().startswith("bearer "):
+                user_id = self.user_key(authorization[7:])
+                if user_id:
+                    return "user:" + user_id
+        return "ip:" + self.client_ip(scope, headers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        rule = next((r for r in self.rules if r.matches(method, path)), None)
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        key = f"{rule.method} {rule.path}|{self.identity(rule, scope, headers)}"
+        result = await self.backend.hit(key, rule.rate, rule.burst)
+
+        if not result.allowed:
+            # Routing never runs, so name the route for MetricsMiddleware
+            scope["route_path"] = rule.path
+            retry_after = max(1, int(result.retry_after + 0.999))
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=429,
+                headers={
+                    "Retry-After": str(retry_after),
+                    "X-RateLimit-Limit": str(rule.burst),
+                    "X-RateLimit-Remaining": "0",
+                },
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                response_headers["X-RateLimit-Limit"] = str(rule.burst)
+                response_headers["X-RateLimit-Remaining"] = str(result.remaining)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,375 @@
+"""Deadline reminders from an in-memory timer heap.
+
+Upcoming reminders live in a binary heap of ``(fire_at, ...)`` entries. One
+task sleeps until the earliest entry and wakes up early when an earlier one
+is pushed. Assignment writes (create, complete/uncomplete, delete, LMS sync)
+update the heap directly. A superseded entry is not removed from the heap: the
+assignment's version number moves on and the stale entry is skipped when it
+comes up ("lazy cancellation"), with a rebuild when stale entries pile up.
+
+Mongo is only read in bulk: once at startup and then every
+``refresh_minutes`` for assignments coming due within ``horizon_hours``
+(one range query on the ``due_date`` index). That keeps the heap bounded to
+the horizon while still picking up far-off deadlines as they approach.
+
+The engine records how far it has fired in ``reminder_state``. On startup it
+also schedules reminders that came due since then (while no engine was
+running, e.g. during a restart or a worker recycle), looking back at most
+``horizon_hours``; they fire at once. When several offsets of one assignment
+were missed, only the one closest to the deadline is sent.
+
+Before firing, a batch of due reminders is checked against ``assignments``
+in one query, so a reminder never goes out for an assignment that was
+completed or deleted without the heap hearing about it.
+
+A fired reminder is pushed to every WebSocket the student has open. If
+none is open, it is written to ``pending_reminders`` and delivered when they
+next connect (or fetched with ``GET /api/reminders``). Clients can de-duplicate
+on ``(assignment_id, minutes_before)``.
+
+Run one engine per deployment. With several workers (see ``serve.py``) the
+engine runs on worker 0; the other workers forward schedule/cancel updates to
+it and reminders go out through the cross-worker fan-out (``fanout.py``). In
+that mode every reminder is queued first and the worker that delivers it
+removes the queued copy (``acknowledge``), since the engine cannot see the
+other workers' sockets.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+import metrics
+from canvas_catalog import hydrate
+
+logger = logging.getLogger(__name__)
+
+reminders_scheduled = metrics.REGISTRY.gauge("reminders_scheduled", "Assignments with reminders in the timer heap.")
+reminders_fired = metrics.REGISTRY.counter("reminders_fired_total", "Reminders fired, by delivery.", ("delivery",))
+
+
+class ReminderSettings:
+    def __init__(
+        self,
+        enabled: bool = True,
+        offsets_minutes: Optional[List[int]] = None,
+        horizon_hours: float = 6,
+        refresh_minutes: float = 60,
+        pending_ttl_days: float = 14,
+        fire_batch: int = 500,
+    ):
+        self.enabled = enabled
+        self.offsets_minutes = sorted(offsets_minutes if offsets_minutes is not None else [1440, 60], reverse=True)
+        self.horizon_hours = horizon_hours
+        self.refresh_minutes = refresh_minutes
+        self.pending_ttl_days = pending_ttl_days
+        self.fire_batch = fire_batch
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "ReminderSettings":
+        env = os.environ if env is None else env
+        offsets = env.get("REMINDER_OFFSETS_MINUTES", "1440,60")
+        return cls(
+            enabled=env.get("REMINDERS_ENABLED", "true").lower() == "true",
+            offsets_minutes=[int(o) for o in offsets.split(",") if o.strip()],
+            horizon_hours=float(env.get("REMINDER_HORIZON_HOURS", 6)),
+            refresh_minutes=float(env.get("REMINDER_REFRESH_MINUTES", 60)),
+            pending_ttl_days=float(env.get("REMINDER_PENDING_TTL_DAYS", 14)),
+        )
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class _Scheduled:
+    __slots__ = ("version", "due", "user_id", "title", "course_name", "offsets")
+
+    def __init__(self, version: int, due: float, user_id: str, title: str, course_name: str):
+        self.version = version
+        self.due = due
+        self.user_id = user_id
+        self.title = title
+        self.course_name = course_name
+        self.offsets = set()  # minutes_before values pushed (or already fired)
+
+
+class ReminderEngine:
+    def __init__(
+        self,
+        db,
+        deliver: Callable[[str, dict], Awaitable[int]],
+        settings: Optional[ReminderSettings] = None,
+        shared_delivery: bool = False,
+    ):
+        self.db = db
+        self.deliver = deliver
+        self.settings = settings or ReminderSettings()
+        # deliver() publishes to every worker and cannot count recipients
+        self.shared_delivery = shared_delivery
+        # (fire_at, tiebreak, assignment_id, version, minutes_before)
+        self.heap: List[Tuple[float, int, str, int, int]] = []
+        self.scheduled: Dict[str, _Scheduled] = {}
+        self.versions = itertools.count(1)
+        self.tiebreak = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    # Lifecycle
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    # Scheduling
+
+    def schedule(self, assignment: dict, now: Optional[float] = None, since: Optional[float] = None) -> None:
+        """(Re)schedule reminders for an assignment document; idempotent.
+
+        Reminders that came due between ``since`` and ``now`` are scheduled
+        to fire at once (only the last one missed).
+        """
+        if assignment.get("completed"):
+            self.cancel(assignment["id"])
+            return
+        now = time.time() if now is None else now
+        since = now if since is None else min(since, now)
+        due = _timestamp(assignment["due_date"])
+        horizon = now + self.settings.horizon_hours * 3600
+        fire_times = [
+            (due - minutes * 60, minutes) for minutes in self.settings.offsets_minutes
+            if since <= due - minutes * 60 < horizon and due > now
+        ]
+        # Offsets are in decreasing order, so the missed reminders come first
+        missed = [minutes for fire_at, minutes in fire_times if fire_at < now]
+        skipped = set(missed[:-1])
+        entry = self.scheduled.get(assignment["id"])
+        if entry is None or entry.due != due:
+            if not fire_times:
+                self.cancel(assignment["id"])
+                return
+            entry = _Scheduled(
+                next(self.versions), due, assignment["user_id"],
+                assignment.get("title", ""), assignment.get("course_name", "")
+            )
+            self.scheduled[assignment["id"]] = entry
+        for fire_at, minutes in fire_times:
+            if minutes in entry.offsets:
+                continue
+            entry.offsets.add(minutes)
+            if minutes in skipped:
+                continue
+            if not self.heap or fire_at < self.heap[0][0]:
+                self.wakeup.set()
+            heapq.heappush(self.heap, (fire_at, next(self.tiebreak), assignment["id"], entry.version, minutes))
+        reminders_scheduled.set(len(self.scheduled))
+        self._compact()
+
+    def cancel(self, assignment_id: str) -> None:
+        if self.scheduled.pop(assignment_id, None) is not None:
+            reminders_scheduled.set(len(self.scheduled))
+            self._compact()
+
+    def _compact(self) -> None:
+        live = len(self.scheduled) * len(self.settings.offsets_minutes)
+        if len(self.heap) > 2 * live + 1024:
+            self.heap = [
+                entry for entry in self.heap
+                if entry[2] in self.scheduled and self.scheduled[entry[2]].version == entry[3]
+            ]
+            heapq.heapify(self.heap)
+
+    async def load(self, now: Optional[float] = None, since: Optional[float] = None) -> int:
+        """Schedule every open assignment whose reminders fall in the horizon,
+        plus those that came due after ``since`` (at most ``horizon_hours`` ago)."""
+        now = time.time() if now is None else now
+        if since is not None:
+            since = max(since, now - self.settings.horizon_hours * 3600)
+        latest = now + self.settings.horizon_hours * 3600 + max(self.settings.offsets_minutes, default=0) * 60
+        # due_date is an ISO string; pad the range for non-UTC offsets and
+        # let schedule() apply the exact bounds
+        low = datetime.fromtimestamp(now - 86400, timezone.utc).isoformat()
+        high = datetime.fromtimestamp(latest + 86400, timezone.utc).isoformat()
+        count = 0
+        cursor = self.db.assignments.find(
+            {"due_date": {"$gte": low, "$lt": high}, "completed": {"$ne": True}},
+            {
+                "_id": 0, "id": 1, "user_id": 1, "title": 1, "course_name": 1, "due_date": 1,
+                "course_key": 1, "canvas_id": 1,
+            }
+        )
+        batch = []
+        async for assignment in cursor:
+            batch.append(assignment)
+            if len(batch) == 5000:
+                count += await self._schedule_batch(batch, now, since)
+                batch = []
+                await asyncio.sleep(0)
+        return count + await self._schedule_batch(batch, now, since)
+
+    async def _schedule_batch(self, assignments: List[dict], now: float, since: Optional[float]) -> int:
+        # Canvas overlays get their title and course name from the catalogue
+        for assignment in await hydrate(self.db, assignments):
+            self.schedule(assignment, now, since)
+        return len(assignments)
+
+    async def fired_through(self) -> Optional[float]:
+        """When the last engine last fired, or None if none ever did."""
+        state = await self.db.reminder_state.find_one({"id": "engine"}, {"_id": 0, "fired_through": 1})
+        return state["fired_through"] if state else None
+
+    # Firing
+
+    async def _run(self) -> None:
+        next_refresh = 0.0
+        caught_up = False
+        while True:
+            now = time.time()
+            if now >= next_refresh:
+                try:
+                    # The first load also picks up what came due while no engine ran
+                    since = None if caught_up else await self.fired_through()
+                    loaded = await self.load(since=since)
+                    caught_up = True
+                    logger.info(f"Reminder heap refreshed: {loaded} upcoming assignments, {len(self.heap)} entries")
+                except Exception as e:
+                    logger.error(f"Reminder refresh error: {str(e)}")
+                next_refresh = now + self.settings.refresh_minutes * 60
+            try:
+                await self.fire_due()
+            except Exception as e:
+                logger.error(f"Reminder delivery error: {str(e)}")
+
+            timeout = next_refresh - time.time()
+            if self.heap:
+                timeout = min(timeout, self.heap[0][0] - time.time())
+            self.wakeup.clear()
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def fire_due(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        fired = 0
+        if not self.heap or self.heap[0][0] > now:
+            return 0
+        while self.heap and self.heap[0][0] <= now:
+            due = []
+            while self.heap and self.heap[0][0] <= now and len(due) < self.settings.fire_batch:
+                fire_at, _, assignment_id, version, minutes = heapq.heappop(self.heap)
+                entry = self.scheduled.get(assignment_id)
+                if entry is None or entry.version != version:
+                    continue  # cancelled or rescheduled
+                if minutes == self.settings.offsets_minutes[-1]:
+                    del self.scheduled[assignment_id]  # that was the last one
+                due.append((assignment_id, entry, minutes))
+            fired += await self._fire(due)
+            await asyncio.sleep(0)
+        reminders_scheduled.set(len(self.scheduled))
+        # Everything due up to now is handled; a restarted engine catches up from here
+        await self.db.reminder_state.update_one(
+            {"id": "engine"}, {"$max": {"fired_through": now}}, upsert=True
+        )
+        return fired
+
+    async def _fire(self, due: List[Tuple[str, _Scheduled, int]]) -> int:
+        if not due:
+            return 0
+        # A completion or delete can miss the heap (an update lost between
+        # workers, a write made outside the API); check before sending
+        still_open = {
+            doc["id"] for doc in await self.db.assignments.find(
+                {"id": {"$in": list({assignment_id for assignment_id, _, _ in due})}, "completed": {"$ne": True}},
+                {"_id": 0, "id": 1}
+            ).to_list(None)
+        }
+        reminders = []
+        for assignment_id, entry, minutes in due:
+            if assignment_id not in still_open:
+                if self.scheduled.get(assignment_id) is entry:
+                    del self.scheduled[assignment_id]
+                continue
+            reminders.append((entry.user_id, {
+                "type": "reminder",
+                "assignment_id": assignment_id,
+                "title": entry.title,
+                "course_name": entry.course_name,
+                "due_date": datetime.fromtimestamp(entry.due, timezone.utc).isoformat(),
+                "minutes_before": minutes,
+                "sent_at": datetime.now(timezone.utc).isoformat(),
+            }))
+
+        if self.shared_delivery:
+            # Other workers cannot report back whether the user was online:
+            # queue everything, and the worker that delivers it acknowledges
+            await self._queue([self._pending(user_id, reminder) for user_id, reminder in reminders])
+            for user_id, reminder in reminders:
+                await self.deliver(user_id, reminder)
+                reminders_fired.inc("published")
+            return len(reminders)
+
+        offline = []
+        for user_id, reminder in reminders:
+            if await self.deliver(user_id, reminder):
+                reminders_fired.inc("websocket")
+            else:
+                reminders_fired.inc("queued")
+                offline.append(self._pending(user_id, reminder))
+        await self._queue(offline)
+        return len(reminders)
+
+    def _pending(self, user_id: str, reminder: dict) -> dict:
+        # A real Date, so the TTL index can expire undelivered reminders
+        expires_at = datetime.now(timezone.utc) + timedelta(days=self.settings.pending_ttl_days)
+        return {**reminder, "user_id": user_id, "expires_at": expires_at}
+
+    async def _queue(self, reminders: List[dict]) -> None:
+        if reminders:
+            await self.db.pending_reminders.insert_many(reminders, ordered=False)
+
+
+# Offline delivery (any worker, with or without an engine)
+
+async def take_pending(db, user_id: str) -> List[dict]:
+    """Remove and return the user's queued reminders, oldest first."""
+    pending = await db.pending_reminders.find(
+        {"user_id": user_id},
+        {"user_id": 0, "expires_at": 0}
+    ).sort("sent_at", 1).to_list(1000)
+    if pending:
+        await db.pending_reminders.delete_many({"_id": {"$in": [p.pop("_id") for p in pending]}})
+    return pending
+
+
+async def flush(db, user_id: str, send: Callable[[str, dict], Awaitable[int]]) -> int:
+    """Deliver queued reminders to a user who just connected."""
+    pending = await take_pending(db, user_id)
+    for reminder in pending:
+        await send(user_id, reminder)
+    return len(pending)
+
+
+async def acknowledge(db, user_id: str, reminder: dict) -> None:
+    """A published reminder reached a socket; drop its queued copy."""
+    await db.pending_reminders.delete_one({
+        "user_id": user_id,
+        "assignment_id": reminder["assignment_id"],
+        "minutes_before": reminder["minutes_before"],
+    })
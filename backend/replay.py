@@ -0,0 +1,80 @@
+"""Catch-up for group sockets that reconnect after a short drop.
+
+Every message broadcast to a group is also kept in a small per-group ring
+buffer (the last ``size`` messages, for at most ``max_groups`` groups, least
+recently active evicted first). A member who reconnects with
+``?token=<jwt>&last_seen_seq=N`` is sent the messages after ``N`` as ordinary
+message frames, followed by ``{"type": "replayed", "seq", "source",
+"truncated"}``:
+
+- ``source: "memory"`` when the buffer holds every missed message,
+- ``source: "database"`` when it does not (the worker restarted, the gap is
+  longer than the buffer, or the messages were posted through another
+  worker); one range query on ``(group_id, seq)`` fills the gap,
+- ``truncated: true`` when more than ``MESSAGE_HISTORY_LIMIT`` messages were
+  missed; nothing is replayed and the client should reload the history.
+
+The socket is registered before the replay, so a message posted meanwhile
+can arrive twice; clients de-duplicate on ``seq``. A seq whose message failed
+to store is recorded with ``skip`` so the gap it leaves does not force every
+later catch-up to the database.
+"""
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional
+
+import metrics
+
+replays = metrics.REGISTRY.counter(
+    "websocket_replays_total", "Reconnect catch-ups by where the missed messages came from.", ("source",)
+)
+
+
+class ReplayBuffer:
+    def __init__(self, size: int = 100, max_groups: int = 10_000):
+        self.size = size
+        self.max_groups = max_groups
+        self.groups: "OrderedDict[str, Deque[dict]]" = OrderedDict()
+
+    def append(self, group_id: str, message: dict) -> None:
+        if self.size <= 0:
+            return
+        buffer = self.groups.get(group_id)
+        if buffer is None:
+            buffer = self.groups[group_id] = deque(maxlen=self.size)
+            if len(self.groups) > self.max_groups:
+                self.groups.popitem(last=False)
+        else:
+            self.groups.move_to_end(group_id)
+        buffer.append(message)
+
+    def skip(self, group_id: str, seq: int) -> None:
+        """Record that ``seq`` was allocated but no message was stored."""
+        self.append(group_id, {"seq": seq, "type": "skipped"})
+
+    def after(self, group_id: str, seq: int, latest: int) -> Optional[List[dict]]:
+        """Messages with ``seq < s <= latest`` in order, or None unless the
+        buffer holds all of them."""
+        if latest <= seq:
+            return []
+        by_seq = {m.get("seq"): m for m in self.groups.get(group_id, ())}
+        missed = [by_seq.get(s) for s in range(seq + 1, latest + 1)]
+        if any(message is None for message in missed):
+            return None
+        return [message for message in missed if message.get("type") != "skipped"]
+
+
+async def replay_missed(websocket, buffer: ReplayBuffer, store, group_id: str, last_seen_seq: int, latest: int) -> None:
+    """Send a reconnecting socket what it missed since ``last_seen_seq``."""
+    if latest - last_seen_seq > store.settings.history_limit:
+        replays.inc("truncated")
+        await websocket.send_json({"type": "replayed", "seq": latest, "source": None, "truncated": True})
+        return
+    missed = buffer.after(group_id, last_seen_seq, latest)
+    source = "memory"
+    if missed is None:
+        source = "database"
+        missed = await store.after_seq(group_id, last_seen_seq)
+    replays.inc(source)
+    for message in missed:
+        await websocket.send_json(message)
+    await websocket.send_json({"type": "replayed", "seq": latest, "source": source, "truncated": False})
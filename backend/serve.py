@@ -0,0 +1,453 @@
+"""Production entry point: pre-forked uvicorn workers with graceful drain.
+
+    python serve.py                      # WEB_CONCURRENCY workers (default below)
+    python serve.py --workers 4 --port 8001
+
+The supervisor binds the listening socket once (with ``BACKLOG``) and forks
+the workers, which all accept on it. Each worker builds its own app with
+``create_app``, so nothing (Mongo client, caches, background tasks) is shared
+across the fork. Workers use uvloop and httptools when they are installed
+(``pip install uvloop httptools``) and fall back to asyncio and h11.
+
+Workers share nothing in memory, so more than one worker needs the shared
+backends: ``FANOUT_REDIS_URL`` (chat messages, profile frames and reminders
+reach sockets on every worker, and each worker's replay buffer sees every
+message), ``RATE_LIMIT_REDIS_URL`` (one bucket per client, not one per
+worker) and, with presence enabled, ``PRESENCE_REDIS_URL``. Without them the
+launcher refuses to start more than one worker.
+
+A worker restarts itself after ``MAX_REQUESTS`` requests, plus a random
+``MAX_REQUESTS_JITTER`` so workers do not all recycle at once. The supervisor
+replaces any worker that exits, backing off if one keeps failing at startup.
+Background jobs (the deadline reminder engine, message retention) run on
+worker 0 only; the other workers forward reminder schedule/cancel updates to
+it through the fan-out. A replacement for worker 0 started by a reload waits
+until the old worker 0 has exited, then the supervisor sends it SIGUSR1 to
+start the jobs, so there is never more than one reminder engine (reminders
+that came due in between are caught up on start).
+
+On SIGTERM (or SIGINT) every worker stops accepting connections, sends each
+open WebSocket ``{"type": "reconnect", "retry_after_ms": N}`` with a random
+``N`` up to ``WS_RECONNECT_JITTER_MS`` and closes it with code 1012 (service
+restart), lets in-flight requests finish for up to ``GRACEFUL_TIMEOUT_SECONDS``
+and then runs the app shutdown. Clients reconnect after the hinted delay and
+catch up with ``last_seen_seq``. SIGHUP recycles the workers one at a time:
+the supervisor starts a replacement, waits until it is accepting on the
+shared socket and only then drains the old worker, so there is always a
+worker accepting connections.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from config import load_env
+
+logger = logging.getLogger("serve")
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _available(module: str) -> bool:
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+class ServeSettings:
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 8000,
+        workers: Optional[int] = None,
+        backlog: int = 2048,
+        keep_alive_seconds: float = 65,
+        max_requests: int = 20_000,
+        max_requests_jitter: int = 2_000,
+        graceful_timeout_seconds: float = 30,
+        ws_reconnect_jitter_ms: int = 5_000,
+        forwarded_allow_ips: str = "127.0.0.1",
+        log_level: str = "info",
+    ):
+        self.host = host
+        self.port = port
+        self.workers = workers  # None: one per CPU when the shared backends are set, else 1
+        self.backlog = backlog
+        self.keep_alive_seconds = keep_alive_seconds
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout_seconds = graceful_timeout_seconds
+        self.ws_reconnect_jitter_ms = ws_reconnect_jitter_ms
+        self.forwarded_allow_ips = forwarded_allow_ips
+        self.log_level = log_level
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "ServeSettings":
+        env = load_env() if env is None else env
+        return cls(
+            host=env.get("HOST", "0.0.0.0"),
+            port=int(env.get("PORT", 8000)),
+            workers=int(env["WEB_CONCURRENCY"]) if env.get("WEB_CONCURRENCY") else None,
+            backlog=int(env.get("BACKLOG", 2048)),
+            # Longer than the load balancer's idle timeout, so it never
+            # reuses a connection the worker is closing
+            keep_alive_seconds=float(env.get("KEEP_ALIVE_SECONDS", 65)),
+            max_requests=int(env.get("MAX_REQUESTS", 20_000)),
+            max_requests_jitter=int(env.get("MAX_REQUESTS_JITTER", 2_000)),
+            graceful_timeout_seconds=float(env.get("GRACEFUL_TIMEOUT_SECONDS", 30)),
+            ws_reconnect_jitter_ms=int(env.get("WS_RECONNECT_JITTER_MS", 5_000)),
+            forwarded_allow_ips=env.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+            log_level=env.get("LOG_LEVEL", "info").lower(),
+        )
+
+
+# Worker
+
+async def drain_websockets(app, jitter_ms: int) -> int:
+    """Tell every open socket to reconnect elsewhere, then close it (1012)."""
+    from fastapi import status
+
+    connections = app.state.resources.manager.all_connections()
+    for connection in connections:
+        try:
+            await connection.send_json({
+                "type": "reconnect",
+                "reason": "server_restart",
+                "retry_after_ms": random.randint(500, 500 + jitter_ms),
+            })
+            await connection.close(code=status.WS_1012_SERVICE_RESTART)
+        except Exception:
+            pass
+    return len(connections)
+
+
+def shared_backends_missing(app_settings) -> List[str]:
+    """Settings a multi-worker deployment needs but does not have."""
+    missing = []
+    if not app_settings.fanout_redis_url:
+        missing.append("FANOUT_REDIS_URL")
+    if not app_settings.rate_limit_redis_url:
+        missing.append("RATE_LIMIT_REDIS_URL")
+    if app_settings.presence.enabled and not app_settings.presence.redis_url:
+        missing.append("PRESENCE_REDIS_URL (or PRESENCE_ENABLED=false)")
+    return missing
+
+
+def run_worker(
+    index: int,
+    sock: socket.socket,
+    settings: ServeSettings,
+    ready_fd: Optional[int] = None,
+    defer_jobs: bool = False,
+) -> int:
+    import uvicorn
+
+    import server
+    from config import Settings
+
+    random.seed()  # forked children start with the parent's random state
+    app_settings = Settings.from_env()
+    app_settings.background_jobs = index == 0 and not defer_jobs
+    app = server.create_app(app_settings)
+
+    class DrainingServer(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets)
+            if defer_jobs and self.started:
+                # The supervisor signals once the worker we replace has exited
+                asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, start_jobs)
+            if ready_fd is not None:
+                # Tell the supervisor we are accepting (or gave up)
+                os.write(ready_fd, b"1" if self.started else b"0")
+                os.close(ready_fd)
+
+        async def shutdown(self, sockets=None):
+            # Stop accepting, so reconnects land on the other workers (or
+            # on the replacement the supervisor started before signalling)
+            for listener in self.servers:
+                listener.close()
+            drained = await drain_websockets(app, settings.ws_reconnect_jitter_ms)
+            if drained:
+                logger.info(f"Worker {index}: closed {drained} WebSockets with a reconnect hint")
+                await asyncio.sleep(0.1)
+            await super().shutdown(sockets)
+
+    def start_jobs():
+        logger.info(f"Worker {index}: starting background jobs")
+        app.state.resources.start_background_jobs()
+
+    max_requests = None
+    if settings.max_requests > 0:
+        max_requests = settings.max_requests + random.randint(0, max(0, settings.max_requests_jitter))
+    config = uvicorn.Config(
+        app,
+        loop="uvloop" if _available("uvloop") else "asyncio",
+        http="httptools" if _available("httptools") else "h11",
+        ws="websockets",
+        lifespan="on",
+        backlog=settings.backlog,
+        timeout_keep_alive=settings.keep_alive_seconds,
+        limit_max_requests=max_requests,
+        timeout_graceful_shutdown=settings.graceful_timeout_seconds,
+        ws_per_message_deflate=app_settings.ws_per_message_deflate,
+        proxy_headers=True,
+        forwarded_allow_ips=settings.forwarded_allow_ips,
+        log_level=settings.log_level,
+    )
+    logger.info(f"Worker {index} [{os.getpid()}]: loop={config.loop} http={config.http} max_requests={max_requests}")
+    worker = DrainingServer(config)
+    worker.run(sockets=[sock])
+    return 0 if worker.started else 3  # 3: the app failed to start, like uvicorn
+
+
+# Supervisor
+
+class Supervisor:
+    def __init__(self, settings: ServeSettings, sock: socket.socket):
+        self.settings = settings
+        self.sock = sock
+        self.workers: Dict[int, int] = {}  # pid -> worker index
+        self.started: Dict[int, float] = {}  # pid -> start time
+        self.ready: Dict[int, int] = {}  # pid -> read end of its readiness pipe
+        self.accepting = set()  # pids that reported they are accepting
+        self.retiring = set()  # pids drained on purpose, not to be replaced
+        self.failures: Dict[int, int] = {}  # worker index -> quick failures in a row
+        self.respawn_at: Dict[int, float] = {}  # worker index -> when to replace it
+        self.reload_queue: List[int] = []  # pids to replace, one at a time
+        self.replacing: Optional[Tuple[int, int, float]] = None  # (old pid, new pid, deadline)
+        self.deferred_jobs: Dict[int, int] = {}  # worker index -> replacement waiting to start its jobs
+        self.stopping = False
+        self.stop_deadline = float("inf")
+
+    def spawn(self, index: int, defer_jobs: bool = False) -> int:
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(signum, signal.SIG_DFL)
+            os.close(ready_read)
+            for fd in self.ready.values():
+                os.close(fd)
+            code = 1
+            try:
+                code = run_worker(index, self.sock, self.settings, ready_write, defer_jobs)
+            except BaseException:
+                logger.exception(f"Worker {index} crashed")
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        os.close(ready_write)
+        self.workers[pid] = index
+        self.started[pid] = time.monotonic()
+        self.ready[pid] = ready_read
+        return pid
+
+    def signal_workers(self, signum: int) -> None:
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def retire(self, pid: int) -> None:
+        self.retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def start_jobs(self, pid: int) -> None:
+        try:
+            os.kill(pid, signal.SIGUSR1)
+        except ProcessLookupError:
+            pass
+
+    def hand_over_jobs(self) -> None:
+        """Let a replacement start the background jobs once the worker it replaced is gone."""
+        for index, pid in list(self.deferred_jobs.items()):
+            if pid not in self.workers:
+                del self.deferred_jobs[index]
+            elif pid in self.accepting and list(self.workers.values()).count(index) == 1:
+                self.start_jobs(pid)
+                del self.deferred_jobs[index]
+
+    def handle_stop(self, signum, frame) -> None:
+        if not self.stopping:
+            logger.info(f"Received {signal.Signals(signum).name}, draining {len(self.workers)} workers")
+            self.stopping = True
+            self.stop_deadline = time.monotonic() + self.settings.graceful_timeout_seconds + 10
+            self.signal_workers(signal.SIGTERM)
+
+    def handle_reload(self, signum, frame) -> None:
+        if self.stopping:
+            return
+        logger.info("Received SIGHUP, recycling workers one at a time")
+        replacing = self.replacing[1] if self.replacing else None
+        self.reload_queue = [pid for pid in self.workers if pid not in self.retiring and pid != replacing]
+
+    def poll_ready(self) -> None:
+        if not self.ready:
+            return
+        readable, _, _ = select.select(list(self.ready.values()), [], [], 0)
+        for pid, fd in list(self.ready.items()):
+            if fd in readable:
+                if os.read(fd, 1) == b"1":
+                    self.accepting.add(pid)
+                os.close(fd)
+                del self.ready[pid]
+
+    def reap(self) -> None:
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+            index = self.workers.pop(pid, None)
+            fd = self.ready.pop(pid, None)
+            if fd is not None:
+                os.close(fd)
+            self.accepting.discard(pid)
+            started = self.started.pop(pid, 0.0)
+            if index is None or self.stopping:
+                continue
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            if self.replacing and pid == self.replacing[1]:
+                continue  # a replacement that failed; the old worker stays
+            code = os.waitstatus_to_exitcode(status)
+            # A worker that dies right after starting is probably failing to
+            # boot; back off instead of forking in a tight loop
+            if code != 0 and time.monotonic() - started < 5:
+                self.failures[index] = self.failures.get(index, 0) + 1
+            else:
+                self.failures[index] = 0
+            delay = min(30, 2 ** self.failures[index] - 1)
+            if code != 0:
+                logger.warning(f"Worker {index} [{pid}] exited with {code}, restarting in {delay}s")
+            self.respawn_at[index] = time.monotonic() + delay
+
+    def step_reload(self, now: float) -> None:
+        """Start a replacement, and drain the old worker once it is accepting."""
+        if self.replacing is not None:
+            old, new, deadline = self.replacing
+            if new in self.accepting:
+                self.retire(old)
+                self.replacing = None
+            elif new not in self.workers or now > deadline:
+                logger.error(f"Replacement for worker {self.workers.get(old)} did not start; reload aborted")
+                if new in self.workers:
+                    self.retire(new)
+                self.reload_queue = []
+                self.replacing = None
+            return
+        while self.reload_queue:
+            old = self.reload_queue.pop(0)
+            if old in self.workers and old not in self.retiring:
+                index = self.workers[old]
+                # Worker 0 runs the background jobs; its replacement waits for
+                # the old one to exit before starting them
+                new = self.spawn(index, defer_jobs=index == 0)
+                if index == 0:
+                    self.deferred_jobs[index] = new
+                self.replacing = (old, new, now + self.settings.graceful_timeout_seconds + 30)
+                return
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        logger.info(
+            f"Listening on http://{self.settings.host}:{self.settings.port} "
+            f"with {self.settings.workers} workers (backlog {self.settings.backlog})"
+        )
+        for index in range(self.settings.workers):
+            self.spawn(index)
+
+        while self.workers or (self.respawn_at and not self.stopping):
+            self.reap()
+            self.poll_ready()
+            now = time.monotonic()
+            if self.stopping:
+                if now > self.stop_deadline:
+                    logger.error(f"Drain timed out, killing {len(self.workers)} workers")
+                    self.signal_workers(signal.SIGKILL)
+                    self.stop_deadline = float("inf")
+            else:
+                self.step_reload(now)
+                self.hand_over_jobs()
+                for index, when in list(self.respawn_at.items()):
+                    if now >= when:
+                        del self.respawn_at[index]
+                        self.spawn(index)
+            time.sleep(0.1)
+        self.sock.close()
+        logger.info("All workers stopped")
+        return 0
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    settings = ServeSettings.from_env()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.host)
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("--workers", type=int, default=settings.workers, help="worker processes (default: one per CPU, see above)")
+    parser.add_argument("--backlog", type=int, default=settings.backlog)
+    parser.add_argument("--max-requests", type=int, default=settings.max_requests, help="recycle a worker after this many requests (0: never)")
+    args = parser.parse_args(argv)
+    settings.host, settings.port = args.host, args.port
+    settings.backlog, settings.max_requests = args.backlog, args.max_requests
+
+    logging.basicConfig(
+        level=getattr(logging, settings.log_level.upper(), logging.INFO),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    from config import Settings
+
+    missing = shared_backends_missing(Settings.from_env())
+    if args.workers is None:
+        settings.workers = 1 if missing else _cpu_count()
+        if missing and _cpu_count() > 1:
+            logger.warning(f"Starting 1 worker; set {', '.join(missing)} to run one per CPU")
+    elif args.workers > 1 and missing:
+        logger.error(
+            f"{args.workers} workers would each keep their own sockets, presence and rate limits; "
+            f"set {', '.join(missing)} or run a single worker"
+        )
+        return 2
+    else:
+        settings.workers = max(1, args.workers)
+    return Supervisor(settings, bind_socket(settings.host, settings.port, settings.backlog)).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,96 +1,264 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from dotenv import load_dotenv
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.security import OAuth2PasswordBearer
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import PlainTextResponse
+from contextlib import asynccontextmanager
+from functools import lru_cache
 import logging
-from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+import time
+import hmac
 import json
+import asyncio
+
+# Heavy dependencies (motor/pymongo, requests, passlib) are imported where
+# they are first used, so importing this module stays cheap and free of I/O.
+import metrics
+from metrics import MetricsMiddleware
+from profiling import Profiler, ProfilingMiddleware
+from compression import CompressionMiddleware
+from ratelimit import RateLimitMiddleware, RateLimitRule, InMemoryRateLimitBackend, RedisRateLimitBackend
+from profiles import ProfileCache, UserLoader
+from study_slots import FreeSlotCache
+from replay import ReplayBuffer, replay_missed
+from reminders import flush as flush_reminders
+from config import Settings
 
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
-
-from fastapi.middleware.cors import CORSMiddleware
-
-origins = [
-    "https://endearing-tulumba-a4d24e.netlify.app",  # your frontend
-    "http://localhost:3000",  # local testing
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,       # only allow these origins
-    allow_credentials=True,
-    allow_methods=["*"],         # GET, POST, etc.
-    allow_headers=["*"],         # allow headers
-)
-
-api_router = APIRouter()  # <-- this is your router
-
-
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60  # or whatever duration you want
-
-# MongoDB connection
-# ----- MongoDB connection (REPLACE existing Mongo lines with this) -----
-from motor.motor_asyncio import AsyncIOMotorClient
-
-# read standard env names that you used in .env / Render
-# MONGODB – FINAL VERSION (NO LOCALHOST, NO FALLBACKS)
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
-
-MONGO_URI = os.getenv("MONGODB_URI")
-if not MONGO_URI:
-    raise RuntimeError("MONGODB_URI is not set in Render environment variables!")
-
-client = AsyncIOMotorClient(MONGO_URI)
-db = client.Younivity
-print("Successfully connected to MongoDB Atlas:", MONGO_URI.split("@")[1].split("/")[0])
-# ----------------------------------------------------------------------
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-# Create the main app without a prefix
-
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Routes mounted without the /api prefix (WebSocket, metrics)
+root_router = APIRouter()
+
 # WebSocket connection manager
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Sockets opened with a token, by user, for per-user pushes (reminders)
+        self.user_connections: Dict[str, List[WebSocket]] = {}
 
-    async def connect(self, websocket: WebSocket, group_id: str):
+    async def connect(self, websocket: WebSocket, group_id: Optional[str], user_id: Optional[str] = None):
         await websocket.accept()
-        if group_id not in self.active_connections:
-            self.active_connections[group_id] = []
-        self.active_connections[group_id].append(websocket)
-
-    def disconnect(self, websocket: WebSocket, group_id: str):
+        metrics.websocket_connections.inc()
+        if group_id is not None:
+            self.active_connections.setdefault(group_id, []).append(websocket)
+        if user_id is not None:
+            self.user_connections.setdefault(user_id, []).append(websocket)
+
+    def disconnect(self, websocket: WebSocket, group_id: Optional[str], user_id: Optional[str] = None):
+        metrics.websocket_connections.dec()
         if group_id in self.active_connections:
             self.active_connections[group_id].remove(websocket)
+        if user_id in self.user_connections:
+            self.user_connections[user_id].remove(websocket)
+            if not self.user_connections[user_id]:
+                del self.user_connections[user_id]
+
+    async def send_to_user(self, user_id: str, message: dict) -> int:
+        """Send to every socket the user has open; returns how many got it"""
+        delivered = 0
+        for connection in list(self.user_connections.get(user_id, [])):
+            try:
+                await connection.send_json(message)
+                delivered += 1
+            except:
+                pass
+        return delivered
+
+    def all_connections(self) -> List[WebSocket]:
+        """Every open socket once, whether it joined a group, a user or both"""
+        sockets = {}
+        for connections in (*self.active_connections.values(), *self.user_connections.values()):
+            for connection in connections:
+                sockets[id(connection)] = connection
+        return list(sockets.values())
 
     async def broadcast(self, message: dict, group_id: str):
         if group_id in self.active_connections:
+            metrics.websocket_fanout.observe(len(self.active_connections[group_id]))
             for connection in self.active_connections[group_id]:
                 try:
                     await connection.send_json(message)
                 except:
                     pass
 
-manager = ConnectionManager()
+# Per-app resources, opened and closed by the app lifespan
+class Resources:
+    def __init__(self, settings: Settings, profiler: Profiler):
+        self.settings = settings
+        self.profiler = profiler
+        self.manager = ConnectionManager()
+        # Recent broadcasts per group, for sockets that reconnect
+        self.replay = ReplayBuffer(settings.ws_replay_buffer_size, settings.ws_replay_max_groups)
+        # Public user profiles (name, email), shared by every request
+        self.profiles = ProfileCache(settings.profile_cache_size, settings.profile_cache_ttl_seconds)
+        # Group free-slot answers, keyed on members' schedule versions
+        self.free_slots = FreeSlotCache(ttl_seconds=settings.free_slot_cache_ttl_seconds)
+        self.client = None
+        self.db = None
+        self.db_reads = None
+        self.messages = None
+        self.fanout = None
+        self.reminders = None
+        self.presence = None
+        self.canvas_session = None
+        self.canvas_catalog = None
+        # Background jobs (message retention)
+        self.tasks: List[asyncio.Task] = []
+
+    async def open(self):
+        from canvas_catalog import CanvasCatalog
+        from database import create_client, ensure_indexes, read_heavy
+        from fanout import create_fanout
+        from message_store import create_message_store
+        from mongo_monitoring import listeners
+        from presence import create_presence_tracker
+
+        if not self.settings.mongodb_uri:
+            raise RuntimeError("MONGODB_URI is not set in Render environment variables!")
+
+        self.client = create_client(self.settings.mongo, event_listeners=listeners(self.profiler))
+        self.db = self.client[self.settings.mongo.db_name]
+        # Reads that tolerate replication lag (group lists, history) may go to secondaries
+        self.db_reads = read_heavy(self.db, self.settings.mongo)
+        host = self.settings.mongodb_uri.split("://", 1)[-1].split("@")[-1].split("/")[0]
+        logger.info(f"MongoDB client ready for {host}")
+        try:
+            await ensure_indexes(self.db)
+        except Exception as e:
+            logger.error(f"Could not create MongoDB indexes: {str(e)}")
+        self.messages = create_message_store(self.db, self.db_reads, self.settings.messages)
+        # Frames for sockets go through the fan-out, so they reach every worker
+        self.fanout = create_fanout(self.settings.fanout_redis_url, {
+            "group": self._deliver_to_group,
+            "user": self._deliver_to_user,
+            "reminders": self._apply_reminder_update,
+        })
+        self.fanout.start()
+        if self.settings.background_jobs:
+            self.start_background_jobs()
+        if self.settings.presence.enabled:
+            self.presence = create_presence_tracker(self.manager.broadcast, self.settings.presence)
+            self.presence.start()
+
+        self.canvas_session = create_canvas_session(self.settings)
+        self.canvas_catalog = CanvasCatalog(
+            self.db,
+            lambda endpoint, url, **kwargs: canvas_request(self, "GET", endpoint, url, **kwargs),
+            ttl_seconds=self.settings.canvas_catalog_ttl_seconds,
+        )
+        self.profiler.start()
+
+    def start_background_jobs(self):
+        """Start retention and the reminder engine (one process per deployment)"""
+        from message_store import run_retention
+        from reminders import ReminderEngine
+
+        if self.tasks or self.reminders is not None:
+            return
+        if self.settings.messages.retention_days > 0:
+            self.tasks.append(asyncio.create_task(
+                run_retention(self.messages, self.settings.messages.retention_interval_seconds)
+            ))
+        if self.settings.reminders.enabled:
+            self.reminders = ReminderEngine(
+                self.db, self.push_to_user, self.settings.reminders, shared_delivery=self.fanout.shared
+            )
+            self.reminders.start()
+
+    async def stop_background_jobs(self):
+        """Stop retention and the reminder engine"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.reminders is not None:
+            await self.reminders.stop()
+            self.reminders = None
+
+    async def close(self):
+        await self.stop_background_jobs()
+        if self.presence is not None:
+            await self.presence.stop()
+        if self.fanout is not None:
+            await self.fanout.stop()
+        await self.profiler.stop()
+        if self.canvas_session is not None:
+            self.canvas_session.close()
+        if self.client is not None:
+            self.client.close()
+
+    # Delivery to the sockets of every worker (see fanout.py)
+
+    async def broadcast(self, group_id: str, message: dict):
+        await self.fanout.publish("group", group_id, message)
+
+    async def push_to_user(self, user_id: str, message: dict) -> int:
+        return await self.fanout.publish("user", user_id, message)
+
+    async def schedule_reminder(self, assignment: dict):
+        if self.reminders is not None:
+            self.reminders.schedule(assignment)
+        elif self.fanout.shared and self.settings.reminders.enabled:
+            fields = ("id", "user_id", "title", "course_name", "due_date", "completed")
+            await self.fanout.publish("reminders", "", {
+                "op": "schedule", "assignment": {field: assignment.get(field) for field in fields}
+            })
+
+    async def cancel_reminder(self, assignment_id: str):
+        if self.reminders is not None:
+            self.reminders.cancel(assignment_id)
+        elif self.fanout.shared and self.settings.reminders.enabled:
+            await self.fanout.publish("reminders", "", {"op": "cancel", "assignment_id": assignment_id})
+
+    async def skip_seq(self, group_id: str, seq: int):
+        """Tell every worker's replay buffer that ``seq`` has no message"""
+        await self.fanout.publish("group", group_id, {"type": "seq_skipped", "seq": seq})
+
+    async def _deliver_to_group(self, group_id: str, message: dict) -> int:
+        if message.get("type") == "seq_skipped":
+            self.replay.skip(group_id, message["seq"])
+            return 0
+        if "seq" in message and "type" not in message:
+            # A chat message: keep it for sockets that reconnect to this worker
+            self.replay.append(group_id, message)
+        await self.manager.broadcast(message, group_id)
+        return len(self.manager.active_connections.get(group_id, []))
+
+    async def _deliver_to_user(self, user_id: str, message: dict) -> int:
+        from reminders import acknowledge
+
+        delivered = await self.manager.send_to_user(user_id, message)
+        if delivered and self.fanout.shared and message.get("type") == "reminder":
+            await acknowledge(self.db, user_id, message)
+        return delivered
+
+    async def _apply_reminder_update(self, _, update: dict) -> int:
+        # Only the worker running the engine acts on these
+        if self.reminders is None:
+            return 0
+        if update["op"] == "schedule":
+            self.reminders.schedule(update["assignment"])
+        else:
+            self.reminders.cancel(update["assignment_id"])
+        return 1
+
+def get_resources(request: Request) -> Resources:
+    return request.app.state.resources
+
+def get_user_loader(res: Resources = Depends(get_resources)) -> UserLoader:
+    """One loader per request, so its lookups are batched together"""
+    # Primary reads: a secondary may still have a pre-rename name to cache
+    return UserLoader(res.db, res.profiles)
 
 # Models
 class User(BaseModel):
@@ -107,6 +275,9 @@ class UserCreate(BaseModel):
     password: str
     full_name: str
 
+class UserUpdate(BaseModel):
+    full_name: str = Field(min_length=1, max_length=100)
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -133,6 +304,12 @@ class Group(BaseModel):
     member_ids: List[str] = []
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class GroupSummary(Group):
+    # Highest message seq and the caller's read cursor (GET /groups?unread=true)
+    message_seq: Optional[int] = None
+    last_read_seq: Optional[int] = None
+    unread_count: Optional[int] = None
+
 class GroupCreate(BaseModel):
     name: str
     description: Optional[str] = ""
@@ -144,11 +321,15 @@ class Message(BaseModel):
     user_id: str
     user_name: str
     content: str
+    seq: Optional[int] = None  # per-group sequence number, absent on older messages
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class MessageCreate(BaseModel):
     content: str
 
+class ReadCursorUpdate(BaseModel):
+    seq: Optional[int] = Field(default=None, ge=0)  # omit to mark everything read
+
 class Assignment(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -167,6 +348,20 @@ class AssignmentCreate(BaseModel):
     due_date: datetime
     course_name: Optional[str] = ""
 
+class BusyBlock(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    title: Optional[str] = ""
+    start: datetime
+    end: datetime
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class BusyBlockCreate(BaseModel):
+    title: Optional[str] = ""
+    start: datetime
+    end: datetime
+
 class LMSConfig(BaseModel):
     model_config = ConfigDict(extra="ignore")
     user_id: str
@@ -179,38 +374,78 @@ class LMSConfigUpdate(BaseModel):
     canvas_api_key: Optional[str] = None
     canvas_domain: Optional[str] = None
 
+class ProfilingUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    slow_request_ms: Optional[float] = None
+    slow_mongo_ms: Optional[float] = None
+    loop_lag_ms: Optional[float] = None
+    sample_interval_ms: Optional[float] = Field(default=None, gt=0)
+    max_traces: Optional[int] = Field(default=None, gt=0)
+
+# Canvas HTTP helpers
+def create_canvas_session(settings: Settings):
+    """A pooled requests session shared by all Canvas calls of one app"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=settings.canvas_pool_size, pool_maxsize=settings.canvas_pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+async def canvas_request(res: Resources, method: str, endpoint: str, url: str, **kwargs):
+    """Call the Canvas API off the event loop and record its latency under a fixed endpoint label"""
+    kwargs.setdefault("timeout", res.settings.canvas_timeout_seconds)
+    start = time.perf_counter()
+    status_label = "error"
+    try:
+        response = await run_in_threadpool(res.canvas_session.request, method, url, **kwargs)
+        status_label = str(response.status_code)
+        return response
+    finally:
+        metrics.canvas_latency.observe(time.perf_counter() - start, endpoint, status_label)
+
 # Auth helper functions
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+def create_access_token(data: dict, settings: Settings, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def token_subject(token: str, settings: Settings) -> Optional[str]:
+    """The user id a valid token was issued for, or None"""
+    try:
+        return jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm]).get("sub")
+    except JWTError:
+        return None
+
+async def get_current_user(token: str = Depends(oauth2_scheme), res: Resources = Depends(get_resources)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+    user_id = token_subject(token, res.settings)
+    if user_id is None:
         raise credentials_exception
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await res.db.users.find_one({"id": user_id}, {"_id": 0})
     if user is None:
         raise credentials_exception
     return User(**user)
@@ -222,9 +457,9 @@ async def root():
 
 # Auth routes
 @api_router.post("/auth/register", response_model=Token)
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, res: Resources = Depends(get_resources)):
     # Check if user exists
-    existing_user = await db.users.find_one({"email": user_data.email})
+    existing_user = await res.db.users.find_one({"email": user_data.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -240,12 +475,13 @@ async def register(user_data: UserCreate):
     user_doc['created_at'] = user_doc['created_at'].isoformat()
     user_doc['hashed_password'] = hashed_password
     
-    await db.users.insert_one(user_doc)
+    await res.db.users.insert_one(user_doc)
     
     # Create token
     access_token = create_access_token(
         data={"sub": user.id},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        settings=res.settings,
+        expires_delta=timedelta(minutes=res.settings.access_token_expire_minutes)
     )
     
     return Token(
@@ -255,15 +491,16 @@ async def register(user_data: UserCreate):
     )
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(user_data: UserLogin):
-    user_doc = await db.users.find_one({"email": user_data.email})
+async def login(user_data: UserLogin, res: Resources = Depends(get_resources)):
+    user_doc = await res.db.users.find_one({"email": user_data.email})
     if not user_doc or not verify_password(user_data.password, user_doc.get('hashed_password', '')):
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     
     user = User(**user_doc)
     access_token = create_access_token(
         data={"sub": user.id},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        settings=res.settings,
+        expires_delta=timedelta(minutes=res.settings.access_token_expire_minutes)
     )
     
     return Token(
@@ -273,10 +510,10 @@ async def login(user_data: UserLogin):
     )
 
 @api_router.post("/auth/google", response_model=Token)
-async def google_auth(auth_data: GoogleAuthData):
+async def google_auth(auth_data: GoogleAuthData, res: Resources = Depends(get_resources)):
     """Placeholder for Google OAuth - integrate with google-auth-oauthlib"""
     # Check if user exists
-    user_doc = await db.users.find_one({"email": auth_data.email})
+    user_doc = await res.db.users.find_one({"email": auth_data.email})
     
     if user_doc:
         user = User(**user_doc)
@@ -289,11 +526,12 @@ async def google_auth(auth_data: GoogleAuthData):
         )
         user_doc = user.model_dump()
         user_doc['created_at'] = user_doc['created_at'].isoformat()
-        await db.users.insert_one(user_doc)
+        await res.db.users.insert_one(user_doc)
     
     access_token = create_access_token(
         data={"sub": user.id},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        settings=res.settings,
+        expires_delta=timedelta(minutes=res.settings.access_token_expire_minutes)
     )
     
     return Token(
@@ -315,13 +553,33 @@ async def byu_netid_auth(auth_data: BYUNetIDAuth):
 async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+@api_router.patch("/auth/me", response_model=User)
+async def update_me(
+    update: UserUpdate,
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
+):
+    """Rename; messages pick up the new name on read, open chats get a profile frame"""
+    await res.db.users.update_one({"id": current_user.id}, {"$set": {"full_name": update.full_name}})
+    res.profiles.invalidate(current_user.id)
+    current_user.full_name = update.full_name
+    
+    frame = {"type": "profile", "user_id": current_user.id, "full_name": update.full_name}
+    for group_id in current_user.group_ids:
+        await res.broadcast(group_id, frame)
+    return current_user
+
 # Assignment routes
 @api_router.get("/assignments", response_model=List[Assignment])
-async def get_assignments(current_user: User = Depends(get_current_user)):
-    assignments = await db.assignments.find(
+async def get_assignments(current_user: User = Depends(get_current_user), res: Resources = Depends(get_resources)):
+    from canvas_catalog import hydrate
+
+    assignments = await res.db.assignments.find(
         {"user_id": current_user.id},
         {"_id": 0}
     ).to_list(1000)
+    # Canvas entries are overlays; titles and descriptions live in the catalogue
+    assignments = await hydrate(res.db, assignments)
     
     for assignment in assignments:
         if isinstance(assignment['due_date'], str):
@@ -334,7 +592,8 @@ async def get_assignments(current_user: User = Depends(get_current_user)):
 @api_router.post("/assignments", response_model=Assignment)
 async def create_assignment(
     assignment_data: AssignmentCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
 ):
     assignment = Assignment(
         user_id=current_user.id,
@@ -349,40 +608,132 @@ async def create_assignment(
     doc['due_date'] = doc['due_date'].isoformat()
     doc['created_at'] = doc['created_at'].isoformat()
     
-    await db.assignments.insert_one(doc)
+    from workload import record
+
+    await res.db.assignments.insert_one(doc)
+    await record(res.db, current_user.id, [(doc, 1, 0)])
+    res.free_slots.bump(current_user.id)
+    await res.schedule_reminder(doc)
     return assignment
 
 @api_router.patch("/assignments/{assignment_id}/complete")
 async def toggle_assignment_complete(
     assignment_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
 ):
-    assignment = await db.assignments.find_one({"id": assignment_id, "user_id": current_user.id})
+    assignment = await res.db.assignments.find_one({"id": assignment_id, "user_id": current_user.id})
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
     
+    from canvas_catalog import hydrate
+    from workload import record
+
     new_status = not assignment.get('completed', False)
-    await db.assignments.update_one(
+    await res.db.assignments.update_one(
         {"id": assignment_id},
         {"$set": {"completed": new_status}}
     )
+    hydrated = await hydrate(res.db, [assignment])
+    await record(res.db, current_user.id, [(doc, 0, 1 if new_status else -1) for doc in hydrated])
+    res.free_slots.bump(current_user.id)
+    if new_status:
+        await res.cancel_reminder(assignment_id)
+    else:
+        for doc in hydrated:
+            await res.schedule_reminder({**doc, "completed": new_status})
     
     return {"completed": new_status}
 
 @api_router.delete("/assignments/{assignment_id}")
 async def delete_assignment(
     assignment_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
 ):
-    result = await db.assignments.delete_one({"id": assignment_id, "user_id": current_user.id})
-    if result.deleted_count == 0:
+    from canvas_catalog import hydrate
+    from workload import record
+
+    assignment = await res.db.assignments.find_one_and_delete(
+        {"id": assignment_id, "user_id": current_user.id},
+        {"_id": 0}
+    )
+    if assignment is None:
         raise HTTPException(status_code=404, detail="Assignment not found")
+    await record(res.db, current_user.id, [
+        (doc, -1, -1 if doc.get('completed') else 0) for doc in await hydrate(res.db, [assignment])
+    ])
+    res.free_slots.bump(current_user.id)
+    await res.cancel_reminder(assignment_id)
     return {"message": "Assignment deleted"}
 
+# Busy block routes (times a student cannot study, for group free-slot search)
+@api_router.get("/busy-blocks", response_model=List[BusyBlock])
+async def get_busy_blocks(current_user: User = Depends(get_current_user), res: Resources = Depends(get_resources)):
+    """Busy blocks that have not ended yet"""
+    blocks = await res.db.busy_blocks.find(
+        {"user_id": current_user.id, "end": {"$gt": datetime.now(timezone.utc).isoformat()}},
+        {"_id": 0}
+    ).sort("start", 1).to_list(1000)
+    
+    for block in blocks:
+        for field in ('start', 'end', 'created_at'):
+            if isinstance(block.get(field), str):
+                block[field] = datetime.fromisoformat(block[field])
+    
+    return blocks
+
+@api_router.post("/busy-blocks", response_model=BusyBlock)
+async def create_busy_block(
+    block_data: BusyBlockCreate,
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
+):
+    block = BusyBlock(user_id=current_user.id, **block_data.model_dump())
+    # Stored in UTC so range queries can compare the strings
+    for field in ('start', 'end'):
+        value = getattr(block, field)
+        setattr(block, field, value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc))
+    if block.end <= block.start:
+        raise HTTPException(status_code=400, detail="Busy block must end after it starts")
+    
+    doc = block.model_dump()
+    for field in ('start', 'end', 'created_at'):
+        doc[field] = doc[field].isoformat()
+    
+    await res.db.busy_blocks.insert_one(doc)
+    res.free_slots.bump(current_user.id)
+    return block
+
+@api_router.delete("/busy-blocks/{block_id}")
+async def delete_busy_block(
+    block_id: str,
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
+):
+    result = await res.db.busy_blocks.delete_one({"id": block_id, "user_id": current_user.id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Busy block not found")
+    res.free_slots.bump(current_user.id)
+    return {"message": "Busy block deleted"}
+
+# Analytics routes
+@api_router.get("/analytics/workload")
+async def get_workload(
+    start: Optional[date] = None,
+    days: int = Query(28, ge=1, le=366),
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
+):
+    """Assignments due per day and course from `start` (default: this week's Monday, UTC), with weekly completion"""
+    from workload import default_start, workload
+
+    return await workload(res.db, current_user.id, start or default_start(), days)
+
 # LMS Integration routes
 @api_router.get("/lms/config")
-async def get_lms_config(current_user: User = Depends(get_current_user)):
-    config = await db.lms_configs.find_one({"user_id": current_user.id}, {"_id": 0})
+async def get_lms_config(current_user: User = Depends(get_current_user), res: Resources = Depends(get_resources)):
+    config = await res.db.lms_configs.find_one({"user_id": current_user.id}, {"_id": 0})
     if not config:
         return {"learning_suite_api_key": "", "canvas_api_key": "", "canvas_domain": ""}
     return config
@@ -390,12 +741,13 @@ async def get_lms_config(current_user: User = Depends(get_current_user)):
 @api_router.post("/lms/config")
 async def update_lms_config(
     config_data: LMSConfigUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
 ):
     update_data = {k: v for k, v in config_data.model_dump().items() if v is not None}
     update_data["user_id"] = current_user.id
     
-    await db.lms_configs.update_one(
+    await res.db.lms_configs.update_one(
         {"user_id": current_user.id},
         {"$set": update_data},
         upsert=True
@@ -404,9 +756,11 @@ async def update_lms_config(
     return {"message": "LMS configuration updated"}
 
 @api_router.post("/lms/sync")
-async def sync_lms_assignments(current_user: User = Depends(get_current_user)):
+async def sync_lms_assignments(current_user: User = Depends(get_current_user), res: Resources = Depends(get_resources)):
     """Sync assignments from Canvas using stored access token"""
-    config = await db.lms_configs.find_one({"user_id": current_user.id})
+    from workload import record
+
+    config = await res.db.lms_configs.find_one({"user_id": current_user.id})
     
     if not config:
         raise HTTPException(status_code=400, detail="Please configure your LMS API keys first")
@@ -416,49 +770,66 @@ async def sync_lms_assignments(current_user: User = Depends(get_current_user)):
     # Canvas sync with OAuth token
     if config.get('canvas_access_token'):
         try:
-            import requests
-            canvas_domain = config.get('canvas_domain', os.environ.get('CANVAS_BASE_URL', 'https://canvas.instructure.com'))
+            canvas_domain = config.get('canvas_domain', res.settings.canvas_base_url)
             headers = {'Authorization': f"Bearer {config['canvas_access_token']}"}
             
-            # Get courses
-            courses_resp = requests.get(f"{canvas_domain}/api/v1/courses", headers=headers)
+            # Get courses (per student: this is what they are enrolled in)
+            courses_resp = await canvas_request(
+                res, "GET", "courses", f"{canvas_domain}/api/v1/courses", headers=headers, params={"per_page": 100}
+            )
             if courses_resp.status_code == 200:
                 courses = courses_resp.json()
                 
-                # Get assignments for each course
+                # Titles of Canvas assignments synced before the shared catalogue
+                legacy_titles = {
+                    doc['title'] for doc in await res.db.assignments.find(
+                        {"user_id": current_user.id, "source": "canvas", "course_key": {"$exists": False}},
+                        {"_id": 0, "title": 1}
+                    ).to_list(None)
+                }
+                
+                # Assignments come from the shared catalogue; the student only
+                # gets overlay documents for items they do not have yet
                 for course in courses:
-                    assignments_resp = requests.get(
-                        f"{canvas_domain}/api/v1/courses/{course['id']}/assignments",
-                        headers=headers
-                    )
-                    if assignments_resp.status_code == 200:
-                        assignments_data = assignments_resp.json()
-                        
-                        for item in assignments_data:
-                            if item.get('due_at'):
-                                # Check if assignment already exists
-                                existing = await db.assignments.find_one({
-                                    "user_id": current_user.id,
-                                    "title": item['name'],
-                                    "source": "canvas"
-                                })
-                                
-                                if not existing:
-                                    assignment = Assignment(
-                                        user_id=current_user.id,
-                                        title=item['name'],
-                                        description=item.get('description', ''),
-                                        due_date=datetime.fromisoformat(item['due_at'].replace('Z', '+00:00')),
-                                        course_name=course.get('name', 'Unknown Course'),
-                                        source='canvas'
-                                    )
-                                    
-                                    doc = assignment.model_dump()
-                                    doc['due_date'] = doc['due_date'].isoformat()
-                                    doc['created_at'] = doc['created_at'].isoformat()
-                                    
-                                    await db.assignments.insert_one(doc)
-                                    synced_count += 1
+                    entry = await res.canvas_catalog.course(canvas_domain, course, headers)
+                    if entry is None:
+                        continue
+                    
+                    existing = {
+                        doc['canvas_id'] for doc in await res.db.assignments.find(
+                            {"user_id": current_user.id, "course_key": entry['key']},
+                            {"_id": 0, "canvas_id": 1}
+                        ).to_list(None)
+                    }
+                    now = datetime.now(timezone.utc).isoformat()
+                    overlays = [
+                        {
+                            "id": str(uuid.uuid4()),
+                            "user_id": current_user.id,
+                            "source": "canvas",
+                            "course_key": entry['key'],
+                            "canvas_id": item['canvas_id'],
+                            "due_date": item['due_date'],
+                            "completed": False,
+                            "created_at": now
+                        }
+                        for item in entry['assignments']
+                        if item['due_date'] and item['canvas_id'] not in existing and item['title'] not in legacy_titles
+                    ]
+                    if overlays:
+                        await res.db.assignments.insert_many(overlays)
+                        await record(res.db, current_user.id, [
+                            ({**overlay, "course_name": entry['name']}, 1, 0) for overlay in overlays
+                        ])
+                        synced_count += len(overlays)
+                        res.free_slots.bump(current_user.id)
+                        titles = {item['canvas_id']: item['title'] for item in entry['assignments']}
+                        for overlay in overlays:
+                            await res.schedule_reminder({
+                                **overlay,
+                                "title": titles[overlay['canvas_id']],
+                                "course_name": entry['name']
+                            })
         except Exception as e:
             logger.error(f"Canvas sync error: {str(e)}")
     
@@ -469,11 +840,11 @@ async def sync_lms_assignments(current_user: User = Depends(get_current_user)):
     }
 
 @api_router.get("/canvas/auth/url")
-async def get_canvas_auth_url(current_user: User = Depends(get_current_user)):
+async def get_canvas_auth_url(current_user: User = Depends(get_current_user), res: Resources = Depends(get_resources)):
     """Generate Canvas OAuth authorization URL"""
-    client_id = os.environ.get('CANVAS_CLIENT_ID')
-    redirect_uri = os.environ.get('CANVAS_REDIRECT_URI')
-    canvas_base = os.environ.get('CANVAS_BASE_URL', 'https://canvas.instructure.com')
+    client_id = res.settings.canvas_client_id
+    redirect_uri = res.settings.canvas_redirect_uri
+    canvas_base = res.settings.canvas_base_url
     
     if not client_id:
         raise HTTPException(status_code=500, detail="Canvas OAuth not configured")
@@ -493,18 +864,19 @@ async def get_canvas_auth_url(current_user: User = Depends(get_current_user)):
     return {"auth_url": auth_url}
 
 @api_router.get("/canvas/oauth/callback")
-async def canvas_oauth_callback(code: str, state: str):
+async def canvas_oauth_callback(code: str, state: str, res: Resources = Depends(get_resources)):
     """Handle Canvas OAuth callback and exchange code for token"""
     try:
-        import requests
-        
-        client_id = os.environ.get('CANVAS_CLIENT_ID')
-        client_secret = os.environ.get('CANVAS_CLIENT_SECRET')
-        redirect_uri = os.environ.get('CANVAS_REDIRECT_URI')
-        canvas_base = os.environ.get('CANVAS_BASE_URL', 'https://canvas.instructure.com')
+        client_id = res.settings.canvas_client_id
+        client_secret = res.settings.canvas_client_secret
+        redirect_uri = res.settings.canvas_redirect_uri
+        canvas_base = res.settings.canvas_base_url
         
         # Exchange code for access token
-        token_resp = requests.post(
+        token_resp = await canvas_request(
+            res,
+            "POST",
+            "oauth_token",
             f"{canvas_base}/login/oauth2/token",
             data={
                 'grant_type': 'authorization_code',
@@ -525,7 +897,7 @@ async def canvas_oauth_callback(code: str, state: str):
         user_id = state
         
         # Store access token in user's LMS config
-        await db.lms_configs.update_one(
+        await res.db.lms_configs.update_one(
             {"user_id": user_id},
             {
                 "$set": {
@@ -547,23 +919,39 @@ async def canvas_oauth_callback(code: str, state: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 # Group routes
-@api_router.get("/groups", response_model=List[Group])
-async def get_groups(current_user: User = Depends(get_current_user)):
-    groups = await db.groups.find(
+@api_router.get("/groups", response_model=List[GroupSummary], response_model_exclude_none=True)
+async def get_groups(
+    unread: bool = False,
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
+):
+    """List the user's groups; with ?unread=true each includes its unread count"""
+    # One indexed query (member_ids); only the caller's read cursor is fetched
+    projection = {field: 1 for field in ("id", "name", "description", "member_ids", "created_at")}
+    projection["_id"] = 0
+    if unread:
+        projection["last_message_seq"] = 1
+        projection[f"read_seq.{current_user.id}"] = 1
+    groups = await res.db_reads.groups.find(
         {"member_ids": current_user.id},
-        {"_id": 0}
+        projection
     ).to_list(1000)
     
     for group in groups:
         if isinstance(group['created_at'], str):
             group['created_at'] = datetime.fromisoformat(group['created_at'])
+        if unread:
+            group['message_seq'] = group.pop('last_message_seq', 0)
+            group['last_read_seq'] = group.pop('read_seq', {}).get(current_user.id, 0)
+            group['unread_count'] = max(0, group['message_seq'] - group['last_read_seq'])
     
     return groups
 
 @api_router.post("/groups", response_model=Group)
 async def create_group(
     group_data: GroupCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
 ):
     group = Group(
         name=group_data.name,
@@ -574,10 +962,10 @@ async def create_group(
     doc = group.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     
-    await db.groups.insert_one(doc)
+    await res.db.groups.insert_one(doc)
     
     # Update user's group list
-    await db.users.update_one(
+    await res.db.users.update_one(
         {"id": current_user.id},
         {"$push": {"group_ids": group.id}}
     )
@@ -585,20 +973,24 @@ async def create_group(
     return group
 
 @api_router.post("/groups/{group_id}/join")
-async def join_group(group_id: str, current_user: User = Depends(get_current_user)):
-    group = await db.groups.find_one({"id": group_id})
+async def join_group(
+    group_id: str,
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
+):
+    group = await res.db.groups.find_one({"id": group_id})
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     
     if current_user.id in group['member_ids']:
         return {"message": "Already a member"}
     
-    await db.groups.update_one(
+    await res.db.groups.update_one(
         {"id": group_id},
         {"$push": {"member_ids": current_user.id}}
     )
     
-    await db.users.update_one(
+    await res.db.users.update_one(
         {"id": current_user.id},
         {"$push": {"group_ids": group_id}}
     )
@@ -609,15 +1001,16 @@ async def join_group(group_id: str, current_user: User = Depends(get_current_use
 async def invite_to_group(
     group_id: str,
     email: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
 ):
     # Verify user is in group
-    group = await db.groups.find_one({"id": group_id, "member_ids": current_user.id})
+    group = await res.db.groups.find_one({"id": group_id, "member_ids": current_user.id})
     if not group:
         raise HTTPException(status_code=403, detail="Not a member of this group")
     
     # Find user by email
-    invited_user = await db.users.find_one({"email": email})
+    invited_user = await res.db.users.find_one({"email": email})
     if not invited_user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -625,12 +1018,12 @@ async def invite_to_group(
         raise HTTPException(status_code=400, detail="User already in group")
     
     # Add user to group
-    await db.groups.update_one(
+    await res.db.groups.update_one(
         {"id": group_id},
         {"$push": {"member_ids": invited_user['id']}}
     )
     
-    await db.users.update_one(
+    await res.db.users.update_one(
         {"id": invited_user['id']},
         {"$push": {"group_ids": group_id}}
     )
@@ -640,40 +1033,88 @@ async def invite_to_group(
 @api_router.get("/groups/{group_id}/members")
 async def get_group_members(
     group_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources),
+    users: UserLoader = Depends(get_user_loader)
 ):
     # Verify user is in group
-    group = await db.groups.find_one({"id": group_id, "member_ids": current_user.id})
+    group = await res.db.groups.find_one({"id": group_id, "member_ids": current_user.id})
     if not group:
         raise HTTPException(status_code=403, detail="Not a member of this group")
     
-    # Get all members
-    members = await db.users.find(
-        {"id": {"$in": group['member_ids']}},
-        {"_id": 0, "id": 1, "full_name": 1, "email": 1}
-    ).to_list(1000)
+    # Get all members (cached profiles, one query for the rest)
+    profiles = await users.load_many(group['member_ids'])
+    
+    return [profiles[member_id] for member_id in group['member_ids'] if member_id in profiles]
+
+@api_router.get("/groups/{group_id}/free-slots")
+async def get_group_free_slots(
+    group_id: str,
+    start: Optional[datetime] = None,
+    days: int = Query(7, ge=1, le=31),
+    duration_minutes: int = Query(60, ge=15, le=24 * 60),
+    day_start_hour: int = Query(8, ge=0, le=23),
+    day_end_hour: int = Query(22, ge=1, le=24),
+    tz_offset_minutes: int = Query(0, ge=-14 * 60, le=14 * 60),
+    limit: int = Query(10, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
+):
+    """Windows when no member is busy, best first (closest before deadlines members share)"""
+    from study_slots import free_slots
+
+    group = await res.db.groups.find_one({"id": group_id, "member_ids": current_user.id}, {"_id": 0, "member_ids": 1})
+    if not group:
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+    if day_end_hour <= day_start_hour:
+        raise HTTPException(status_code=400, detail="day_end_hour must be after day_start_hour")
+    
+    # Default to the start of the next quarter hour, so repeated calls share a cache entry
+    if start is None:
+        now = datetime.now(timezone.utc)
+        start = now.replace(minute=now.minute // 15 * 15, second=0, microsecond=0) + timedelta(minutes=15)
+    elif start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    start = start.astimezone(timezone.utc)
     
-    return members
+    member_ids = group['member_ids']
+    key = (group_id, start, days, duration_minutes, day_start_hour, day_end_hour, tz_offset_minutes, limit)
+    result = res.free_slots.get(key, member_ids)
+    if result is None:
+        result = await free_slots(
+            res.db, member_ids, start, start + timedelta(days=days),
+            duration_minutes=duration_minutes,
+            day_start_hour=day_start_hour,
+            day_end_hour=day_end_hour,
+            tz_offset_minutes=tz_offset_minutes,
+            limit=limit,
+        )
+        res.free_slots.put(key, member_ids, result)
+    return result
 
 # Message routes
 @api_router.get("/groups/{group_id}/messages", response_model=List[Message])
 async def get_group_messages(
     group_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources),
+    users: UserLoader = Depends(get_user_loader)
 ):
     # Verify user is in group
-    group = await db.groups.find_one({"id": group_id, "member_ids": current_user.id})
+    group = await res.db.groups.find_one({"id": group_id, "member_ids": current_user.id})
     if not group:
         raise HTTPException(status_code=403, detail="Not a member of this group")
     
-    messages = await db.messages.find(
-        {"group_id": group_id},
-        {"_id": 0}
-    ).sort("created_at", 1).to_list(1000)
+    # The newest MESSAGE_HISTORY_LIMIT messages, oldest first
+    messages = await res.messages.recent(group_id)
+    # Authors' current names, not the ones copied in when they wrote
+    authors = await users.load_many(message['user_id'] for message in messages)
     
     for message in messages:
         if isinstance(message['created_at'], str):
             message['created_at'] = datetime.fromisoformat(message['created_at'])
+        if message['user_id'] in authors:
+            message['user_name'] = authors[message['user_id']]['full_name']
     
     return messages
 
@@ -681,10 +1122,19 @@ async def get_group_messages(
 async def create_message(
     group_id: str,
     message_data: MessageCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
 ):
-    # Verify user is in group
-    group = await db.groups.find_one({"id": group_id, "member_ids": current_user.id})
+    from pymongo import ReturnDocument
+
+    # Verify membership and allocate the next per-group sequence number in one
+    # atomic update, so concurrent posts never share a seq
+    group = await res.db.groups.find_one_and_update(
+        {"id": group_id, "member_ids": current_user.id},
+        {"$inc": {"message_seq": 1}},
+        projection={"_id": 0, "message_seq": 1},
+        return_document=ReturnDocument.AFTER
+    )
     if not group:
         raise HTTPException(status_code=403, detail="Not a member of this group")
     
@@ -692,44 +1142,290 @@ async def create_message(
         group_id=group_id,
         user_id=current_user.id,
         user_name=current_user.full_name,
-        content=message_data.content
+        content=message_data.content,
+        seq=group['message_seq']
     )
     
     doc = message.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     
-    await db.messages.insert_one(doc)
+    try:
+        await res.messages.append(doc)
+    except Exception:
+        # The seq is spent but has no message; replay buffers must not wait for it
+        await res.skip_seq(group_id, message.seq)
+        raise
+    
+    # Unread counts and read cursors stop at the highest stored seq, so a seq
+    # whose insert failed never shows up as unread. The sender has read
+    # everything up to their own message.
+    await res.db.groups.update_one(
+        {"id": group_id},
+        {"$max": {"last_message_seq": message.seq, f"read_seq.{current_user.id}": message.seq}}
+    )
     
     # Broadcast to WebSocket connections
-    await manager.broadcast(message.model_dump(mode='json'), group_id)
+    payload = message.model_dump(mode='json')
+    await res.broadcast(group_id, payload)
+    if res.presence is not None:
+        # Sending a message ends the sender's typing indicator
+        await res.presence.typing(group_id, current_user.id, False)
     
     return message
 
+# Read cursors
+async def mark_read(db, group_id: str, user_id: str, seq: int):
+    """Move the user's read cursor forward to ``seq`` (never backwards, never
+    past the last stored message). Returns the updated group, or None if nothing matched."""
+    from pymongo import ReturnDocument
+
+    return await db.groups.find_one_and_update(
+        {"id": group_id, "member_ids": user_id, "last_message_seq": {"$gte": seq}},
+        {"$max": {f"read_seq.{user_id}": seq}},
+        projection={"_id": 0, "last_message_seq": 1, f"read_seq.{user_id}": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+@api_router.post("/groups/{group_id}/read")
+async def mark_group_read(
+    group_id: str,
+    cursor: ReadCursorUpdate,
+    current_user: User = Depends(get_current_user),
+    res: Resources = Depends(get_resources)
+):
+    """Acknowledge messages up to ``seq`` (or all of them)"""
+    group = await res.db.groups.find_one(
+        {"id": group_id, "member_ids": current_user.id},
+        {"_id": 0, "last_message_seq": 1}
+    )
+    if not group:
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+    
+    last_seq = group.get('last_message_seq', 0)
+    seq = last_seq if cursor.seq is None else min(cursor.seq, last_seq)
+    updated = await mark_read(res.db, group_id, current_user.id, seq) or group
+    last_read_seq = updated.get('read_seq', {}).get(current_user.id, 0)
+    message_seq = updated.get('last_message_seq', 0)
+    
+    return {
+        "group_id": group_id,
+        "last_read_seq": last_read_seq,
+        "unread_count": max(0, message_seq - last_read_seq)
+    }
+
 # WebSocket route for real-time chat
-@app.websocket("/ws/groups/{group_id}")
-async def websocket_endpoint(websocket: WebSocket, group_id: str):
-    await manager.connect(websocket, group_id)
+@root_router.websocket("/ws/groups/{group_id}")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    group_id: str,
+    token: Optional[str] = None,
+    last_seen_seq: Optional[int] = None
+):
+    res = websocket.app.state.resources
+    manager = res.manager
+    # Acks ({"type": "ack", "seq": N}) and typing frames ({"type": "typing",
+    # "typing": true|false}) are only accepted from authenticated sockets
+    user_id = token_subject(token, res.settings) if token else None
+    await manager.connect(websocket, group_id, user_id)
+    # Only members show up as online and get missed messages replayed
+    member = None
+    if user_id is not None and (res.presence is not None or last_seen_seq is not None):
+        member = await res.db.groups.find_one(
+            {"id": group_id, "member_ids": user_id}, {"_id": 0, "last_message_seq": 1}
+        )
+    present = member is not None and res.presence is not None
+    joined = False
     try:
+        if member is not None and last_seen_seq is not None:
+            await replay_missed(
+                websocket, res.replay, res.messages, group_id, last_seen_seq, member.get("last_message_seq", 0)
+            )
+        if present:
+            await res.presence.join(group_id, user_id)
+            joined = True
+            await websocket.send_json(await res.presence.state(group_id))
+        if user_id is not None and res.settings.reminders.enabled:
+            await flush_reminders(res.db, user_id, manager.send_to_user)
         while True:
             data = await websocket.receive_text()
-            # Keep connection alive, actual messages sent via REST API
+            # Actual messages are sent via REST API; frames are keep-alives, acks or typing
+            if user_id is None or '"type"' not in data:
+                continue
+            try:
+                frame = json.loads(data)
+                frame_type = frame["type"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if frame_type == "typing":
+                if present:
+                    await res.presence.typing(group_id, user_id, bool(frame.get("typing")))
+            elif frame_type == "ack":
+                try:
+                    seq = int(frame["seq"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if seq >= 0:
+                    await mark_read(res.db, group_id, user_id, seq)
     except WebSocketDisconnect:
-        manager.disconnect(websocket, group_id)
+        pass
+    finally:
+        # Also on errors (a failed send, Mongo during replay or an ack), or
+        # the socket leaks and the user shows online until the TTL
+        manager.disconnect(websocket, group_id, user_id)
+        if joined:
+            await res.presence.leave(group_id, user_id)
+
+# Per-user WebSocket for notifications (deadline reminders)
+@root_router.websocket("/ws/notifications")
+async def notifications_websocket(websocket: WebSocket, token: Optional[str] = None):
+    res = websocket.app.state.resources
+    user_id = token_subject(token, res.settings) if token else None
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await res.manager.connect(websocket, None, user_id)
+    try:
+        if res.settings.reminders.enabled:
+            await flush_reminders(res.db, user_id, res.manager.send_to_user)
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        res.manager.disconnect(websocket, None, user_id)
+
+# Reminder routes
+@api_router.get("/reminders")
+async def get_pending_reminders(current_user: User = Depends(get_current_user), res: Resources = Depends(get_resources)):
+    """Reminders queued while the user was offline; returned once, then removed"""
+    from reminders import take_pending
+
+    if not res.settings.reminders.enabled:
+        return []
+    return await take_pending(res.db, current_user.id)
+
+# Debug routes (only answer when DEBUG_TOKEN is set)
+def require_debug_token(request: Request, x_debug_token: Optional[str] = Header(default=None)):
+    expected = request.app.state.settings.debug_token
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_debug_token or not hmac.compare_digest(x_debug_token, expected):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+@api_router.get("/debug/profiling", dependencies=[Depends(require_debug_token)])
+async def get_profiling(res: Resources = Depends(get_resources)):
+    return res.profiler.settings.as_dict()
+
+@api_router.patch("/debug/profiling", dependencies=[Depends(require_debug_token)])
+async def update_profiling(update: ProfilingUpdate, res: Resources = Depends(get_resources)):
+    """Change profiling settings at runtime, no restart needed"""
+    res.profiler.apply(**update.model_dump(exclude_none=True))
+    return res.profiler.settings.as_dict()
+
+@api_router.get("/debug/slow", dependencies=[Depends(require_debug_token)])
+async def get_slow_traces(res: Resources = Depends(get_resources)):
+    """Recent slow requests (with stack samples), slow Mongo commands and loop stalls"""
+    return res.profiler.snapshot()
+
+@api_router.delete("/debug/slow", dependencies=[Depends(require_debug_token)])
+async def clear_slow_traces(res: Resources = Depends(get_resources)):
+    res.profiler.clear()
+    return {"message": "Slow traces cleared"}
+
+# Prometheus scrape endpoint
+@root_router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# Application factory
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    resources = app.state.resources
+    await resources.open()
+    try:
+        yield
+    finally:
+        await resources.close()
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Build an app instance; nothing is connected until its lifespan starts"""
+    settings = settings or Settings.from_env()
+    app = FastAPI(lifespan=lifespan)
+    profiler = Profiler(settings.profiling)
+    app.state.settings = settings
+    app.state.resources = Resources(settings, profiler)
+
+    # Response compression (gzip always; brotli/zstd when installed)
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_min_size,
+        offload_size=settings.compression_offload_size,
+        levels=settings.compression_levels,
+    )
 
-# Include the router in the main app
-app.include_router(api_router)
+    # Rate limiting (per IP for auth, per user for authenticated routes)
+    def rate_limit_user_key(token: str) -> Optional[str]:
+        return token_subject(token, settings)
+
+    app.add_middleware(
+        RateLimitMiddleware,
+        rules=[
+            RateLimitRule("POST", "/api/auth/login", settings.rate_limit_login, key="ip"),
+            RateLimitRule("POST", "/api/auth/register", settings.rate_limit_register, key="ip"),
+            RateLimitRule("POST", "/api/lms/sync", settings.rate_limit_lms_sync, key="user"),
+            RateLimitRule("POST", "/api/groups/{group_id}/messages", settings.rate_limit_messages, key="user"),
+        ],
+        backend=(
+            RedisRateLimitBackend(settings.rate_limit_redis_url)
+            if settings.rate_limit_redis_url else InMemoryRateLimitBackend()
+        ),
+        user_key=rate_limit_user_key,
+        trust_forwarded=settings.rate_limit_trust_forwarded,
+    )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+    # Slow-request profiling (inert unless enabled, see /api/debug/profiling)
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+    # Metrics (so rate-limited requests are counted too)
+    app.add_middleware(MetricsMiddleware)
+
+    # CORS (outermost, so 429s and errors from the middleware above carry
+    # the headers the browser needs to read them)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,       # only allow these origins
+        allow_credentials=True,
+        allow_methods=["*"],         # GET, POST, etc.
+        allow_headers=["*"],         # allow headers
+        expose_headers=["Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining"],
+    )
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+    # Include the routers in the main app
+    app.include_router(api_router)
+    app.include_router(root_router)
+    return app
+
+def configure_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+def __getattr__(name: str):
+    # `uvicorn server:app` asks for `app`; build it (reading .env) on first
+    # access so a plain `import server` has no side effects
+    if name == "app":
+        configure_logging()
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    app = __getattr__("app")
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        ws_per_message_deflate=app.state.settings.ws_per_message_deflate,
+    )
@@ -0,0 +1,197 @@
+"""Common free time for a study group.
+
+``free_slots`` loads every member's busy blocks and open assignments with one
+``$in`` query each, adds the hours outside ``[day_start_hour, day_end_hour)``
+as busy time, and sweeps the sorted interval endpoints once to find the
+stretches where nobody is busy. Stretches shorter than ``duration_minutes``
+are dropped. The rest are ranked by how close they come before deadlines
+that several members share: an assignment counts as shared when members have
+the same Canvas item (``course_key`` + ``canvas_id``) or the same course and
+title. A window a day before a deadline the whole group shares outranks one a
+week before a deadline only two members have.
+
+Results are cached per group and query. A cached answer is reused while the
+member list and every member's schedule version are unchanged; writes to a
+member's assignments or busy blocks bump their version on this worker. Other
+workers (and Canvas due date changes) catch up within ``ttl_seconds``.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import metrics
+
+slot_cache_lookups = metrics.REGISTRY.counter(
+    "free_slot_cache_lookups_total", "Free-slot cache lookups by outcome.", ("result",)
+)
+
+
+def _parse(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class FreeSlotCache:
+    def __init__(self, maxsize: int = 1000, ttl_seconds: float = 60):
+        from cachetools import TTLCache
+
+        self.results = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self.versions: Dict[str, int] = {}
+
+    def bump(self, user_id: str) -> None:
+        """A member's assignments or busy blocks changed."""
+        self.versions[user_id] = self.versions.get(user_id, 0) + 1
+
+    def _stamp(self, member_ids: Iterable[str]) -> Tuple:
+        return tuple((user_id, self.versions.get(user_id, 0)) for user_id in member_ids)
+
+    def get(self, key: Tuple, member_ids: List[str]) -> Optional[dict]:
+        cached = self.results.get(key)
+        if cached is not None and cached[0] == self._stamp(member_ids):
+            slot_cache_lookups.inc("hit")
+            return cached[1]
+        slot_cache_lookups.inc("miss")
+        return None
+
+    def put(self, key: Tuple, member_ids: List[str], result: dict) -> None:
+        self.results[key] = (self._stamp(member_ids), result)
+
+
+def off_hours(start: datetime, end: datetime, day_start_hour: int, day_end_hour: int, tz_offset_minutes: int):
+    """Busy intervals covering the hours outside the allowed day, in UTC."""
+    offset = timedelta(minutes=tz_offset_minutes)
+    local_day = (start + offset).replace(hour=0, minute=0, second=0, microsecond=0)
+    intervals = []
+    while local_day - offset < end:
+        day = local_day - offset
+        intervals.append((day, day + timedelta(hours=day_start_hour)))
+        intervals.append((day + timedelta(hours=day_end_hour), day + timedelta(days=1)))
+        local_day += timedelta(days=1)
+    return intervals
+
+
+def common_free(busy: List[Tuple[datetime, datetime]], start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """Sweep the busy intervals in start order; the gaps are free for everyone."""
+    free = []
+    cursor = start
+    for busy_start, busy_end in sorted(busy):
+        if busy_end <= cursor:
+            continue
+        if busy_start >= end:
+            break
+        if busy_start > cursor:
+            free.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        free.append((cursor, end))
+    return free
+
+
+def shared_deadlines(assignments: List[dict], member_count: int) -> List[dict]:
+    """Open assignments grouped across members, with the share of the group that has them."""
+    deadlines: Dict[Tuple, dict] = {}
+    for assignment in assignments:
+        if assignment.get("course_key"):
+            key = ("canvas", assignment["course_key"], assignment.get("canvas_id"))
+        else:
+            key = ("title", (assignment.get("course_name") or "").lower(), (assignment.get("title") or "").lower())
+        due = _parse(assignment["due_date"])
+        deadline = deadlines.get(key)
+        if deadline is None:
+            deadline = deadlines[key] = {
+                "title": assignment.get("title", ""),
+                "course_name": assignment.get("course_name", ""),
+                "due": due,
+                "members": set(),
+            }
+        deadline["due"] = min(deadline["due"], due)
+        deadline["members"].add(assignment["user_id"])
+    shared = [d for d in deadlines.values() if len(d["members"]) >= min(2, member_count)]
+    for deadline in shared:
+        deadline["share"] = len(deadline["members"]) / member_count
+    shared.sort(key=lambda d: d["due"])
+    return shared
+
+
+def score(window_start: datetime, deadlines: List[dict]) -> Tuple[float, List[dict]]:
+    """Sum of each later shared deadline's share, damped by days of lead time."""
+    total = 0.0
+    reasons = []
+    for deadline in deadlines:
+        if deadline["due"] <= window_start:
+            continue
+        lead_days = (deadline["due"] - window_start).total_seconds() / 86400
+        weight = deadline["share"] / (1 + lead_days)
+        total += weight
+        reasons.append((weight, deadline))
+    reasons.sort(key=lambda r: -r[0])
+    return total, [deadline for _, deadline in reasons[:3]]
+
+
+async def free_slots(
+    db,
+    member_ids: List[str],
+    start: datetime,
+    end: datetime,
+    duration_minutes: int = 60,
+    day_start_hour: int = 8,
+    day_end_hour: int = 22,
+    tz_offset_minutes: int = 0,
+    limit: int = 10,
+) -> dict:
+    from canvas_catalog import hydrate
+
+    # Stored timestamps are ISO strings in whatever offset they arrived with;
+    # pad the string range by a day and compare exact instants below
+    low = (start - timedelta(days=1)).isoformat()
+    high = (end + timedelta(days=8)).isoformat()
+    blocks, assignments = await asyncio.gather(
+        db.busy_blocks.find(
+            {"user_id": {"$in": member_ids}, "end": {"$gt": low}, "start": {"$lt": high}},
+            {"_id": 0, "start": 1, "end": 1}
+        ).to_list(None),
+        db.assignments.find(
+            {"user_id": {"$in": member_ids}, "due_date": {"$gte": low, "$lt": high}, "completed": {"$ne": True}},
+            {"_id": 0, "user_id": 1, "title": 1, "course_name": 1, "due_date": 1, "course_key": 1, "canvas_id": 1}
+        ).to_list(None),
+    )
+
+    busy = [(_parse(b["start"]), _parse(b["end"])) for b in blocks]
+    busy.extend(off_hours(start, end, day_start_hour, day_end_hour, tz_offset_minutes))
+    minimum = timedelta(minutes=duration_minutes)
+    windows = [(s, e) for s, e in common_free(busy, start, end) if e - s >= minimum]
+
+    deadlines = shared_deadlines(
+        [a for a in await hydrate(db, assignments) if _parse(a["due_date"]) > start],
+        len(member_ids),
+    )
+    ranked = []
+    for window_start, window_end in windows:
+        value, reasons = score(window_start, deadlines)
+        ranked.append({
+            "start": window_start.isoformat(),
+            "end": window_end.isoformat(),
+            "minutes": int((window_end - window_start).total_seconds() // 60),
+            "score": round(value, 4),
+            "deadlines": [
+                {
+                    "title": d["title"],
+                    "course_name": d["course_name"],
+                    "due_date": d["due"].isoformat(),
+                    "members": len(d["members"]),
+                }
+                for d in reasons
+            ],
+        })
+    ranked.sort(key=lambda slot: (-slot["score"], slot["start"]))
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "members": len(member_ids),
+        "slots": ranked[:limit],
+    }
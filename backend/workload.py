@@ -0,0 +1,194 @@
+"""Per-student workload summary: assignments due per day and course.
+
+``workload_buckets`` holds one small document per ``(user_id, day, course)``
+with ``due`` and ``completed`` counters. Assignment writes (create, toggle,
+delete, LMS sync) adjust the affected buckets with ``$inc``, so
+``GET /api/analytics/workload`` reads one document per bucket in the
+requested range instead of every assignment.
+
+A summary is (re)built from scratch with pandas when it is missing (students
+who had assignments before the summary existed) or was invalidated because
+Canvas moved due dates in a shared course (see ``canvas_catalog``). A
+``workload_summaries`` marker records that a student's buckets are complete
+(``built_at``), plus the Canvas courses they cover and a count of assignment
+writes.
+
+Rebuilds are idempotent: each bucket is upserted with ``$set``, so two first
+reads racing each other write the same values instead of colliding on the
+unique bucket index. A rebuild only marks the summary built if no assignment
+write was counted while it ran; otherwise its buckets may have missed that
+write and the next read rebuilds again.
+
+Days are UTC calendar days of the due date.
+"""
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def bucket_day(due_date) -> str:
+    if isinstance(due_date, str):
+        due_date = datetime.fromisoformat(due_date.replace("Z", "+00:00"))
+    if due_date.tzinfo is None:
+        due_date = due_date.replace(tzinfo=timezone.utc)
+    return due_date.astimezone(timezone.utc).date().isoformat()
+
+
+def bucket_course(assignment: dict) -> str:
+    return assignment.get("course_name") or ""
+
+
+async def record(db, user_id: str, changes: Iterable[Tuple[dict, int, int]]) -> None:
+    """Apply ``(assignment, due_delta, completed_delta)`` changes to the
+    student's buckets, one upsert per bucket touched."""
+    from pymongo import UpdateOne
+
+    totals: Dict[Tuple[str, str], List[int]] = {}
+    course_keys = set()
+    for assignment, due, completed in changes:
+        key = (bucket_day(assignment["due_date"]), bucket_course(assignment))
+        total = totals.setdefault(key, [0, 0])
+        total[0] += due
+        total[1] += completed
+        if assignment.get("course_key"):
+            course_keys.add(assignment["course_key"])
+
+    # Count the write before touching the buckets, so a rebuild running
+    # meanwhile sees it and does not mark its snapshot complete
+    summary_update = {"$inc": {"writes": 1}}
+    if course_keys:
+        summary_update["$addToSet"] = {"course_keys": {"$each": sorted(course_keys)}}
+    await db.workload_summaries.update_one({"user_id": user_id}, summary_update)
+
+    requests = [
+        UpdateOne(
+            {"user_id": user_id, "day": day, "course": course},
+            {"$inc": {"due": due, "completed": completed}},
+            upsert=True
+        )
+        for (day, course), (due, completed) in totals.items() if due or completed
+    ]
+    if requests:
+        await db.workload_buckets.bulk_write(requests, ordered=False)
+
+
+async def invalidate_course(db, course_key: str) -> None:
+    """Rebuild, on next read, the summary of every student in a course."""
+    await db.workload_summaries.delete_many({"course_keys": course_key})
+
+
+async def rebuild(db, user_id: str) -> bool:
+    """Recompute a student's buckets from their assignments. Returns False if
+    an assignment write landed meanwhile (the summary is left unbuilt)."""
+    import pandas as pd
+    from canvas_catalog import hydrate
+    from pymongo import DeleteOne, ReturnDocument, UpdateOne
+
+    # Create the (unbuilt) summary if needed, so writes from now on are counted
+    summary = await db.workload_summaries.find_one_and_update(
+        {"user_id": user_id},
+        {"$setOnInsert": {"writes": 0}},
+        projection={"_id": 0, "writes": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    writes = summary.get("writes")
+
+    assignments = await db.assignments.find(
+        {"user_id": user_id},
+        {"_id": 0, "due_date": 1, "course_name": 1, "completed": 1, "course_key": 1, "canvas_id": 1}
+    ).to_list(None)
+    assignments = await hydrate(db, assignments)
+
+    buckets = []
+    if assignments:
+        frame = pd.DataFrame({
+            "day": pd.to_datetime([a["due_date"] for a in assignments], utc=True, format="ISO8601").strftime("%Y-%m-%d"),
+            "course": [bucket_course(a) for a in assignments],
+            "completed": [bool(a.get("completed")) for a in assignments],
+        })
+        counts = frame.groupby(["day", "course"], sort=False)["completed"].agg(["size", "sum"])
+        buckets = [
+            {"user_id": user_id, "day": day, "course": course, "due": int(due), "completed": int(completed)}
+            for (day, course), due, completed in zip(counts.index, counts["size"], counts["sum"])
+        ]
+
+    keep = {(bucket["day"], bucket["course"]) for bucket in buckets}
+    existing = await db.workload_buckets.find(
+        {"user_id": user_id}, {"_id": 1, "day": 1, "course": 1}
+    ).to_list(None)
+    requests = [
+        UpdateOne(
+            {"user_id": user_id, "day": bucket["day"], "course": bucket["course"]},
+            {"$set": {"due": bucket["due"], "completed": bucket["completed"]}},
+            upsert=True
+        )
+        for bucket in buckets
+    ] + [DeleteOne({"_id": bucket["_id"]}) for bucket in existing if (bucket["day"], bucket["course"]) not in keep]
+    if requests:
+        await db.workload_buckets.bulk_write(requests, ordered=False)
+
+    # null also matches summaries written before writes were counted
+    built = await db.workload_summaries.update_one(
+        {"user_id": user_id, "writes": writes},
+        {"$set": {
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "course_keys": sorted({a["course_key"] for a in assignments if a.get("course_key")}),
+        }}
+    )
+    return built.matched_count == 1
+
+
+async def workload(db, user_id: str, start: date, days: int) -> dict:
+    """Per-day, per-course due counts and a weekly completion trend."""
+    summary = await db.workload_summaries.find_one(
+        {"user_id": user_id, "built_at": {"$exists": True}}, {"_id": 1}
+    )
+    if summary is None:
+        await rebuild(db, user_id)
+
+    end = start + timedelta(days=days)
+    buckets = await db.workload_buckets.find(
+        {"user_id": user_id, "day": {"$gte": start.isoformat(), "$lt": end.isoformat()}},
+        {"_id": 0, "day": 1, "course": 1, "due": 1, "completed": 1}
+    ).to_list(None)
+
+    by_day = {
+        (start + timedelta(days=i)).isoformat(): {"due": 0, "completed": 0, "courses": {}}
+        for i in range(days)
+    }
+    for bucket in buckets:
+        if bucket["due"] <= 0:
+            continue
+        day = by_day[bucket["day"]]
+        day["due"] += bucket["due"]
+        day["completed"] += bucket["completed"]
+        day["courses"][bucket["course"]] = day["courses"].get(bucket["course"], 0) + bucket["due"]
+
+    weeks = []
+    for i in range(0, days, 7):
+        week = [by_day[(start + timedelta(days=d)).isoformat()] for d in range(i, min(i + 7, days))]
+        due = sum(day["due"] for day in week)
+        completed = sum(day["completed"] for day in week)
+        weeks.append({
+            "week_start": (start + timedelta(days=i)).isoformat(),
+            "due": due,
+            "completed": completed,
+            "completion_rate": round(completed / due, 3) if due else None,
+        })
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "courses": sorted({course for day in by_day.values() for course in day["courses"]}),
+        "days": [{"date": day, **counts} for day, counts in by_day.items()],
+        "weeks": weeks,
+    }
+
+
+def default_start(today: Optional[date] = None) -> date:
+    """Monday of the current week (UTC)."""
+    today = today or datetime.now(timezone.utc).date()
+    return today - timedelta(days=today.weekday())
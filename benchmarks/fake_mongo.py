@@ -0,0 +1,420 @@
+"""In-memory stand-in for the parts of Motor the API uses.
+
+Good enough to run the app in-process for benchmarks without a ``mongod``:
+queries support equality (including array membership), ``$in``/``$nin``,
+comparison operators, ``$exists``, ``$and``/``$or`` and dotted paths; updates
+support ``$set``, ``$setOnInsert``, ``$unset``, ``$inc``, ``$min``, ``$max``,
+``$push`` (with ``$each``/``$slice``), ``$addToSet`` and ``$pull``. Every
+query is a scan, narrowed by a lazily built hash index on the first plain
+equality field, so the stub stays cheap next to the code being measured.
+"""
+import copy
+import itertools
+from types import SimpleNamespace
+
+_ids = itertools.count(1)
+_MISSING = object()
+
+
+def _get(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else _MISSING
+        elif isinstance(value, list):
+            values = [v.get(part, _MISSING) for v in value if isinstance(v, dict)]
+            value = [v for v in values if v is not _MISSING] or _MISSING
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _set(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _candidates(value):
+    if isinstance(value, list):
+        return value + [value]
+    return [value]
+
+
+def _compare(op, actual, expected):
+    if actual is _MISSING:
+        return op in ("$ne", "$nin") or (op == "$exists" and not expected)
+    if op == "$exists":
+        return bool(expected)
+    if op == "$ne":
+        return all(c != expected for c in _candidates(actual))
+    if op == "$nin":
+        return all(c not in expected for c in _candidates(actual))
+    if op == "$in":
+        return any(c in expected for c in _candidates(actual))
+    if op == "$size":
+        return isinstance(actual, list) and len(actual) == expected
+    if op == "$elemMatch":
+        return isinstance(actual, list) and any(isinstance(v, dict) and matches(v, expected) for v in actual)
+    for candidate in _candidates(actual):
+        try:
+            if op == "$gt" and candidate > expected:
+                return True
+            if op == "$gte" and candidate >= expected:
+                return True
+            if op == "$lt" and candidate < expected:
+                return True
+            if op == "$lte" and candidate <= expected:
+                return True
+            if op == "$eq" and candidate == expected:
+                return True
+        except TypeError:
+            continue
+    return False
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+            continue
+        actual = _get(doc, key)
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if not all(_compare(op, actual, expected) for op, expected in condition.items()):
+                return False
+        elif actual is _MISSING:
+            if condition is not None:
+                return False
+        elif not any(c == condition for c in _candidates(actual)):
+            return False
+    return True
+
+
+def project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k: v for k, v in projection.items() if k != "_id" and v}
+    result = {}
+    if include:
+        for path in include:
+            value = _get(doc, path)
+            if value is not _MISSING:
+                _set(result, path, copy.deepcopy(value))
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    result = copy.deepcopy(doc)
+    for path, flag in projection.items():
+        if not flag:
+            _unset(result, path)
+    return result
+
+
+def apply_update(doc, update, inserting=False):
+    for op, fields in update.items():
+        for path, value in fields.items():
+            current = _get(doc, path)
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(doc, path, copy.deepcopy(value))
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$inc":
+                _set(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == "$max":
+                if current is _MISSING or value > current:
+                    _set(doc, path, value)
+            elif op == "$min":
+                if current is _MISSING or value < current:
+                    _set(doc, path, value)
+            elif op in ("$push", "$addToSet"):
+                array = [] if current is _MISSING else current
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                for item in items:
+                    if op == "$push" or item not in array:
+                        array.append(copy.deepcopy(item))
+                if isinstance(value, dict) and "$slice" in value:
+                    limit = value["$slice"]
+                    array = array[limit:] if limit < 0 else array[:limit]
+                _set(doc, path, array)
+            elif op == "$pull":
+                if current is not _MISSING:
+                    if isinstance(value, dict):
+                        _set(doc, path, [v for v in current if not matches(v, value)])
+                    else:
+                        _set(doc, path, [v for v in current if v != value])
+
+
+def _sort_key(spec):
+    def key(doc):
+        values = []
+        for field, direction in spec:
+            value = _get(doc, field)
+            values.append((value is not _MISSING, value if value is not _MISSING else None))
+        return values
+    return key
+
+
+class FakeCursor:
+    def __init__(self, docs, projection):
+        self.docs = docs
+        self.projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        if isinstance(key_or_list, str):
+            self._sort.append((key_or_list, direction or 1))
+        else:
+            self._sort.extend(key_or_list)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def _results(self, length=None):
+        docs = self.docs
+        for field, direction in reversed(self._sort):
+            docs = sorted(docs, key=_sort_key([(field, direction)]), reverse=direction < 0)
+        docs = docs[self._skip:]
+        limit = min(x for x in (self._limit, length) if x) if (self._limit or length) else None
+        if limit is not None:
+            docs = docs[:limit]
+        return [project(d, self.projection) for d in docs]
+
+    async def to_list(self, length=None):
+        return self._results(length)
+
+    def __aiter__(self):
+        self._iter = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self.indexes = {}
+
+    def _scan(self, query):
+        query = query or {}
+        for field, value in query.items():
+            if field.startswith("$") or isinstance(value, (dict, list)) or value is None:
+                continue
+            if field not in self.indexes:
+                index = {}
+                for doc in self.docs:
+                    self._index_doc(index, field, doc)
+                self.indexes[field] = index
+            candidates = self.indexes[field].get(value, ())
+            break
+        else:
+            candidates = self.docs
+        return (d for d in candidates if matches(d, query))
+
+    @staticmethod
+    def _index_doc(index, field, doc):
+        value = _get(doc, field)
+        for key in _candidates(value) if value is not _MISSING else ():
+            try:
+                index.setdefault(key, []).append(doc)
+            except TypeError:
+                pass
+
+    def _changed(self):
+        self.indexes.clear()
+
+    def with_options(self, **kwargs):
+        return self
+
+    async def create_index(self, keys, **kwargs):
+        return str(keys)
+
+    async def create_indexes(self, indexes):
+        return []
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(list(self._scan(query)), projection)
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        if not sort:
+            doc = next(self._scan(query), None)
+            return None if doc is None else project(doc, projection)
+        results = self.find(query, projection).sort(sort).limit(1)._results()
+        return results[0] if results else None
+
+    async def count_documents(self, query=None, **kwargs):
+        return sum(1 for _ in self._scan(query))
+
+    async def insert_one(self, doc):
+        doc.setdefault("_id", next(_ids))
+        stored = copy.deepcopy(doc)
+        self.docs.append(stored)
+        for field, index in self.indexes.items():
+            self._index_doc(index, field, stored)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            await self.insert_one(doc)
+        return SimpleNamespace(inserted_ids=[d["_id"] for d in docs])
+
+    def _upsert_doc(self, query, update):
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        doc["_id"] = next(_ids)
+        apply_update(doc, update, inserting=True)
+        self.docs.append(doc)
+        self._changed()
+        return doc
+
+    async def update_one(self, query, update, upsert=False):
+        for doc in self._scan(query):
+            apply_update(doc, update)
+            self._changed()
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = self._upsert_doc(query, update)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query, update, upsert=False):
+        count = 0
+        for doc in list(self._scan(query)):
+            apply_update(doc, update)
+            count += 1
+        self._changed()
+        if not count and upsert:
+            self._upsert_doc(query, update)
+        return SimpleNamespace(matched_count=count, modified_count=count)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=False, sort=None):
+        candidates = list(self._scan(query))
+        if sort:
+            candidates = FakeCursor(candidates, None).sort(sort)._results()
+            candidates = [d for c in candidates[:1] for d in self.docs if d["_id"] == c["_id"]]
+        if candidates:
+            doc = candidates[0]
+            before = project(doc, projection)
+            apply_update(doc, update)
+            self._changed()
+            return project(doc, projection) if return_document else before
+        if upsert:
+            doc = self._upsert_doc(query, update)
+            return project(doc, projection) if return_document else None
+        return None
+
+    async def delete_one(self, query):
+        for doc in self._scan(query):
+            self.docs.remove(doc)
+            self._changed()
+            return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def find_one_and_delete(self, query, projection=None, sort=None):
+        candidates = list(self._scan(query))
+        if sort:
+            candidates = FakeCursor(candidates, None).sort(sort)._results()
+            candidates = [d for c in candidates[:1] for d in self.docs if d["_id"] == c["_id"]]
+        if not candidates:
+            return None
+        self.docs.remove(candidates[0])
+        self._changed()
+        return project(candidates[0], projection)
+
+    async def delete_many(self, query):
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not matches(d, query)]
+        self._changed()
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            kind = type(request).__name__
+            doc = getattr(request, "_doc", None)
+            if kind == "InsertOne":
+                await self.insert_one(doc)
+            elif kind == "UpdateOne":
+                await self.update_one(request._filter, doc, upsert=bool(request._upsert))
+            elif kind == "UpdateMany":
+                await self.update_many(request._filter, doc, upsert=bool(request._upsert))
+            elif kind == "DeleteOne":
+                await self.delete_one(request._filter)
+            elif kind == "DeleteMany":
+                await self.delete_many(request._filter)
+        return SimpleNamespace(acknowledged=True)
+
+    def aggregate(self, pipeline):
+        raise NotImplementedError("The benchmark Mongo stub does not run aggregation pipelines")
+
+    async def drop(self):
+        self.docs = []
+        self._changed()
+
+
+class FakeDatabase:
+    def __init__(self, name):
+        self.name = name
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name)
+        return self.collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name, **kwargs):
+        return self[name]
+
+    def with_options(self, **kwargs):
+        return self
+
+
+class FakeMotorClient:
+    def __init__(self, *args, **kwargs):
+        self.databases = {}
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = FakeDatabase(name)
+        return self.databases[name]
+
+    async def drop_database(self, name):
+        self.databases.pop(name, None)
+
+    def close(self):
+        pass
@@ -0,0 +1,226 @@
+"""Plumbing for running the API in-process: an ASGI caller, a fake Canvas
+server and a small timing loop."""
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+class Response:
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status_code = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class ASGIClient:
+    """Calls an ASGI app directly, with no sockets or HTTP parsing involved."""
+
+    def __init__(self, app, client=("127.0.0.1", 50000)):
+        self.app = app
+        self.client = client
+
+    async def request(self, method: str, path: str, json_body=None, token: Optional[str] = None, headers=None) -> Response:
+        path, _, query = path.partition("?")
+        body = b"" if json_body is None else json.dumps(json_body).encode()
+        raw_headers = [(b"host", b"testserver")]
+        if json_body is not None:
+            raw_headers.append((b"content-type", b"application/json"))
+            raw_headers.append((b"content-length", str(len(body)).encode()))
+        if token:
+            raw_headers.append((b"authorization", f"Bearer {token}".encode()))
+        for name, value in (headers or {}).items():
+            raw_headers.append((name.lower().encode(), value.encode()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": raw_headers,
+            "client": self.client,
+            "server": ("testserver", 80),
+            "state": {},
+        }
+        sent = False
+        status = 500
+        response_headers = {}
+        chunks = []
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers.update((k.decode(), v.decode()) for k, v in message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return Response(status, response_headers, b"".join(chunks))
+
+
+class FakeCanvasServer:
+    """A local HTTP server answering the two Canvas endpoints sync uses.
+
+    ``latency_ms`` is added to every response to stand in for the network and
+    Canvas itself; requests are served on threads, like a real server would.
+    """
+
+    def __init__(self, courses: int = 5, assignments_per_course: int = 20, latency_ms: float = 0.0):
+        self.courses = [{"id": 1000 + i, "name": f"Course {i}"} for i in range(courses)]
+        self.assignments = {
+            course["id"]: [
+                {
+                    "id": course["id"] * 1000 + j,
+                    "name": f"{course['name']} assignment {j}",
+                    "description": "Read chapters and submit a short write-up.",
+                    "due_at": f"2026-{1 + j % 12:02d}-{1 + j % 28:02d}T23:59:00Z",
+                }
+                for j in range(assignments_per_course)
+            ]
+            for course in self.courses
+        }
+        self.latency = latency_ms / 1000
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-canvas", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        canvas = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                canvas.requests += 1
+                if canvas.latency:
+                    time.sleep(canvas.latency)
+                parts = urlparse(self.path).path.strip("/").split("/")
+                if parts == ["api", "v1", "courses"]:
+                    payload = canvas.courses
+                elif len(parts) == 5 and parts[:3] == ["api", "v1", "courses"] and parts[4] == "assignments":
+                    payload = canvas.assignments.get(int(parts[3]), [])
+                else:
+                    self.send_error(404)
+                    return
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def summarize(name: str, samples, params: Optional[dict] = None, extra: Optional[dict] = None) -> dict:
+    ordered = sorted(samples)
+    result = {
+        "name": name,
+        "params": params or {},
+        "iterations": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 4),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "ops_per_sec": round(len(ordered) / sum(ordered), 2) if sum(ordered) else None,
+    }
+    if extra:
+        result.update(extra)
+    return result
+
+
+async def measure(
+    name: str,
+    operation: Callable[[int], Awaitable],
+    iterations: int,
+    warmup: int = 3,
+    params: Optional[dict] = None,
+    check: Optional[Callable] = None,
+) -> dict:
+    """Time ``operation(i)`` ``iterations`` times after ``warmup`` untimed calls.
+
+    ``check`` gets each result and should raise if the call did not do what
+    the benchmark assumes (a 401 is fast, but it is not a login).
+    """
+    for i in range(warmup):
+        result = await operation(-1 - i)
+        if check:
+            check(result)
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        result = await operation(i)
+        samples.append(time.perf_counter() - started)
+        if check:
+            check(result)
+    return summarize(name, samples, params)
+
+
+def expect_status(status: int):
+    def check(response):
+        if response.status_code != status:
+            raise AssertionError(f"expected {status}, got {response.status_code}: {response.body[:200]!r}")
+    return check
+
+
+def environment() -> dict:
+    import platform
+    import subprocess
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
@@ -0,0 +1,451 @@
+"""End-to-end load generator mixing REST and WebSocket traffic.
+
+Simulates students against a running server: each virtual user logs in (or
+reuses a token, like a returning student), fetches the dashboard, joins its
+study group's WebSocket (acking what it receives) and then, until the stage ends, toggles assignments,
+posts messages through ``POST /api/groups/{id}/messages``, re-reads the
+assignment list and message history with exponential think times. Every
+posted message carries its send time, so each member's socket measures
+end-to-end broadcast delivery latency.
+
+Stages run with increasing user counts so one report shows where p99 crosses
+the SLO:
+
+    # terminal 1: the app with the in-memory Mongo stub (or a real server)
+    python benchmarks/stub_server.py --port 8000
+    # terminal 2
+    python benchmarks/loadgen.py --url http://127.0.0.1:8000 --users 100 500 1000
+
+Every virtual user sends its own ``X-Forwarded-For`` address, so per-IP rate
+limits apply per student when the server runs with
+``RATE_LIMIT_TRUST_FORWARDED=true`` (``stub_server.py`` does).
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import websockets
+from websockets.asyncio.client import connect as ws_connect
+
+from harness import environment
+
+
+class HTTPConnection:
+    """A minimal keep-alive HTTP/1.1 client; one per virtual user, like a browser tab."""
+
+    def __init__(self, host: str, port: int, forwarded_for: str):
+        self.host = host
+        self.port = port
+        self.forwarded_for = forwarded_for
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, json_body=None, token: Optional[str] = None):
+        body = b"" if json_body is None else json.dumps(json_body).encode()
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            f"X-Forwarded-For: {self.forwarded_for}",
+            "Accept: application/json",
+            f"Content-Length: {len(body)}",
+        ]
+        if json_body is not None:
+            lines.append("Content-Type: application/json")
+        if token:
+            lines.append(f"Authorization: Bearer {token}")
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+        for attempt in (1, 2):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                self.writer.write(payload)
+                await self.writer.drain()
+                return await self._read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if not reused or attempt == 2:
+                    raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            body = b"".join(chunks)
+        else:
+            body = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection") == "close":
+            await self.close()
+        return status, body
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.reader = None
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.statuses: Counter = Counter()
+        self.deliveries: List[float] = []
+        self.expected_deliveries = 0
+        self.messages_posted = 0
+        self.ws_failures = 0
+
+    async def call(self, name: str, conn: HTTPConnection, method: str, path: str, json_body=None, token=None):
+        started = time.perf_counter()
+        try:
+            status, body = await conn.request(method, path, json_body, token)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.errors[name] += 1
+            self.statuses[type(e).__name__] += 1
+            return None, None
+        self.latencies[name].append(time.perf_counter() - started)
+        self.statuses[status] += 1
+        if status >= 400:
+            self.errors[name] += 1
+        return status, body
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def latency_summary(samples: List[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p90_ms": round(percentile(ordered, 0.90) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+class VirtualUser:
+    def __init__(self, index: int, base, group_index: int):
+        self.index = index
+        self.email = f"load-{base.run_id}-{index}@example.com"
+        self.password = "load-test-password"
+        self.group_index = group_index
+        self.group_id: Optional[str] = None
+        self.token: Optional[str] = None
+        self.assignment_ids: List[str] = []
+        address = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+        # Browsers fetch the dashboard over a few parallel connections
+        self.conns = [HTTPConnection(base.host, base.port, address) for _ in range(3)]
+        self.conn = self.conns[0]
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        url = urlparse(args.url)
+        self.url = args.url.rstrip("/")
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.ws_url = f"ws://{self.host}:{self.port}"
+        self.run_id = uuid.uuid4().hex[:8]
+        self.users: List[VirtualUser] = []
+        self.connected: Counter = Counter()
+
+    # Setup: register users, create groups, seed assignments
+
+    async def setup(self, count: int) -> float:
+        started = time.perf_counter()
+        setup_stats = Stats()
+        semaphore = asyncio.Semaphore(self.args.setup_concurrency)
+        new = [VirtualUser(i, self, i // self.args.group_size) for i in range(len(self.users), count)]
+        group_ids: Dict[int, str] = {u.group_index: u.group_id for u in self.users}
+        owners = {}
+        for user in new:
+            if user.group_index not in group_ids:
+                owners.setdefault(user.group_index, user)
+
+        async def register(user: VirtualUser):
+            async with semaphore:
+                status, body = await setup_stats.call("register", user.conn, "POST", "/api/auth/register", {
+                    "email": user.email, "password": user.password, "full_name": f"Load Student {user.index}",
+                })
+                if status != 200:
+                    raise RuntimeError(f"register failed with {status}: {body[:200]!r}")
+                user.token = json.loads(body)["access_token"]
+                due = datetime.now(timezone.utc)
+                for i in range(self.args.assignments):
+                    status, body = await setup_stats.call("seed_assignment", user.conn, "POST", "/api/assignments", {
+                        "title": f"Problem set {i}", "course_name": f"Course {i % 4}",
+                        "due_date": (due + timedelta(days=i)).isoformat(),
+                    }, user.token)
+                    if status == 200:
+                        user.assignment_ids.append(json.loads(body)["id"])
+
+        await asyncio.gather(*(register(u) for u in new))
+
+        async def create_group(user: VirtualUser):
+            async with semaphore:
+                status, body = await setup_stats.call("create_group", user.conn, "POST", "/api/groups", {
+                    "name": f"Study group {user.group_index}",
+                }, user.token)
+                if status != 200:
+                    raise RuntimeError(f"group creation failed with {status}: {body[:200]!r}")
+                group_ids[user.group_index] = json.loads(body)["id"]
+
+        await asyncio.gather(*(create_group(u) for u in owners.values()))
+
+        async def join(user: VirtualUser):
+            user.group_id = group_ids[user.group_index]
+            if owners.get(user.group_index) is user:
+                return
+            async with semaphore:
+                await setup_stats.call("join_group", user.conn, "POST", f"/api/groups/{user.group_id}/join",
+                                       token=user.token)
+
+        await asyncio.gather(*(join(u) for u in new))
+        self.users.extend(new)
+        if setup_stats.errors:
+            print(f"setup errors: {dict(setup_stats.errors)}", file=sys.stderr)
+        return time.perf_counter() - started
+
+    # One student's session
+
+    async def session(self, user: VirtualUser, stats: Stats, start_at: float, deadline: float):
+        await asyncio.sleep(max(0.0, start_at - time.perf_counter()))
+        rng = random.Random(user.index)
+        if rng.random() < self.args.login_fraction:
+            status, body = await stats.call("login", user.conn, "POST", "/api/auth/login",
+                                            {"email": user.email, "password": user.password})
+            if status == 200:
+                user.token = json.loads(body)["access_token"]
+
+        # Dashboard: the pages a student lands on fetch these together
+        dashboard = await asyncio.gather(
+            stats.call("me", user.conn, "GET", "/api/auth/me", token=user.token),
+            stats.call("assignments", user.conns[1], "GET", "/api/assignments", token=user.token),
+            stats.call("groups", user.conns[2], "GET", "/api/groups", token=user.token),
+        )
+        if dashboard[1][0] == 200:
+            user.assignment_ids = [a["id"] for a in json.loads(dashboard[1][1])] or user.assignment_ids
+
+        ws = None
+        listener = None
+        started = time.perf_counter()
+        try:
+            ws = await ws_connect(f"{self.ws_url}/ws/groups/{user.group_id}?token={user.token}", open_timeout=30,
+                                  compression=None if self.args.no_ws_compression else "deflate")
+            stats.latencies["ws_connect"].append(time.perf_counter() - started)
+            self.connected[user.group_id] += 1
+            listener = asyncio.create_task(self.listen(ws, stats))
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException):
+            stats.ws_failures += 1
+
+        actions = ["toggle", "message", "assignments", "history"]
+        weights = [self.args.weight_toggle, self.args.weight_message, self.args.weight_assignments,
+                   self.args.weight_history]
+        try:
+            while True:
+                think = rng.expovariate(1 / self.args.think_time)
+                if time.perf_counter() + think >= deadline:
+                    break
+                await asyncio.sleep(think)
+                action = rng.choices(actions, weights)[0]
+                if action == "toggle" and user.assignment_ids:
+                    assignment_id = rng.choice(user.assignment_ids)
+                    await stats.call("toggle_assignment", user.conn, "PATCH",
+                                     f"/api/assignments/{assignment_id}/complete", token=user.token)
+                elif action == "message":
+                    expected = self.connected[user.group_id]
+                    status, _ = await stats.call("post_message", user.conn, "POST",
+                                                 f"/api/groups/{user.group_id}/messages",
+                                                 {"content": f"lg {time.perf_counter():.6f} anyone free to review?"},
+                                                 user.token)
+                    if status == 200:
+                        stats.messages_posted += 1
+                        stats.expected_deliveries += expected
+                elif action == "assignments":
+                    await stats.call("assignments", user.conn, "GET", "/api/assignments", token=user.token)
+                else:
+                    await stats.call("message_history", user.conn, "GET",
+                                     f"/api/groups/{user.group_id}/messages", token=user.token)
+        finally:
+            # Leave time for in-flight broadcasts before hanging up
+            await asyncio.sleep(max(0.0, deadline + self.args.drain - time.perf_counter()))
+            if ws is not None:
+                self.connected[user.group_id] -= 1
+                await ws.close()
+            if listener is not None:
+                listener.cancel()
+            for conn in user.conns:
+                await conn.close()
+
+    async def listen(self, ws, stats: Stats):
+        try:
+            async for raw in ws:
+                received = time.perf_counter()
+                try:
+                    message = json.loads(raw)
+                    content = message.get("content", "")
+                except (ValueError, AttributeError):
+                    continue
+                if isinstance(content, str) and content.startswith("lg "):
+                    stats.deliveries.append(received - float(content.split(" ", 2)[1]))
+                if message.get("seq"):
+                    # The chat is on screen, so the message counts as read
+                    await ws.send(json.dumps({"type": "ack", "seq": message["seq"]}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    # Stages
+
+    async def run_stage(self, users: int) -> dict:
+        setup_seconds = await self.setup(users)
+        stats = Stats()
+        ramp = self.args.ramp
+        now = time.perf_counter()
+        deadline = now + ramp + self.args.duration
+        print(f"stage: {users} users, {ramp:.0f}s ramp + {self.args.duration:.0f}s steady", file=sys.stderr)
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self.session(user, stats, now + ramp * i / users, deadline)
+            for i, user in enumerate(self.users[:users])
+        ))
+        elapsed = time.perf_counter() - started
+        return self.stage_report(users, stats, elapsed, setup_seconds)
+
+    def stage_report(self, users: int, stats: Stats, elapsed: float, setup_seconds: float) -> dict:
+        slo = self.args.slo_p99_ms
+        operations = {}
+        violations = []
+        for name, samples in sorted(stats.latencies.items()):
+            summary = latency_summary(samples)
+            summary["errors"] = stats.errors[name]
+            summary["rps"] = round(len(samples) / elapsed, 2)
+            operations[name] = summary
+            if name not in ("login", "ws_connect") and summary["p99_ms"] > slo:
+                violations.append(name)
+        requests = sum(len(s) for n, s in stats.latencies.items() if n != "ws_connect")
+        broadcast = latency_summary(stats.deliveries)
+        broadcast.update({
+            "messages_posted": stats.messages_posted,
+            "expected_deliveries": stats.expected_deliveries,
+            "delivery_ratio": round(len(stats.deliveries) / stats.expected_deliveries, 4)
+            if stats.expected_deliveries else None,
+        })
+        if broadcast.get("p99_ms", 0) > slo:
+            violations.append("broadcast_delivery")
+        errors = sum(stats.errors.values())
+        return {
+            "users": users,
+            "setup_seconds": round(setup_seconds, 1),
+            "elapsed_seconds": round(elapsed, 1),
+            "requests": requests,
+            "throughput_rps": round(requests / elapsed, 2),
+            "errors": errors,
+            "error_rate": round(errors / requests, 4) if requests else None,
+            "statuses": {str(k): v for k, v in stats.statuses.items()},
+            "ws_failures": stats.ws_failures,
+            "operations": operations,
+            "broadcast": broadcast,
+            "slo": {"p99_ms": slo, "met": not violations and not stats.ws_failures, "violations": violations},
+        }
+
+    async def run(self) -> dict:
+        stages = []
+        for users in sorted(self.args.users):
+            stage = await self.run_stage(users)
+            stages.append(stage)
+            print_stage(stage)
+        within = [s["users"] for s in stages if s["slo"]["met"]]
+        return {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "target": self.url,
+            **environment(),
+            "config": {k: v for k, v in vars(self.args).items() if k not in ("output",)},
+            "stages": stages,
+            "max_users_within_slo": max(within) if within else None,
+        }
+
+
+def print_stage(stage: dict):
+    out = sys.stderr
+    print(f"\n{stage['users']} users: {stage['throughput_rps']} req/s, {stage['errors']} errors, "
+          f"SLO {'met' if stage['slo']['met'] else 'MISSED ' + ','.join(stage['slo']['violations'])}", file=out)
+    print(f"{'operation':<20}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}", file=out)
+    rows = list(stage["operations"].items()) + [("broadcast_delivery", stage["broadcast"])]
+    for name, s in rows:
+        if not s.get("count"):
+            continue
+        print(f"{name:<20}{s['count']:>8}{s['p50_ms']:>10}{s['p90_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}"
+              f"{s.get('errors', ''):>8}", file=out)
+
+
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="base URL of the running server")
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 500, 1000], help="users per stage")
+    parser.add_argument("--duration", type=float, default=60.0, help="steady-state seconds per stage")
+    parser.add_argument("--ramp", type=float, default=20.0, help="seconds over which sessions start")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds sockets stay open after the stage")
+    parser.add_argument("--think-time", type=float, default=5.0, help="mean seconds between a user's actions")
+    parser.add_argument("--group-size", type=int, default=8, help="students per study group")
+    parser.add_argument("--assignments", type=int, default=10, help="assignments seeded per student")
+    parser.add_argument("--login-fraction", type=float, default=0.1,
+                        help="share of sessions that log in with a password (the rest reuse a token)")
+    parser.add_argument("--weight-toggle", type=float, default=2)
+    parser.add_argument("--weight-message", type=float, default=3)
+    parser.add_argument("--weight-assignments", type=float, default=3)
+    parser.add_argument("--weight-history", type=float, default=1)
+    parser.add_argument("--setup-concurrency", type=int, default=16)
+    parser.add_argument("--slo-p99-ms", type=float, default=500.0, help="p99 latency target per operation")
+    parser.add_argument("--no-ws-compression", action="store_true", help="do not offer permessage-deflate")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    raise_file_limit()
+    report = asyncio.run(LoadTest(args).run())
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
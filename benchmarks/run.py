@@ -0,0 +1,318 @@
+"""Offline micro-benchmarks for the API hot paths.
+
+The app is built with ``create_app`` and called in-process through ASGI, so
+numbers reflect our code (routing, validation, serialization, bcrypt, Mongo
+round trips) rather than a network. By default MongoDB is replaced with the
+in-memory stub in ``fake_mongo.py``; pass ``--mongo-uri`` to run against a
+real ``mongod`` (a throwaway database is created and dropped).
+
+    python benchmarks/run.py
+    python benchmarks/run.py --mongo-uri mongodb://localhost:27017
+    python benchmarks/run.py --only assignments broadcast --output after.json
+    python benchmarks/run.py --compare before.json
+
+Results are printed as JSON (or written to ``--output``). With ``--compare``
+each result also gets the relative change of its mean against a previous run.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from harness import ASGIClient, FakeCanvasServer, environment, expect_status, measure
+
+import database
+import server
+from config import Settings
+from fake_mongo import FakeMotorClient
+from starlette.websockets import WebSocket, WebSocketState
+
+PASSWORD = "benchmark-password"
+
+
+class Bench:
+    def __init__(self, app, args):
+        self.app = app
+        self.args = args
+        self.http = ASGIClient(app)
+        self.res = app.state.resources
+        self._password_hash = None
+
+    @property
+    def db(self):
+        return self.res.db
+
+    def iterations(self, default: int) -> int:
+        return max(1, int(default * self.args.scale))
+
+    async def make_user(self, email: str = None):
+        """Insert a user directly and mint a token, skipping bcrypt."""
+        if self._password_hash is None:
+            self._password_hash = server.get_password_hash(PASSWORD)
+        user = server.User(
+            email=email or f"bench-{uuid.uuid4().hex[:12]}@example.com",
+            full_name="Bench User",
+            auth_type="email",
+        )
+        doc = user.model_dump()
+        doc["created_at"] = doc["created_at"].isoformat()
+        doc["hashed_password"] = self._password_hash
+        await self.db.users.insert_one(doc)
+        token = server.create_access_token(
+            {"sub": user.id}, self.res.settings, timedelta(minutes=self.res.settings.access_token_expire_minutes)
+        )
+        return user, token
+
+
+# Benchmarks
+
+async def bench_register(bench):
+    async def register(i):
+        return await bench.http.request("POST", "/api/auth/register", {
+            "email": f"register-{uuid.uuid4().hex[:12]}@example.com",
+            "password": PASSWORD,
+            "full_name": "Bench User",
+        })
+    return [await measure("auth.register", register, bench.iterations(20), check=expect_status(200))]
+
+
+async def bench_login(bench):
+    user, _ = await bench.make_user()
+
+    async def login(i):
+        return await bench.http.request("POST", "/api/auth/login", {"email": user.email, "password": PASSWORD})
+    return [await measure("auth.login", login, bench.iterations(20), check=expect_status(200))]
+
+
+async def bench_current_user(bench):
+    _, token = await bench.make_user()
+
+    async def me(i):
+        return await bench.http.request("GET", "/api/auth/me", token=token)
+    return [await measure("auth.get_current_user", me, bench.iterations(500), check=expect_status(200))]
+
+
+async def bench_assignments(bench):
+    # GET /api/assignments returns at most 1000 rows (server.get_assignments),
+    # so the 10k case measures the capped query over a larger collection:
+    # "stored" is what the user has, "returned" what the route sent back
+    results = []
+    now = datetime.now(timezone.utc)
+    for rows in (100, 1_000, 10_000):
+        user, token = await bench.make_user()
+        docs = []
+        for i in range(rows):
+            assignment = server.Assignment(
+                user_id=user.id,
+                title=f"Assignment {i}",
+                description="Problem set covering the week's lectures.",
+                due_date=now + timedelta(hours=i),
+                source="manual",
+                course_name=f"Course {i % 6}",
+            )
+            doc = assignment.model_dump()
+            doc["due_date"] = doc["due_date"].isoformat()
+            doc["created_at"] = doc["created_at"].isoformat()
+            docs.append(doc)
+        await bench.db.assignments.insert_many(docs)
+
+        async def get_assignments(i):
+            return await bench.http.request("GET", "/api/assignments", token=token)
+        iterations = bench.iterations({100: 200, 1_000: 50, 10_000: 10}[rows])
+        result = await measure("assignments.list", get_assignments, iterations, params={"stored": rows},
+                               check=expect_status(200))
+        result["returned"] = len((await get_assignments(0)).json())
+        results.append(result)
+    return results
+
+
+async def bench_message_history(bench):
+    messages = bench.args.messages
+    user, token = await bench.make_user()
+    group = server.Group(name="Bench group", member_ids=[user.id])
+    doc = group.model_dump()
+    doc["created_at"] = doc["created_at"].isoformat()
+    await bench.db.groups.insert_one(doc)
+    start = datetime.now(timezone.utc) - timedelta(minutes=messages)
+    for i in range(messages):
+        message = server.Message(
+            group_id=group.id,
+            user_id=user.id,
+            user_name=user.full_name,
+            content=f"Message {i}: when are we meeting to go over the lab?",
+            created_at=start + timedelta(minutes=i),
+            seq=i + 1,
+        )
+        message_doc = message.model_dump()
+        message_doc["created_at"] = message_doc["created_at"].isoformat()
+        await bench.res.messages.append(message_doc)
+
+    async def history(i):
+        return await bench.http.request("GET", f"/api/groups/{group.id}/messages", token=token)
+    params = {"messages": messages, "storage": bench.res.settings.messages.mode}
+    return [await measure("messages.history", history, bench.iterations(30), params=params,
+                          check=expect_status(200))]
+
+
+def fake_socket(counter):
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        counter[0] += 1
+
+    websocket = WebSocket({"type": "websocket", "path": "/ws/groups/bench", "headers": []}, receive, send)
+    websocket.client_state = WebSocketState.CONNECTED
+    websocket.application_state = WebSocketState.CONNECTED
+    return websocket
+
+
+async def bench_broadcast(bench):
+    """``ConnectionManager.broadcast`` with Starlette WebSockets whose ASGI
+    send is a no-op, so the cost is ours: per-socket JSON encoding and awaits."""
+    results = []
+    manager = bench.res.manager
+    message = server.Message(
+        group_id="bench", user_id=str(uuid.uuid4()), user_name="Bench User",
+        content="Does anyone have notes from Tuesday?",
+    ).model_dump(mode="json")
+    for sockets in (10, 100, 1_000):
+        counter = [0]
+        group_id = f"broadcast-{sockets}"
+        manager.active_connections[group_id] = [fake_socket(counter) for _ in range(sockets)]
+
+        async def broadcast(i):
+            await manager.broadcast(message, group_id)
+        iterations = bench.iterations({10: 2_000, 100: 300, 1_000: 50}[sockets])
+        result = await measure("websocket.broadcast", broadcast, iterations, params={"sockets": sockets})
+        if counter[0] != (iterations + 3) * sockets:
+            raise AssertionError(f"broadcast reached {counter[0]} sockets")
+        results.append(result)
+        del manager.active_connections[group_id]
+    return results
+
+
+async def bench_canvas_sync(bench):
+    args = bench.args
+    with FakeCanvasServer(args.canvas_courses, args.canvas_assignments, args.canvas_latency_ms) as canvas:
+        async def sync(i):
+            user, token = await bench.make_user()
+            await bench.db.lms_configs.insert_one({
+                "user_id": user.id,
+                "canvas_access_token": "fake-token",
+                "canvas_domain": canvas.url,
+            })
+            return await bench.http.request("POST", "/api/lms/sync", token=token)
+
+        expected = args.canvas_courses * args.canvas_assignments
+
+        def check(response):
+            expect_status(200)(response)
+            if response.json()["synced_count"] != expected:
+                raise AssertionError(f"synced {response.json()['synced_count']} of {expected} assignments")
+        params = {
+            "courses": args.canvas_courses,
+            "assignments_per_course": args.canvas_assignments,
+            "canvas_latency_ms": args.canvas_latency_ms,
+        }
+        result = await measure("lms.canvas_sync", sync, bench.iterations(10), warmup=1, params=params, check=check)
+        # Course lists per sync plus one crawl per course per catalogue TTL
+        result["canvas_requests"] = canvas.requests
+        return [result]
+
+
+BENCHMARKS = {
+    "register": bench_register,
+    "login": bench_login,
+    "current_user": bench_current_user,
+    "assignments": bench_assignments,
+    "messages": bench_message_history,
+    "broadcast": bench_broadcast,
+    "canvas_sync": bench_canvas_sync,
+}
+
+
+# Runner
+
+def build_settings(args) -> Settings:
+    unlimited = "1000000/second"
+    return Settings.from_env({
+        "MONGODB_URI": args.mongo_uri or "mongodb://in-memory-stub",
+        "MONGO_DB_NAME": f"younivity_bench_{os.getpid()}",
+        "JWT_SECRET_KEY": "benchmark-secret",
+        "RATE_LIMIT_LOGIN": unlimited,
+        "RATE_LIMIT_REGISTER": unlimited,
+        "RATE_LIMIT_LMS_SYNC": unlimited,
+        "RATE_LIMIT_MESSAGES": unlimited,
+        "MESSAGE_STORAGE": args.message_storage,
+    })
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in baseline["results"]}
+    for result in results:
+        before = previous.get((result["name"], json.dumps(result["params"], sort_keys=True)))
+        if before and before["mean_ms"]:
+            result["baseline_mean_ms"] = before["mean_ms"]
+            result["change_pct"] = round((result["mean_ms"] - before["mean_ms"]) / before["mean_ms"] * 100, 1)
+
+
+async def run(args) -> dict:
+    if not args.mongo_uri:
+        database.create_client = lambda settings, event_listeners=None: FakeMotorClient()
+    settings = build_settings(args)
+    app = server.create_app(settings)
+    results = []
+    async with app.router.lifespan_context(app):
+        bench = Bench(app, args)
+        try:
+            for name in args.only or BENCHMARKS:
+                print(f"running {name}", file=sys.stderr)
+                results.extend(await BENCHMARKS[name](bench))
+        finally:
+            if args.mongo_uri:
+                await bench.res.client.drop_database(settings.mongo.db_name)
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "mongo": "mongod" if args.mongo_uri else "in-memory stub",
+        "scale": args.scale,
+        **environment(),
+        "results": results,
+    }
+    if args.compare:
+        compare(results, args.compare)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", help="run against this mongod instead of the in-memory stub")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply iteration counts (e.g. 0.1 for a smoke run)")
+    parser.add_argument("--messages", type=int, default=1000, help="messages in the history benchmark group")
+    parser.add_argument("--message-storage", choices=["document", "bucketed"], default="document")
+    parser.add_argument("--canvas-courses", type=int, default=5)
+    parser.add_argument("--canvas-assignments", type=int, default=20, help="assignments per Canvas course")
+    parser.add_argument("--canvas-latency-ms", type=float, default=20.0, help="delay added by the fake Canvas server")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="previous JSON report to compare means against")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
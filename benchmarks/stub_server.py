@@ -0,0 +1,48 @@
+"""Serve the real app over HTTP with the in-memory Mongo stub.
+
+For load tests on a laptop without a ``mongod``. Everything except the
+database is the production code path (uvicorn, middlewares, WebSockets);
+settings come from the environment as usual, with ``MONGODB_URI`` and
+``JWT_SECRET_KEY`` defaulted and forwarded addresses trusted so the load
+generator's per-user ``X-Forwarded-For`` drives the per-IP rate limits.
+
+    python benchmarks/stub_server.py --port 8000
+"""
+import argparse
+import os
+
+import harness  # noqa: F401  (puts backend/ on sys.path)
+
+import database
+from config import Settings, load_env
+from fake_mongo import FakeMotorClient
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    from loadgen import raise_file_limit
+    import server
+
+    raise_file_limit()
+    database.create_client = lambda settings, event_listeners=None: FakeMotorClient()
+    env = load_env()
+    env.setdefault("MONGODB_URI", "mongodb://in-memory-stub")
+    env.setdefault("JWT_SECRET_KEY", os.urandom(16).hex())
+    env.setdefault("RATE_LIMIT_TRUST_FORWARDED", "true")
+    app = server.create_app(Settings.from_env(env))
+    uvicorn.run(
+        app,
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+        ws_per_message_deflate=app.state.settings.ws_per_message_deflate,
+    )
+
+
+if __name__ == "__main__":
+    main()
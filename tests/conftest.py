@@ -0,0 +1,45 @@
+"""Shared fixtures: backend modules on the path and an app over fake Mongo."""
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+for path in (ROOT / "backend", ROOT / "benchmarks"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+TEST_ENV = {
+    "MONGODB_URI": "mongodb://test",
+    "JWT_SECRET_KEY": "test-secret",
+    "PRESENCE_ENABLED": "false",
+    "REMINDERS_ENABLED": "false",
+}
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """``make_client(configure=None, **env)`` returns a started TestClient
+    backed by fake Mongo; ``configure`` can adjust the settings first."""
+    import database
+    from config import Settings
+    from fake_mongo import FakeMotorClient
+    from fastapi.testclient import TestClient
+
+    import server
+
+    monkeypatch.setattr(database, "create_client", lambda settings, event_listeners=None: FakeMotorClient())
+    clients = []
+
+    def make(configure=None, **env):
+        settings = Settings.from_env({**TEST_ENV, **env})
+        if configure is not None:
+            configure(settings)
+        client = TestClient(server.create_app(settings))
+        client.__enter__()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.__exit__(None, None, None)
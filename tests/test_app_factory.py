@@ -0,0 +1,31 @@
+import logging
+
+import server
+
+
+def test_import_builds_no_app():
+    assert "app" not in vars(server)
+
+
+def test_create_app_leaves_logging_alone(monkeypatch):
+    from config import Settings
+
+    calls = []
+    monkeypatch.setattr(logging, "basicConfig", lambda **kwargs: calls.append(kwargs))
+    server.create_app(Settings.from_env({"MONGODB_URI": "mongodb://test", "JWT_SECRET_KEY": "k"}))
+    assert calls == []
+
+
+def test_apps_are_isolated(make_client):
+    first = make_client()
+    second = make_client()
+    assert first.app.state.resources is not second.app.state.resources
+
+    response = first.post(
+        "/api/auth/register",
+        json={"email": "a@example.com", "password": "secret123", "full_name": "A"},
+    )
+    assert response.status_code == 200
+    login = {"email": "a@example.com", "password": "secret123"}
+    assert first.post("/api/auth/login", json=login).status_code == 200
+    assert second.post("/api/auth/login", json=login).status_code == 401
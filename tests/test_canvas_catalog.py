@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+import metrics
+from canvas_catalog import CanvasCatalog, hydrate
+from fake_mongo import FakeDatabase
+
+DOMAIN = "https://canvas.example.edu"
+COURSE = {"id": 7, "name": "Algorithms"}
+
+
+def canvas_response(items, next_url=None):
+    links = {"next": {"url": next_url}} if next_url else {}
+    return SimpleNamespace(status_code=200, json=lambda: items, links=links)
+
+
+def test_crawl_follows_pages_and_skips_unpublished_items():
+    pages = {
+        f"{DOMAIN}/api/v1/courses/7/assignments": canvas_response(
+            [{"id": 1, "name": "HW1", "due_at": "2024-03-01T23:59:00Z"}], next_url="page2"
+        ),
+        "page2": canvas_response([
+            {"id": 2, "name": "Draft", "due_at": None, "published": False},
+            {"id": 3, "name": "HW2", "due_at": None, "published": True},
+        ]),
+    }
+
+    async def fetch(endpoint, url, **kwargs):
+        return pages[url]
+
+    async def scenario():
+        db = FakeDatabase("test")
+        catalog = CanvasCatalog(db, fetch)
+        entry = await catalog.course(DOMAIN, COURSE, {})
+        cached = await catalog.course(DOMAIN, COURSE, {})
+        overlays = [{"course_key": entry["key"], "canvas_id": i} for i in (1, 2, 3)] + [{"title": "manual"}]
+        return entry, cached, await hydrate(db, overlays)
+
+    entry, cached, hydrated = asyncio.run(scenario())
+    assert [a["canvas_id"] for a in entry["assignments"]] == [1, 3]
+    assert entry["assignments"][0]["due_date"] == "2024-03-01T23:59:00+00:00"
+    assert cached == entry
+    assert [(doc.get("canvas_id"), doc["title"]) for doc in hydrated] == [(1, "HW1"), (3, "HW2"), (None, "manual")]
+    assert hydrated[0]["course_name"] == "Algorithms"
+
+
+def test_concurrent_lookups_share_one_crawl():
+    calls = []
+
+    async def fetch(endpoint, url, **kwargs):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        return canvas_response([{"id": 1, "name": "HW1"}])
+
+    async def scenario():
+        catalog = CanvasCatalog(FakeDatabase("test"), fetch)
+        return await asyncio.gather(*(catalog.course(DOMAIN, COURSE, {}) for _ in range(5)))
+
+    entries = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(entry["assignments"] == entries[0]["assignments"] for entry in entries)
+    rendered = metrics.REGISTRY.render()
+    assert 'canvas_catalog_lookups_total{result="shared"}' in rendered
+    assert 'canvas_catalog_lookups_total{result="1"}' not in rendered
+
+
+def test_cancelled_crawl_releases_waiting_callers():
+    async def scenario():
+        crawling = asyncio.Event()
+
+        async def fetch(endpoint, url, **kwargs):
+            crawling.set()
+            await asyncio.sleep(10)
+
+        catalog = CanvasCatalog(FakeDatabase("test"), fetch)
+        owner = asyncio.create_task(catalog.course(DOMAIN, COURSE, {}))
+        await crawling.wait()
+        waiter = asyncio.create_task(catalog.course(DOMAIN, COURSE, {}))
+        await asyncio.sleep(0)
+        owner.cancel()
+        result = await asyncio.wait_for(waiter, 1)
+        return result, owner.cancelled(), catalog.inflight
+
+    result, cancelled, inflight = asyncio.run(scenario())
+    assert result is None  # nothing cached yet
+    assert cancelled
+    assert inflight == {}
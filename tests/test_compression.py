@@ -0,0 +1,91 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from compression import Codec, CompressionMiddleware, negotiate, parse_accept_encoding
+
+CODECS = [Codec("zstd", 3), Codec("br", 4), Codec("gzip", 6)]
+
+
+def test_parse_accept_encoding_reads_q_values():
+    assert parse_accept_encoding("gzip, br;q=0.5, zstd;q=oops, ,identity;q=0") == {
+        "gzip": 1.0, "br": 0.5, "zstd": 0.0, "identity": 0.0,
+    }
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),            # tie: server order
+    ("gzip, br;q=0.5", "gzip"),    # client preference wins
+    ("zstd, br, gzip", "zstd"),
+    ("*", "zstd"),
+    ("*;q=0.2, gzip;q=0.1", "zstd"),
+    ("br;q=0, gzip;q=0", None),
+])
+def test_negotiate(header, expected):
+    codec = negotiate(header, CODECS)
+    assert (codec.name if codec else None) == expected
+
+
+def test_negotiate_only_offers_installed_codecs():
+    assert negotiate("zstd, br", [Codec("gzip", 6)]) is None
+    assert negotiate("zstd, br, gzip;q=0.1", [Codec("gzip", 6)]).name == "gzip"
+
+
+def test_middleware_compresses_large_json_only():
+    big = {"items": ["assignment"] * 500}
+    app = Starlette(routes=[
+        Route("/big", lambda request: JSONResponse(big)),
+        Route("/small", lambda request: JSONResponse({"ok": True})),
+        Route("/text", lambda request: PlainTextResponse("x" * 5000, media_type="image/png")),
+    ])
+    app.add_middleware(CompressionMiddleware, minimum_size=1024, levels={"gzip": 6})
+    client = TestClient(app)
+    headers = {"Accept-Encoding": "gzip"}
+
+    response = client.get("/big", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json() == big
+
+    assert "content-encoding" not in client.get("/small", headers=headers).headers
+    assert "content-encoding" not in client.get("/text", headers=headers).headers
+    assert "content-encoding" not in client.get("/big", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_large_bodies_compress_off_the_event_loop(monkeypatch):
+    import compression
+
+    offloaded = []
+
+    async def run_in_threadpool(func, *args):
+        offloaded.append(len(args[0]))
+        return func(*args)
+
+    monkeypatch.setattr(compression, "run_in_threadpool", run_in_threadpool)
+    app = Starlette(routes=[
+        Route("/big", lambda request: PlainTextResponse("a" * 40000)),
+        Route("/medium", lambda request: PlainTextResponse("a" * 4000)),
+    ])
+    app.add_middleware(CompressionMiddleware, minimum_size=1024, offload_size=32 * 1024)
+    client = TestClient(app)
+
+    assert client.get("/medium", headers={"Accept-Encoding": "gzip"}).text == "a" * 4000
+    assert offloaded == []
+    assert client.get("/big", headers={"Accept-Encoding": "gzip"}).text == "a" * 40000
+    assert offloaded == [40000]
+
+
+@pytest.mark.parametrize("name, module", [("br", "brotli"), ("zstd", "zstandard")])
+def test_optional_codecs_round_trip(name, module):
+    package = pytest.importorskip(module)
+    data = b'{"content": "hello"}' * 100
+    compressed = Codec(name, 3).compress(data)
+    if name == "br":
+        assert package.decompress(compressed) == data
+    else:
+        assert package.ZstdDecompressor().decompress(compressed) == data
@@ -0,0 +1,56 @@
+import sys
+
+import pytest
+from pymongo import MongoClient, ReadPreference
+
+from database import MongoSettings, available_compressors, read_heavy, read_preference
+
+
+def test_from_env_parses_and_defaults():
+    settings = MongoSettings.from_env("mongodb://db", {
+        "MONGO_MAX_POOL_SIZE": "50",
+        "MONGO_WAIT_QUEUE_TIMEOUT_MS": "",
+        "MONGO_COMPRESSORS": " zlib , ,snappy",
+        "MONGO_READ_HEAVY_PREFERENCE": "secondaryPreferred",
+        "MONGO_MAX_STALENESS_SECONDS": "120",
+    })
+    assert settings.uri == "mongodb://db"
+    assert settings.max_pool_size == 50
+    assert settings.wait_queue_timeout_ms == 5_000  # empty falls back to the default
+    assert settings.compressors == ["zlib", "snappy"]
+    assert (settings.read_preference, settings.read_heavy_preference) == ("primary", "secondaryPreferred")
+    assert settings.max_staleness_seconds == 120
+
+    defaults = MongoSettings.from_env("mongodb://db", {})
+    assert (defaults.max_pool_size, defaults.min_pool_size, defaults.max_connecting) == (100, 0, 2)
+    assert defaults.compressors == ["zstd", "snappy", "zlib"]
+
+
+def test_missing_compressor_packages_are_dropped(monkeypatch):
+    # None in sys.modules makes the import fail even if the package is installed
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    monkeypatch.setitem(sys.modules, "snappy", None)
+    assert available_compressors(["zstd", "snappy", "zlib", "lz4"]) == ["zlib"]
+
+    kwargs = MongoSettings("mongodb://db", compressors=["zstd", "zlib"], zlib_level=9).client_kwargs()
+    assert kwargs["compressors"] == "zlib"
+    assert kwargs["zlibCompressionLevel"] == 9
+    assert "compressors" not in MongoSettings("mongodb://db", compressors=["zstd"]).client_kwargs()
+
+
+def test_read_preference_names():
+    assert read_preference("primary") == ReadPreference.PRIMARY
+    assert read_preference("secondaryPreferred", 90).max_staleness == 90
+    with pytest.raises(ValueError):
+        read_preference("anywhere")
+
+
+def test_read_heavy_routes_reads_to_secondaries():
+    db = MongoClient("mongodb://db", connect=False)["test"]
+
+    assert read_heavy(db, MongoSettings("mongodb://db")) is db
+
+    reads = read_heavy(db, MongoSettings("mongodb://db", read_heavy_preference="secondaryPreferred"))
+    assert reads.read_preference.mode == ReadPreference.SECONDARY_PREFERRED.mode
+    assert reads.groups.read_preference.mode == ReadPreference.SECONDARY_PREFERRED.mode
+    assert db.read_preference == ReadPreference.PRIMARY
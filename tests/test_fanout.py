@@ -0,0 +1,161 @@
+import asyncio
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from fanout import InMemoryFanout, RedisFanout
+
+
+class FakeRedisHub:
+    """Just enough of redis.asyncio pub/sub, shared across event loops."""
+
+    def __init__(self):
+        self.subscribers = []  # (loop, queue, channel)
+        self.lock = threading.Lock()
+        self.down = False
+
+    def from_url(self, url):
+        return FakeRedis(self)
+
+
+class FakeRedis:
+    def __init__(self, hub):
+        self.hub = hub
+
+    async def publish(self, channel, data):
+        if self.hub.down:
+            raise ConnectionError("redis is down")
+        with self.hub.lock:
+            subscribers = list(self.hub.subscribers)
+        for loop, queue, subscribed in subscribers:
+            if subscribed == channel:
+                loop.call_soon_threadsafe(queue.put_nowait, {"type": "message", "data": data.encode()})
+        return len(subscribers)
+
+    def pubsub(self):
+        return FakePubSub(self.hub)
+
+    async def aclose(self):
+        pass
+
+
+class FakePubSub:
+    def __init__(self, hub):
+        self.hub = hub
+        self.entry = None
+
+    async def subscribe(self, channel):
+        self.entry = (asyncio.get_running_loop(), asyncio.Queue(), channel)
+        with self.hub.lock:
+            self.hub.subscribers.append(self.entry)
+
+    async def listen(self):
+        while True:
+            yield await self.entry[1].get()
+
+    async def aclose(self):
+        with self.hub.lock:
+            if self.entry in self.hub.subscribers:
+                self.hub.subscribers.remove(self.entry)
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    hub = FakeRedisHub()
+    module = types.ModuleType("redis.asyncio")
+    module.from_url = hub.from_url
+    package = types.ModuleType("redis")
+    package.asyncio = module
+    monkeypatch.setitem(sys.modules, "redis", package)
+    monkeypatch.setitem(sys.modules, "redis.asyncio", module)
+    return hub
+
+
+def recorder():
+    received = []
+
+    async def handler(target, message):
+        received.append((target, message))
+        return 1
+
+    return received, handler
+
+
+def test_in_memory_fanout_delivers_directly():
+    received, handler = recorder()
+    fanout = InMemoryFanout({"group": handler})
+    assert asyncio.run(fanout.publish("group", "g1", {"content": "hi"})) == 1
+    assert received == [("g1", {"content": "hi"})]
+    assert not fanout.shared
+
+
+def test_redis_fanout_reaches_every_worker_once(hub):
+    async def scenario():
+        first, first_handler = recorder()
+        second, second_handler = recorder()
+        workers = [
+            RedisFanout("redis://test", {"group": first_handler}),
+            RedisFanout("redis://test", {"group": second_handler}),
+        ]
+        for worker in workers:
+            worker.start()
+        await asyncio.sleep(0.01)
+        await workers[0].publish("group", "g1", {"content": "hi"})
+        await asyncio.sleep(0.01)
+
+        hub.down = True
+        local = await workers[1].publish("group", "g1", {"content": "fallback"})
+        for worker in workers:
+            await worker.stop()
+        return first, second, local
+
+    first, second, local = asyncio.run(scenario())
+    assert first == [("g1", {"content": "hi"})]
+    assert second == [("g1", {"content": "hi"}), ("g1", {"content": "fallback"})]
+    assert local == 1
+
+
+def test_two_workers_share_chat_and_reminder_updates(hub, monkeypatch, make_client):
+    import database
+    from fake_mongo import FakeMotorClient
+
+    mongo = FakeMotorClient()
+    monkeypatch.setattr(database, "create_client", lambda settings, event_listeners=None: mongo)
+    env = {"FANOUT_REDIS_URL": "redis://test", "REMINDERS_ENABLED": "true", "RATE_LIMIT_REGISTER": "100/second"}
+    owner = make_client(**env)
+    worker = make_client(configure=lambda settings: setattr(settings, "background_jobs", False), **env)
+    engine = owner.app.state.resources.reminders
+    assert engine is not None and worker.app.state.resources.reminders is None
+
+    token = owner.post(
+        "/api/auth/register", json={"email": "w@example.com", "password": "secret123", "full_name": "W"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    group = owner.post("/api/groups", json={"name": "G", "description": ""}, headers=headers).json()["id"]
+
+    # A message posted on one worker reaches a socket on the other
+    with worker.websocket_connect(f"/ws/groups/{group}?token={token}") as socket:
+        posted = owner.post(f"/api/groups/{group}/messages", json={"content": "across"}, headers=headers)
+        assert posted.status_code == 200
+        frame = socket.receive_json()
+        assert frame["content"] == "across" and frame["seq"] == 1
+    assert [m["seq"] for m in worker.app.state.resources.replay.after(group, 0, 1)] == [1]
+
+    # Assignment writes on a worker without the engine reach the engine
+    due = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(time.time() + 2 * 3600))
+    assignment = worker.post("/api/assignments", json={"title": "HW", "due_date": due}, headers=headers).json()
+    assert wait_for(lambda: assignment["id"] in engine.scheduled)
+    worker.patch(f"/api/assignments/{assignment['id']}/complete", headers=headers)
+    assert wait_for(lambda: assignment["id"] not in engine.scheduled)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
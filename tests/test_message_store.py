@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fake_mongo import FakeDatabase
+from message_store import (
+    MessageStoreSettings, archive_document, archived_messages, create_message_store, window,
+)
+
+NOW = datetime(2024, 3, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def message(seq: int, created_at: datetime, group_id: str = "g1") -> dict:
+    return {
+        "id": f"m{seq}", "group_id": group_id, "seq": seq, "user_id": "u1",
+        "user_name": "U", "content": f"hello {seq}", "created_at": created_at.isoformat(),
+    }
+
+
+def test_window_is_aligned_to_bucket_size():
+    assert window("2024-03-10T13:45:00+00:00", 86_400) == (
+        "2024-03-10T00:00:00+00:00", "2024-03-11T00:00:00+00:00"
+    )
+    assert window("2024-03-10T13:45:00+00:00", 3600)[0] == "2024-03-10T13:00:00+00:00"
+
+
+@pytest.mark.parametrize("archive", ["collection", "compressed"])
+def test_archive_document_round_trips(archive):
+    messages = [message(1, NOW), message(2, NOW)]
+    doc = archive_document("g1", messages, MessageStoreSettings(archive=archive))
+    assert (doc["first_seq"], doc["last_seq"], doc["count"]) == (1, 2, 2)
+    assert archived_messages(doc) == messages
+
+
+@pytest.mark.parametrize("mode", ["document", "bucketed"])
+def test_archive_cold_moves_old_messages_and_deletes_by_object_id(mode):
+    async def scenario():
+        db = FakeDatabase("test")
+        store = create_message_store(db, db, MessageStoreSettings(mode=mode, retention_days=7))
+        for seq in range(1, 5):
+            await store.append(message(seq, NOW - timedelta(days=30) + timedelta(minutes=seq)))
+        for seq in range(5, 7):
+            await store.append(message(seq, NOW - timedelta(hours=seq)))
+        # Rows written before a switch to buckets
+        await db.messages.insert_one(message(0, NOW - timedelta(days=40)))
+
+        deletes = []
+        delete_many = db.messages.delete_many
+
+        async def spy(query):
+            deletes.append(query)
+            return await delete_many(query)
+
+        db.messages.delete_many = spy
+        archived = await store.archive_cold(now=NOW)
+        return db, store, archived, deletes
+
+    db, store, archived, deletes = asyncio.run(scenario())
+    assert archived == 5
+    assert deletes and all(list(query) == ["_id"] for query in deletes)
+    kept = asyncio.run(store.recent("g1"))
+    assert sorted(m["seq"] for m in kept) == [5, 6]
+    archive = [m for doc in db.message_archive.docs for m in archived_messages(doc)]
+    assert sorted(m["seq"] for m in archive) == [0, 1, 2, 3, 4]
+    assert all("_id" not in m for m in archive)
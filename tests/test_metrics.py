@@ -0,0 +1,81 @@
+import re
+from collections import Counter as Tally
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text: str):
+    """(name, label names, label values) per sample line, checking the syntax."""
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        labels = LABEL.findall(match.group(3) or "")
+        float(match.group(4))
+        samples.append((match.group(1), tuple(k for k, _ in labels), tuple(v for _, v in labels)))
+    return samples
+
+
+def assert_valid(registry):
+    for metric in registry.metrics:
+        for labels in metric.values:
+            assert len(labels) == len(metric.labelnames), (metric.name, labels)
+    duplicates = [s for s, n in Tally(parse(registry.render())).items() if n > 1]
+    assert duplicates == []
+
+
+def test_counter_and_histogram_render():
+    requests = Counter("t_requests_total", "Requests.", ("method", "status"))
+    requests.inc("GET", "200")
+    requests.inc("GET", "200", amount=2)
+    latency = Histogram("t_latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    latency.observe(0.05, "/a")
+    latency.observe(5, "/a")
+
+    lines = requests.render() + latency.render()
+    assert 't_requests_total{method="GET",status="200"} 3' in lines
+    assert 't_latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 't_latency_seconds_bucket{route="/a",le="+Inf"} 2' in lines
+    assert 't_latency_seconds_count{route="/a"} 2' in lines
+
+
+def test_non_string_labels_are_rejected():
+    hits = Counter("t_hits_total", "Hits.", ("outcome",))
+    with pytest.raises(TypeError):
+        hits.inc(1, "hit")
+    with pytest.raises(TypeError):
+        Histogram("t_sizes", "Sizes.", ("status",)).observe(0.1, 200)
+    assert hits.values == {}
+
+
+def test_labels_are_escaped():
+    errors = Counter("t_errors_total", "Errors.", ("reason",))
+    errors.inc('bad "quote"\nline')
+    assert parse("\n".join(errors.render())) == [("t_errors_total", ("reason",), ('bad \\"quote\\"\\nline',))]
+
+
+def test_app_metrics_are_valid_exposition(make_client):
+    client = make_client(RATE_LIMIT_LOGIN="1/minute")
+    token = client.post(
+        "/api/auth/register", json={"email": "m@example.com", "password": "secret123", "full_name": "M"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    group = client.post("/api/groups", json={"name": "G", "description": ""}, headers=headers).json()["id"]
+    client.post(f"/api/groups/{group}/messages", json={"content": "hi"}, headers=headers)
+    client.get(f"/api/groups/{group}/members", headers=headers)
+    client.get(f"/api/groups/{group}/free-slots", headers=headers)
+    for _ in range(2):
+        client.post("/api/auth/login", json={"email": "m@example.com", "password": "wrong"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_requests_total{method="POST",route="/api/auth/login",status="429"}' in response.text
+    assert_valid(metrics.REGISTRY)
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from presence import InMemoryPresenceBackend, PresenceSettings, PresenceTracker
+
+
+def tracker(backend=None):
+    frames = []
+
+    async def broadcast(message, group_id):
+        frames.append(message)
+
+    return PresenceTracker(broadcast, PresenceSettings(), backend), frames
+
+
+def test_flush_sends_one_frame_per_changed_group():
+    async def scenario():
+        presence, frames = tracker()
+        await presence.join("g1", "a")
+        await presence.join("g1", "b")
+        for _ in range(20):
+            await presence.typing("g1", "a", True)  # throttled to one write
+        first = await presence.flush()
+        unchanged = await presence.flush()
+        presence.dirty.add("g1")
+        still_unchanged = await presence.flush()
+        return frames, first, unchanged, still_unchanged
+
+    frames, first, unchanged, still_unchanged = asyncio.run(scenario())
+    assert (first, unchanged, still_unchanged) == (1, 0, 0)
+    assert frames == [{"type": "presence", "group_id": "g1", "online": ["a", "b"], "typing": ["a"]}]
+
+
+def test_user_stays_online_until_their_last_socket_leaves():
+    async def scenario():
+        presence, frames = tracker()
+        await presence.join("g1", "a")
+        await presence.join("g1", "a")
+        await presence.join("g1", "b")
+        await presence.typing("g1", "a", True)
+        await presence.flush()
+        await presence.leave("g1", "a")
+        after_one = await presence.state("g1")
+        await presence.leave("g1", "a")
+        await presence.flush()
+        return after_one, frames
+
+    after_one, frames = asyncio.run(scenario())
+    assert after_one["online"] == ["a", "b"]
+    assert frames[-1]["online"] == ["b"] and frames[-1]["typing"] == []
+
+
+def test_workers_sharing_a_backend_see_each_other():
+    async def scenario():
+        backend = InMemoryPresenceBackend()
+        first, _ = tracker(backend)
+        second, _ = tracker(backend)
+        await first.join("g1", "a")
+        await second.join("g1", "a")
+        await second.join("g1", "b")
+        await first.leave("g1", "a")  # still connected to the second worker
+        return await first.state("g1")
+
+    assert asyncio.run(scenario())["online"] == ["a", "b"]
+
+
+def test_entries_expire_without_a_leave():
+    async def scenario():
+        presence, _ = tracker()
+        await presence.join("g1", "a")
+        await presence.typing("g1", "a", True)
+        now = time.time()
+        typing_expired = await presence.state("g1", now + presence.settings.typing_ttl_seconds + 1)
+        online_expired = await presence.state("g1", now + presence.settings.ttl_seconds + 1)
+        return typing_expired, online_expired
+
+    typing_expired, online_expired = asyncio.run(scenario())
+    assert (typing_expired["online"], typing_expired["typing"]) == (["a"], [])
+    assert online_expired["online"] == []
@@ -0,0 +1,96 @@
+import asyncio
+
+import metrics
+from fake_mongo import FakeDatabase
+from profiles import ProfileCache, UserLoader
+
+
+def seeded_db():
+    db = FakeDatabase("test")
+    for i in range(3):
+        db.users.docs.append({"id": f"u{i}", "full_name": f"User {i}", "email": f"u{i}@example.com", "password": "x"})
+    queries = []
+    find = db.users.find
+
+    def spy(query=None, projection=None):
+        queries.append(query)
+        return find(query, projection)
+
+    db.users.find = spy
+    return db, queries
+
+
+def test_loads_in_one_tick_share_one_query():
+    async def scenario():
+        db, queries = seeded_db()
+        loader = UserLoader(db, ProfileCache())
+        profiles = await asyncio.gather(loader.load("u0"), loader.load("u1"), loader.load("u0"), loader.load("nobody"))
+        return profiles, queries
+
+    profiles, queries = asyncio.run(scenario())
+    assert [p and p["full_name"] for p in profiles] == ["User 0", "User 1", "User 0", None]
+    assert "password" not in profiles[0]
+    assert len(queries) == 1
+    assert sorted(queries[0]["id"]["$in"]) == ["nobody", "u0", "u1"]
+
+
+def test_cache_is_shared_across_loaders_and_invalidated():
+    async def scenario():
+        db, queries = seeded_db()
+        cache = ProfileCache()
+        await UserLoader(db, cache).load_many(["u0", "u1"])
+        warm = await UserLoader(db, cache).load_many(["u0", "u1"])
+        cache.invalidate("u0")
+        await UserLoader(db, cache).load("u0")
+        return warm, queries
+
+    warm, queries = asyncio.run(scenario())
+    assert sorted(warm) == ["u0", "u1"]
+    assert [q["id"]["$in"] for q in queries] == [["u0", "u1"], ["u0"]]
+    rendered = metrics.REGISTRY.render()
+    assert 'profile_cache_lookups_total{result="hit"}' in rendered
+    assert 'profile_cache_lookups_total{result="miss"}' in rendered
+    assert 'result="2"' not in rendered
+
+
+class SlowCursor:
+    def __init__(self, release, docs):
+        self.release = release
+        self.docs = docs
+
+    async def to_list(self, length=None):
+        await self.release.wait()
+        return self.docs
+
+
+def test_batch_in_flight_is_kept_alive_and_cancellation_reaches_waiters():
+    import gc
+
+    async def scenario():
+        db, _ = seeded_db()
+        release = asyncio.Event()
+        db.users.find = lambda query=None, projection=None: SlowCursor(release, [{"id": "u0", "full_name": "User 0"}])
+        loader = UserLoader(db, ProfileCache())
+        waiter = asyncio.ensure_future(loader.load("u0"))
+        await asyncio.sleep(0.01)
+        gc.collect()
+        in_flight = len(loader.dispatches)
+        release.set()
+        profile = await waiter
+
+        release.clear()
+        other = UserLoader(db, ProfileCache())
+        waiter = asyncio.ensure_future(other.load("u0"))
+        await asyncio.sleep(0.01)
+        next(iter(other.dispatches)).cancel()
+        try:
+            await asyncio.wait_for(waiter, 1)
+            outcome = "result"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+        return in_flight, profile, loader.dispatches, outcome
+
+    in_flight, profile, left, outcome = asyncio.run(scenario())
+    assert in_flight == 1 and left == set()
+    assert profile["full_name"] == "User 0"
+    assert outcome == "cancelled"
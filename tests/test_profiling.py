@@ -0,0 +1,34 @@
+import asyncio
+
+from profiling import Profiler, ProfilingSettings, filter_shape
+
+
+def test_filter_shape_replaces_values_with_types():
+    shape = filter_shape({"user_id": "u1", "due_date": {"$gte": "2024-01-01"}, "id": {"$in": ["a", "b"]}})
+    assert shape == {"user_id": "str", "due_date": {"$gte": "str"}, "id": {"$in": "[2 x str]"}}
+
+
+def test_disabled_profiler_parks_until_enabled():
+    async def scenario():
+        profiler = Profiler(ProfilingSettings(enabled=False, sample_interval_ms=5))
+        ticks = []
+        original_wait = profiler.stopping.wait
+        profiler.stopping.wait = lambda timeout: ticks.append(timeout) or original_wait(timeout)
+
+        profiler.start()
+        await asyncio.sleep(0.1)
+        parked = len(ticks)
+        last_tick = profiler.last_tick
+
+        profiler.apply(enabled=True)
+        await asyncio.sleep(0.1)
+        running = len(ticks) - parked
+        await profiler.stop()
+        profiler.watchdog.join(1)
+        return parked, running, last_tick != profiler.last_tick, profiler.watchdog.is_alive()
+
+    parked, running, monitor_ticked, alive = asyncio.run(scenario())
+    assert parked <= 1
+    assert running > 5
+    assert monitor_ticked
+    assert not alive
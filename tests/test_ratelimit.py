@@ -0,0 +1,80 @@
+import pytest
+
+from ratelimit import InMemoryRateLimitBackend, RateLimitMiddleware, parse_rate
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("10/minute", (10 / 60, 10)),
+    ("5/seconds", (5.0, 5)),
+    ("100/hour", (100 / 3600, 100)),
+    ("3/30", (0.1, 3)),
+])
+def test_parse_rate(spec, expected):
+    rate, burst = parse_rate(spec)
+    assert rate == pytest.approx(expected[0])
+    assert burst == expected[1]
+
+
+def test_take_spends_burst_then_refills():
+    backend = InMemoryRateLimitBackend()
+    results = [backend.take("k", rate=1.0, burst=3, now=0.0) for _ in range(4)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert [r.remaining for r in results[:3]] == [2, 1, 0]
+    assert results[3].retry_after == pytest.approx(1.0)
+
+    assert not backend.take("k", rate=1.0, burst=3, now=0.5).allowed
+    assert backend.take("k", rate=1.0, burst=3, now=1.6).allowed
+    # Refill is capped at the burst
+    assert backend.take("k", rate=1.0, burst=3, now=100.0).remaining == 2
+
+
+def test_take_keys_are_independent_and_lru_bounded():
+    backend = InMemoryRateLimitBackend(max_keys=2)
+    backend.take("a", 1.0, 1, now=0.0)
+    assert backend.take("b", 1.0, 1, now=0.0).allowed
+    assert not backend.take("a", 1.0, 1, now=0.0).allowed
+    backend.take("c", 1.0, 1, now=0.0)
+    assert list(backend.buckets) == ["a", "c"]
+
+
+def test_rejected_request_carries_cors_headers(make_client):
+    client = make_client(RATE_LIMIT_LOGIN="1/minute")
+    origin = {"Origin": "http://localhost:3000"}
+    login = {"email": "nobody@example.com", "password": "wrong"}
+
+    first = client.post("/api/auth/login", json=login, headers=origin)
+    second = client.post("/api/auth/login", json=login, headers=origin)
+
+    assert first.status_code == 401
+    assert second.status_code == 429
+    assert second.headers["access-control-allow-origin"] == "http://localhost:3000"
+    exposed = second.headers["access-control-expose-headers"]
+    assert "Retry-After" in exposed and "X-RateLimit-Remaining" in exposed
+    assert int(second.headers["retry-after"]) >= 1
+
+
+def test_trust_forwarded_defaults_on_behind_a_configured_proxy():
+    from config import Settings
+
+    assert not Settings.from_env({}).rate_limit_trust_forwarded
+    assert Settings.from_env({"FORWARDED_ALLOW_IPS": "*"}).rate_limit_trust_forwarded
+    assert not Settings.from_env(
+        {"FORWARDED_ALLOW_IPS": "*", "RATE_LIMIT_TRUST_FORWARDED": "false"}
+    ).rate_limit_trust_forwarded
+
+
+def test_client_ip_uses_the_address_the_proxy_appended(caplog):
+    from starlette.datastructures import Headers
+
+    scope = {"client": ("10.0.0.1", 1234)}
+    forwarded = Headers({"x-forwarded-for": "1.2.3.4, 203.0.113.9"})
+    trusting = RateLimitMiddleware(None, [], trust_forwarded=True)
+    assert trusting.client_ip(scope, forwarded) == "203.0.113.9"
+
+    direct = RateLimitMiddleware(None, [])
+    assert direct.client_ip(scope, forwarded) == "10.0.0.1"
+    assert direct.client_ip(scope, forwarded) == "10.0.0.1"
+    assert [r.message for r in caplog.records].count(
+        "X-Forwarded-For is set but RATE_LIMIT_TRUST_FORWARDED is off: "
+        "all clients behind the proxy share one rate-limit bucket"
+    ) == 1
@@ -0,0 +1,120 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def register(client, name):
+    response = client.post(
+        "/api/auth/register", json={"email": f"{name}@example.com", "password": "secret123", "full_name": name}
+    )
+    return response.json()["user"]["id"], {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def unread(client, headers, group_id):
+    groups = client.get("/api/groups", params={"unread": "true"}, headers=headers).json()
+    group = next(g for g in groups if g["id"] == group_id)
+    return group["message_seq"], group["last_read_seq"], group["unread_count"]
+
+
+@pytest.fixture
+def chat(make_client):
+    client = make_client(RATE_LIMIT_MESSAGES="1000/second", RATE_LIMIT_REGISTER="100/second")
+    users = {name: register(client, name) for name in ("ann", "bob", "cat")}
+    group_id = client.post("/api/groups", json={"name": "G", "description": ""}, headers=users["ann"][1]).json()["id"]
+    for name in ("bob", "cat"):
+        client.post(f"/api/groups/{group_id}/join", headers=users[name][1])
+    return client, users, group_id
+
+
+def test_concurrent_posts_get_distinct_seqs_and_exact_unread_counts(chat):
+    client, users, group_id = chat
+    store = client.app.state.resources.messages
+    append = store.append
+
+    async def slow_append(doc):
+        # Let inserts finish out of order
+        await asyncio.sleep(random.random() / 100)
+        await append(doc)
+
+    store.append = slow_append
+    posters = ["ann", "bob"] * 10
+
+    def post(name):
+        response = client.post(f"/api/groups/{group_id}/messages", json={"content": "hi"}, headers=users[name][1])
+        return name, response.json()["seq"]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        posted = list(pool.map(post, posters))
+
+    seqs = sorted(seq for _, seq in posted)
+    assert seqs == list(range(1, 21))
+    history = client.get(f"/api/groups/{group_id}/messages", headers=users["cat"][1]).json()
+    assert sorted(m["seq"] for m in history) == seqs
+
+    for name in ("ann", "bob"):
+        last_own = max(seq for poster, seq in posted if poster == name)
+        assert unread(client, users[name][1], group_id) == (20, last_own, 20 - last_own)
+    assert unread(client, users["cat"][1], group_id) == (20, 0, 20)
+
+
+def test_mark_read_clamps_and_never_moves_back(chat):
+    client, users, group_id = chat
+    ann, cat = users["ann"][1], users["cat"][1]
+    for _ in range(5):
+        client.post(f"/api/groups/{group_id}/messages", json={"content": "hi"}, headers=ann)
+
+    read = client.post(f"/api/groups/{group_id}/read", json={"seq": 3}, headers=cat).json()
+    assert (read["last_read_seq"], read["unread_count"]) == (3, 2)
+    read = client.post(f"/api/groups/{group_id}/read", json={"seq": 1}, headers=cat).json()
+    assert read["last_read_seq"] == 3
+    read = client.post(f"/api/groups/{group_id}/read", json={"seq": 99}, headers=cat).json()
+    assert (read["last_read_seq"], read["unread_count"]) == (5, 0)
+
+    bob = users["bob"][1]
+    assert client.post(f"/api/groups/{group_id}/read", json={}, headers=bob).json()["unread_count"] == 0
+    outsider = register(client, "dan")[1]
+    assert client.post(f"/api/groups/{group_id}/read", json={}, headers=outsider).status_code == 403
+
+
+def test_websocket_ack_moves_the_cursor(chat):
+    client, users, group_id = chat
+    ann, cat = users["ann"][1], users["cat"][1]
+    for _ in range(4):
+        client.post(f"/api/groups/{group_id}/messages", json={"content": "hi"}, headers=ann)
+
+    token = cat["Authorization"].split()[1]
+    with client.websocket_connect(f"/ws/groups/{group_id}?token={token}") as socket:
+        for frame in ({"type": "ack", "seq": 2}, {"type": "ack", "seq": 1}, {"type": "ack", "seq": 50},
+                      {"type": "ack", "seq": "x"}):
+            socket.send_json(frame)
+        socket.send_json({"type": "ack", "seq": 3})
+        # Frames are handled in order; a REST round trip after closing sees them all
+    assert unread(client, cat, group_id) == (4, 3, 1)
+
+
+def test_failed_insert_leaves_no_phantom_unread_or_replay_gap(chat):
+    client, users, group_id = chat
+    ann, cat = users["ann"][1], users["cat"][1]
+    res = client.app.state.resources
+    client.post(f"/api/groups/{group_id}/messages", json={"content": "one"}, headers=ann)
+
+    append = res.messages.append
+
+    async def failing_append(doc):
+        raise RuntimeError("insert failed")
+
+    res.messages.append = failing_append
+    with pytest.raises(RuntimeError):
+        client.post(f"/api/groups/{group_id}/messages", json={"content": "lost"}, headers=ann)
+    res.messages.append = append
+
+    # The spent seq 2 is not counted and can be acknowledged away
+    assert unread(client, cat, group_id) == (1, 0, 1)
+    assert client.post(f"/api/groups/{group_id}/read", json={}, headers=cat).json()["unread_count"] == 0
+
+    client.post(f"/api/groups/{group_id}/messages", json={"content": "three"}, headers=ann)
+    assert unread(client, cat, group_id) == (3, 1, 2)
+    # Catch-up across the gap is still served from memory
+    assert [m["seq"] for m in res.replay.after(group_id, 0, 3)] == [1, 3]
@@ -0,0 +1,172 @@
+import asyncio
+from datetime import datetime, timezone
+
+import metrics
+from fake_mongo import FakeDatabase
+from reminders import ReminderEngine, ReminderSettings, acknowledge, flush, take_pending
+
+NOW = datetime(2024, 3, 10, 12, 0, tzinfo=timezone.utc).timestamp()
+HOUR = 3600
+
+
+def assignment(assignment_id: str, due_in_hours: float, **fields) -> dict:
+    due = datetime.fromtimestamp(NOW + due_in_hours * HOUR, timezone.utc).isoformat()
+    return {"id": assignment_id, "user_id": "u1", "title": assignment_id, "course_name": "C", "due_date": due, **fields}
+
+
+def engine(online=("u1",), shared_delivery=False):
+    delivered = []
+
+    async def deliver(user_id, reminder):
+        delivered.append((user_id, reminder["assignment_id"], reminder["minutes_before"]))
+        return 1 if user_id in online else 0
+
+    settings = ReminderSettings(offsets_minutes=[1440, 60], horizon_hours=6)
+    return ReminderEngine(FakeDatabase("test"), deliver, settings, shared_delivery=shared_delivery), delivered
+
+
+def add(reminders, *docs):
+    """Store the assignments and schedule them, as the API does."""
+    for doc in docs:
+        reminders.db.assignments.docs.append(dict(doc))
+        reminders.schedule(doc, now=NOW)
+
+
+def test_schedule_only_pushes_offsets_inside_the_horizon():
+    reminders, _ = engine()
+    reminders.schedule(assignment("soon", 2), now=NOW)        # 60 min offset in 1h
+    reminders.schedule(assignment("tomorrow", 26), now=NOW)   # 1440 min offset in 2h
+    reminders.schedule(assignment("far", 72), now=NOW)        # nothing within 6h
+    assert sorted(reminders.scheduled) == ["soon", "tomorrow"]
+    assert sorted((entry[2], entry[4]) for entry in reminders.heap) == [("soon", 60), ("tomorrow", 1440)]
+
+    reminders.schedule(assignment("soon", 2), now=NOW)  # idempotent
+    assert len(reminders.heap) == 2
+
+
+def test_fire_due_skips_cancelled_and_rescheduled_entries():
+    async def scenario():
+        reminders, delivered = engine()
+        add(reminders, assignment("a", 2), assignment("b", 2), assignment("c", 2))
+        reminders.schedule(assignment("a", 2, completed=True), now=NOW)
+        reminders.schedule(assignment("b", 4), now=NOW)  # moved: fires at +3h instead
+        fired_early = await reminders.fire_due(now=NOW + 1.5 * HOUR)
+        fired_late = await reminders.fire_due(now=NOW + 3.5 * HOUR)
+        return reminders, delivered, fired_early, fired_late
+
+    reminders, delivered, fired_early, fired_late = asyncio.run(scenario())
+    assert (fired_early, fired_late) == (1, 1)
+    assert delivered == [("u1", "c", 60), ("u1", "b", 60)]
+    assert reminders.scheduled == {}
+
+
+def test_fire_due_rechecks_completed_and_deleted_assignments():
+    async def scenario():
+        reminders, delivered = engine()
+        add(reminders, assignment("done", 2), assignment("gone", 2), assignment("open", 2))
+        # Changed without the engine hearing about it (another worker)
+        reminders.db.assignments.docs[0]["completed"] = True
+        del reminders.db.assignments.docs[1]
+        fired = await reminders.fire_due(now=NOW + 1.5 * HOUR)
+        return reminders, delivered, fired
+
+    reminders, delivered, fired = asyncio.run(scenario())
+    assert fired == 1
+    assert delivered == [("u1", "open", 60)]
+    assert reminders.scheduled == {}
+
+
+def test_offline_reminders_are_queued_and_flushed():
+    async def scenario():
+        reminders, delivered = engine(online=())
+        add(reminders, assignment("a", 1.5))
+        await reminders.fire_due(now=NOW + HOUR)
+        queued = [dict(doc) for doc in reminders.db.pending_reminders.docs]
+        sent = []
+
+        async def send(user_id, reminder):
+            sent.append(reminder["assignment_id"])
+            return 1
+
+        flushed = await flush(reminders.db, "u1", send)
+        return queued, flushed, sent, reminders.db.pending_reminders.docs
+
+    queued, flushed, sent, left = asyncio.run(scenario())
+    assert [(r["user_id"], r["assignment_id"], r["minutes_before"]) for r in queued] == [("u1", "a", 60)]
+    assert (flushed, sent, left) == (1, ["a"], [])
+
+
+def test_shared_delivery_queues_first_and_delivering_worker_acknowledges():
+    async def scenario():
+        reminders, delivered = engine(online=(), shared_delivery=True)
+        add(reminders, assignment("a", 1.5), {**assignment("b", 1.5), "user_id": "u2"})
+        await reminders.fire_due(now=NOW + HOUR)
+        queued = len(reminders.db.pending_reminders.docs)
+        # The worker holding u1's socket delivered it; u2 was offline
+        await acknowledge(reminders.db, "u1", {"assignment_id": "a", "minutes_before": 60})
+        return delivered, queued, await take_pending(reminders.db, "u1"), await take_pending(reminders.db, "u2")
+
+    delivered, queued, u1_pending, u2_pending = asyncio.run(scenario())
+    assert sorted(delivered) == [("u1", "a", 60), ("u2", "b", 60)]
+    assert queued == 2
+    assert u1_pending == []
+    assert [r["assignment_id"] for r in u2_pending] == ["b"]
+    assert "expires_at" not in u2_pending[0] and "_id" not in u2_pending[0]
+
+
+def test_fired_reminders_are_counted_by_delivery():
+    async def scenario():
+        reminders, _ = engine(online=("u1",))
+        add(reminders, assignment("a", 1.5), {**assignment("b", 1.5), "user_id": "u2"})
+        await reminders.fire_due(now=NOW + HOUR)
+
+    asyncio.run(scenario())
+    rendered = metrics.REGISTRY.render()
+    assert 'reminders_fired_total{delivery="websocket"}' in rendered
+    assert 'reminders_fired_total{delivery="queued"}' in rendered
+    assert 'delivery="1"' not in rendered
+
+
+def test_restarted_engine_catches_up_on_missed_reminders():
+    async def scenario():
+        first, _ = engine()
+        add(first, assignment("early", 1.5))      # 60 min reminder at +0.5h
+        await first.fire_due(now=NOW + HOUR)      # fired before the restart
+        fired_through = await first.fired_through()
+
+        # Down from +1h to +3h; a new engine starts over the same database
+        second, delivered = engine()
+        second.db = first.db
+        first.db.assignments.docs.extend([
+            assignment("missed", 3.5),            # 60 min reminder at +2.5h
+            assignment("both", 4 + 2 / 60),       # 1440 min long gone; 60 min at +3.03h
+            assignment("overdue", 2.75),          # due during the downtime
+            assignment("two", 25.5),              # 1440 min at +1.5h, 60 min at +24.5h
+        ])
+        await second.load(now=NOW + 3 * HOUR, since=fired_through)
+        fired = await second.fire_due(now=NOW + 3 * HOUR)
+        return fired_through, delivered, fired, second
+
+    fired_through, delivered, fired, second = asyncio.run(scenario())
+    assert fired_through == NOW + HOUR
+    assert sorted(delivered) == [("u1", "missed", 60), ("u1", "two", 1440)]
+    assert fired == 2
+    # "both" still fires on time, "two" keeps its 60 min reminder for later
+    assert sorted(second.scheduled) == ["both", "two"]
+
+
+def test_catch_up_sends_only_the_last_missed_offset():
+    reminders, _ = engine()
+    reminders.schedule(assignment("a", 0.5), now=NOW, since=NOW - 30 * HOUR)
+    assert [(entry[2], entry[4]) for entry in reminders.heap] == [("a", 60)]
+    assert reminders.scheduled["a"].offsets == {1440, 60}
+
+
+def test_first_engine_does_not_fire_past_reminders():
+    async def scenario():
+        reminders, delivered = engine()
+        reminders.db.assignments.docs.append(assignment("a", 0.5))
+        await reminders.load(now=NOW, since=await reminders.fired_through())
+        return delivered, await reminders.fire_due(now=NOW)
+
+    assert asyncio.run(scenario()) == ([], 0)
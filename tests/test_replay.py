@@ -0,0 +1,80 @@
+import asyncio
+
+import metrics
+from replay import ReplayBuffer, replay_missed
+
+
+def msg(seq: int) -> dict:
+    return {"id": f"m{seq}", "seq": seq, "content": str(seq)}
+
+
+def test_after_returns_only_complete_runs():
+    buffer = ReplayBuffer(size=3)
+    for seq in range(1, 6):
+        buffer.append("g", msg(seq))
+    assert [m["seq"] for m in buffer.after("g", 3, 5)] == [4, 5]
+    assert buffer.after("g", 5, 5) == []
+    assert buffer.after("g", 1, 5) is None  # 2 fell out of the buffer
+    assert buffer.after("other", 0, 1) is None
+
+
+def test_least_recently_active_group_is_evicted():
+    buffer = ReplayBuffer(size=2, max_groups=2)
+    buffer.append("a", msg(1))
+    buffer.append("b", msg(1))
+    buffer.append("a", msg(2))
+    buffer.append("c", msg(1))
+    assert list(buffer.groups) == ["a", "c"]
+
+
+class Socket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+
+class Store:
+    def __init__(self, messages, history_limit=10):
+        self.settings = type("Settings", (), {"history_limit": history_limit})()
+        self.messages = messages
+        self.queries = 0
+
+    async def after_seq(self, group_id, seq):
+        self.queries += 1
+        return [m for m in self.messages if m["seq"] > seq]
+
+
+def test_replay_missed_uses_memory_then_database_then_truncates():
+    async def replay(buffer, store, last_seen, latest):
+        socket = Socket()
+        await replay_missed(socket, buffer, store, "g", last_seen, latest)
+        return [m.get("seq") for m in socket.sent[:-1]], socket.sent[-1]
+
+    buffer = ReplayBuffer(size=2)
+    store = Store([msg(seq) for seq in range(1, 6)], history_limit=3)
+    for seq in range(1, 6):
+        buffer.append("g", msg(seq))
+
+    seqs, done = asyncio.run(replay(buffer, store, 3, 5))
+    assert (seqs, done["source"], store.queries) == ([4, 5], "memory", 0)
+    seqs, done = asyncio.run(replay(buffer, store, 2, 5))
+    assert (seqs, done["source"], store.queries) == ([3, 4, 5], "database", 1)
+    seqs, done = asyncio.run(replay(buffer, store, 1, 5))
+    assert (seqs, done["truncated"]) == ([], True)
+    assert done == {"type": "replayed", "seq": 5, "source": None, "truncated": True}
+
+    rendered = metrics.REGISTRY.render()
+    for source in ("memory", "database", "truncated"):
+        assert f'websocket_replays_total{{source="{source}"}}' in rendered
+    assert 'websocket_replays_total{source="1"}' not in rendered
+
+
+def test_skipped_seqs_do_not_break_memory_replay():
+    buffer = ReplayBuffer(size=5)
+    buffer.append("g", msg(1))
+    buffer.skip("g", 2)
+    buffer.append("g", msg(3))
+    assert [m["seq"] for m in buffer.after("g", 0, 3)] == [1, 3]
+    assert buffer.after("g", 1, 2) == []
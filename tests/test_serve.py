@@ -0,0 +1,106 @@
+import serve
+from config import Settings
+from serve import ServeSettings, Supervisor, shared_backends_missing
+
+
+def test_serve_settings_from_env():
+    settings = ServeSettings.from_env({"PORT": "9000", "WEB_CONCURRENCY": "3", "MAX_REQUESTS": "0"})
+    assert (settings.port, settings.workers, settings.max_requests) == (9000, 3, 0)
+    assert ServeSettings.from_env({}).workers is None
+
+
+def test_multiple_workers_need_shared_backends():
+    assert shared_backends_missing(Settings.from_env({})) == [
+        "FANOUT_REDIS_URL", "RATE_LIMIT_REDIS_URL", "PRESENCE_REDIS_URL (or PRESENCE_ENABLED=false)",
+    ]
+    assert shared_backends_missing(Settings.from_env({
+        "FANOUT_REDIS_URL": "redis://r", "RATE_LIMIT_REDIS_URL": "redis://r", "PRESENCE_ENABLED": "false",
+    })) == []
+
+
+def test_main_refuses_several_workers_without_shared_backends(monkeypatch):
+    monkeypatch.setattr(serve, "load_env", lambda: {})
+    monkeypatch.setattr(Settings, "from_env", classmethod(lambda cls, env=None: cls()))
+    monkeypatch.setattr(serve, "bind_socket", lambda *args: (_ for _ in ()).throw(AssertionError("bound")))
+    assert serve.main(["--workers", "2"]) == 2
+
+
+class FakeSupervisor(Supervisor):
+    def __init__(self, workers):
+        super().__init__(ServeSettings(workers=len(workers), graceful_timeout_seconds=5), sock=None)
+        self.workers = dict(workers)
+        self.next_pid = 100
+        self.terminated = []
+        self.jobs_started = []
+
+    def spawn(self, index, defer_jobs=False):
+        self.next_pid += 1
+        self.workers[self.next_pid] = index
+        return self.next_pid
+
+    def start_jobs(self, pid):
+        self.jobs_started.append(pid)
+
+    def retire(self, pid):
+        self.retiring.add(pid)
+        self.terminated.append(pid)
+
+
+def test_reload_replaces_one_worker_at_a_time():
+    supervisor = FakeSupervisor({1: 0, 2: 1})
+    supervisor.handle_reload(None, None)
+
+    supervisor.step_reload(now=0)
+    assert supervisor.replacing[:2] == (1, 101) and supervisor.terminated == []
+    supervisor.step_reload(now=1)  # replacement not accepting yet
+    assert supervisor.terminated == [] and 102 not in supervisor.workers
+
+    supervisor.accepting.add(101)
+    supervisor.step_reload(now=2)
+    assert supervisor.terminated == [1]
+    supervisor.step_reload(now=3)
+    assert supervisor.replacing[:2] == (2, 102) and supervisor.workers[102] == 1
+    supervisor.accepting.add(102)
+    supervisor.step_reload(now=4)
+    assert supervisor.terminated == [1, 2] and supervisor.replacing is None
+
+
+def test_reload_is_aborted_when_the_replacement_does_not_start():
+    supervisor = FakeSupervisor({1: 0, 2: 1})
+    supervisor.handle_reload(None, None)
+    supervisor.step_reload(now=0)
+    del supervisor.workers[101]  # exited during startup
+    supervisor.step_reload(now=1)
+    assert supervisor.terminated == [] and supervisor.replacing is None and supervisor.reload_queue == []
+
+
+def test_worker_0_replacement_starts_jobs_only_after_the_old_one_exits():
+    supervisor = FakeSupervisor({1: 0, 2: 1})
+    supervisor.handle_reload(None, None)
+    supervisor.step_reload(now=0)
+    assert supervisor.deferred_jobs == {0: 101}
+
+    supervisor.accepting.add(101)
+    supervisor.step_reload(now=1)
+    supervisor.hand_over_jobs()
+    assert supervisor.terminated == [1] and supervisor.jobs_started == []  # still draining
+
+    del supervisor.workers[1]
+    supervisor.hand_over_jobs()
+    assert supervisor.jobs_started == [101] and supervisor.deferred_jobs == {}
+
+    supervisor.step_reload(now=2)
+    assert supervisor.replacing[:2] == (2, 102) and supervisor.deferred_jobs == {}
+
+
+def test_deferred_jobs_start_on_request(make_client):
+    client = make_client(
+        configure=lambda settings: setattr(settings, "background_jobs", False),
+        REMINDERS_ENABLED="true", MESSAGE_RETENTION_DAYS="30",
+    )
+    res = client.app.state.resources
+    assert res.reminders is None and res.tasks == []
+
+    client.portal.call(res.start_background_jobs)
+    client.portal.call(res.start_background_jobs)  # a second signal is a no-op
+    assert res.reminders is not None and len(res.tasks) == 1
@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import metrics
+from fake_mongo import FakeDatabase
+from study_slots import FreeSlotCache, common_free, free_slots, off_hours, score, shared_deadlines
+
+MONDAY = datetime(2024, 3, 11, tzinfo=timezone.utc)
+
+
+def at(hour: float, day: int = 0) -> datetime:
+    return MONDAY + timedelta(days=day, hours=hour)
+
+
+def test_common_free_sweeps_overlapping_busy_blocks():
+    busy = [(at(9), at(11)), (at(10), at(12)), (at(14), at(15)), (at(14.5), at(14.75)), (at(20), at(30))]
+    assert common_free(busy, at(8), at(18)) == [(at(8), at(9)), (at(12), at(14)), (at(15), at(18))]
+    assert common_free([], at(8), at(9)) == [(at(8), at(9))]
+    assert common_free([(at(7), at(19))], at(8), at(18)) == []
+
+
+def test_off_hours_respect_the_local_offset():
+    # UTC-7: local 08:00-22:00 is 15:00-05:00 UTC
+    intervals = off_hours(at(0), at(24), 8, 22, -7 * 60)
+    free = common_free(intervals, at(0), at(24))
+    assert free == [(at(0), at(5)), (at(15), at(24))]
+
+
+def test_shared_deadlines_and_score_prefer_close_widely_shared_deadlines():
+    assignments = [
+        {"user_id": "a", "course_key": "k", "canvas_id": 1, "title": "HW", "due_date": at(12, 1).isoformat()},
+        {"user_id": "b", "course_key": "k", "canvas_id": 1, "title": "HW", "due_date": at(12, 1).isoformat()},
+        {"user_id": "a", "course_name": "Bio", "title": "Lab", "due_date": at(12, 6).isoformat()},
+        {"user_id": "b", "course_name": "bio", "title": "lab", "due_date": at(12, 6).isoformat()},
+        {"user_id": "a", "course_name": "Art", "title": "Solo", "due_date": at(12, 2).isoformat()},
+    ]
+    deadlines = shared_deadlines(assignments, member_count=2)
+    assert [d["title"] for d in deadlines] == ["HW", "Lab"]
+    assert all(d["share"] == 1.0 for d in deadlines)
+    close, reasons = score(at(12), deadlines)
+    far, _ = score(at(12, 5), deadlines)
+    assert close > far
+    assert reasons[0]["title"] == "HW"
+
+
+def test_free_slots_ranks_windows_and_caches():
+    async def scenario():
+        db = FakeDatabase("test")
+        await db.busy_blocks.insert_many([
+            {"user_id": "a", "start": at(8).isoformat(), "end": at(12).isoformat()},
+            {"user_id": "b", "start": at(13).isoformat(), "end": at(22).isoformat()},
+        ])
+        await db.assignments.insert_many([
+            {"id": "1", "user_id": u, "title": "HW", "course_name": "CS", "due_date": at(9, 1).isoformat()}
+            for u in ("a", "b")
+        ])
+        result = await free_slots(db, ["a", "b"], at(0), at(0, 2), duration_minutes=60)
+
+        cache = FreeSlotCache()
+        cache.put(("g",), ["a", "b"], result)
+        hit = cache.get(("g",), ["a", "b"])
+        cache.bump("a")
+        return result, hit, cache.get(("g",), ["a", "b"])
+
+    result, hit, after_bump = asyncio.run(scenario())
+    slots = result["slots"]
+    # Tuesday morning is right before the shared deadline, so it ranks first
+    assert [(s["start"], s["minutes"]) for s in slots] == [(at(8, 1).isoformat(), 840), (at(12).isoformat(), 60)]
+    assert slots[0]["score"] > slots[1]["score"]
+    assert slots[0]["deadlines"][0]["members"] == 2
+    assert hit is result and after_bump is None
+    rendered = metrics.REGISTRY.render()
+    assert 'free_slot_cache_lookups_total{result="hit"}' in rendered
+    assert 'free_slot_cache_lookups_total{result="1"}' not in rendered
@@ -0,0 +1,80 @@
+import pytest
+
+
+def member(client):
+    response = client.post(
+        "/api/auth/register", json={"email": "ws@example.com", "password": "secret123", "full_name": "W"}
+    ).json()
+    headers = {"Authorization": f"Bearer {response['access_token']}"}
+    group_id = client.post("/api/groups", json={"name": "G", "description": ""}, headers=headers).json()["id"]
+    return response["user"]["id"], response["access_token"], headers, group_id
+
+
+def assert_cleaned_up(res, group_id, user_id):
+    assert res.manager.active_connections.get(group_id, []) == []
+    assert user_id not in res.manager.user_connections
+    assert group_id not in res.presence.local
+
+
+def test_errors_inside_the_socket_loop_still_clean_up(make_client, monkeypatch):
+    import server
+
+    client = make_client(PRESENCE_ENABLED="true")
+    res = client.app.state.resources
+    user_id, token, _, group_id = member(client)
+
+    async def failing_mark_read(*args):
+        raise RuntimeError("mongo unavailable")
+
+    monkeypatch.setattr(server, "mark_read", failing_mark_read)
+    with pytest.raises(RuntimeError):
+        with client.websocket_connect(f"/ws/groups/{group_id}?token={token}") as socket:
+            assert socket.receive_json()["online"] == [user_id]
+            assert group_id in res.presence.local
+            socket.send_json({"type": "ack", "seq": 0})
+            socket.receive_json()
+    assert_cleaned_up(res, group_id, user_id)
+
+
+def test_notification_socket_is_released_when_the_reminder_flush_fails(make_client, monkeypatch):
+    import server
+
+    client = make_client(PRESENCE_ENABLED="true", REMINDERS_ENABLED="true")
+    res = client.app.state.resources
+    user_id, token, _, group_id = member(client)
+
+    async def failing_flush(*args):
+        raise RuntimeError("mongo unavailable")
+
+    monkeypatch.setattr(server, "flush_reminders", failing_flush)
+    with pytest.raises(RuntimeError):
+        with client.websocket_connect(f"/ws/notifications?token={token}") as socket:
+            socket.receive_json()
+    assert_cleaned_up(res, group_id, user_id)
+
+
+def test_client_gone_mid_replay_releases_the_socket(make_client, monkeypatch):
+    from starlette.websockets import WebSocket
+
+    client = make_client(PRESENCE_ENABLED="true")
+    res = client.app.state.resources
+    user_id, token, headers, group_id = member(client)
+    for i in range(5):
+        client.post(f"/api/groups/{group_id}/messages", json={"content": str(i)}, headers=headers)
+
+    send_json = WebSocket.send_json
+    sent = []
+
+    async def closing_send_json(self, data, mode="text"):
+        if len(sent) == 2:
+            # What Starlette raises once the peer has gone away
+            raise RuntimeError('Cannot call "send" once a close message has been sent.')
+        sent.append(data)
+        await send_json(self, data, mode)
+
+    monkeypatch.setattr(WebSocket, "send_json", closing_send_json)
+    with pytest.raises(RuntimeError):
+        with client.websocket_connect(f"/ws/groups/{group_id}?token={token}&last_seen_seq=0") as socket:
+            assert [socket.receive_json()["seq"] for _ in range(2)] == [1, 2]
+            socket.receive_json()
+    assert_cleaned_up(res, group_id, user_id)
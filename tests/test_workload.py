@@ -0,0 +1,167 @@
+import asyncio
+from datetime import date
+
+from pymongo.errors import DuplicateKeyError
+
+import canvas_catalog
+from fake_mongo import FakeDatabase
+from workload import bucket_day, default_start, invalidate_course, rebuild, record, workload
+
+MONDAY = date(2024, 3, 11)
+
+
+def assignment(due_date: str, course: str = "Bio", **fields) -> dict:
+    return {"user_id": "u1", "title": "HW", "course_name": course, "due_date": due_date, **fields}
+
+
+def test_bucket_day_uses_the_utc_calendar_day():
+    assert bucket_day("2024-03-11T23:30:00-02:00") == "2024-03-12"
+    assert bucket_day("2024-03-11T01:00:00Z") == "2024-03-11"
+    assert bucket_day("2024-03-11T01:00:00") == "2024-03-11"
+    assert default_start(date(2024, 3, 14)) == MONDAY
+
+
+def test_record_and_workload_agree_with_a_rebuild():
+    docs = [
+        assignment("2024-03-11T10:00:00+00:00"),
+        assignment("2024-03-11T18:00:00+00:00", completed=True),
+        assignment("2024-03-12T09:00:00+00:00", course="Art"),
+        assignment("2024-03-19T09:00:00+00:00", course="Art", completed=True),
+        assignment("2024-03-30T09:00:00+00:00"),  # outside the range
+    ]
+
+    async def scenario():
+        db = FakeDatabase("test")
+        await db.workload_summaries.insert_one({"user_id": "u1", "built_at": "2024-03-01", "course_keys": []})
+        for doc in docs:
+            await db.assignments.insert_one(dict(doc))
+            await record(db, "u1", [(doc, 1, int(bool(doc.get("completed"))))])
+        # Toggle one and delete another, as the routes do
+        await record(db, "u1", [(docs[0], 0, 1)])
+        await record(db, "u1", [(docs[2], -1, 0)])
+        db.assignments.docs[0]["completed"] = True
+        del db.assignments.docs[2]
+        incremental = await workload(db, "u1", MONDAY, 14)
+
+        await db.workload_summaries.delete_many({})
+        rebuilt = await workload(db, "u1", MONDAY, 14)
+        return incremental, rebuilt
+
+    incremental, rebuilt = asyncio.run(scenario())
+    assert incremental == rebuilt
+    days = {day["date"]: day for day in incremental["days"]}
+    assert len(days) == 14
+    assert (days["2024-03-11"]["due"], days["2024-03-11"]["completed"]) == (2, 2)
+    assert days["2024-03-12"] == {"date": "2024-03-12", "due": 0, "completed": 0, "courses": {}}
+    assert days["2024-03-19"]["courses"] == {"Art": 1}
+    assert incremental["courses"] == ["Art", "Bio"]
+    assert incremental["weeks"] == [
+        {"week_start": "2024-03-11", "due": 2, "completed": 2, "completion_rate": 1.0},
+        {"week_start": "2024-03-18", "due": 1, "completed": 1, "completion_rate": 1.0},
+    ]
+
+
+def test_weeks_cover_a_partial_range_and_empty_weeks_have_no_rate():
+    async def scenario():
+        db = FakeDatabase("test")
+        await db.workload_summaries.insert_one({"user_id": "u1", "built_at": "2024-03-01", "course_keys": []})
+        await record(db, "u1", [(assignment("2024-03-11T10:00:00+00:00"), 1, 0)])
+        return await workload(db, "u1", MONDAY, 10)
+
+    result = asyncio.run(scenario())
+    assert result["end"] == "2024-03-21"
+    assert [(w["week_start"], w["due"], w["completion_rate"]) for w in result["weeks"]] == [
+        ("2024-03-11", 1, 0.0),
+        ("2024-03-18", 0, None),
+    ]
+
+
+def test_invalidate_course_drops_summaries_that_cover_it():
+    async def scenario():
+        db = FakeDatabase("test")
+        await db.workload_summaries.insert_one({"user_id": "u1", "built_at": "2024-03-01", "course_keys": []})
+        await db.workload_summaries.insert_one({"user_id": "u2", "built_at": "2024-03-01", "course_keys": []})
+        await record(db, "u1", [(assignment("2024-03-11T10:00:00+00:00", course_key="k1"), 1, 0)])
+        await invalidate_course(db, "k1")
+        return [doc["user_id"] for doc in db.workload_summaries.docs]
+
+    assert asyncio.run(scenario()) == ["u2"]
+
+
+def slow_hydrate(monkeypatch, during=None):
+    hydrate = canvas_catalog.hydrate
+
+    async def hydrate_later(db, assignments):
+        # Yield so a concurrent read or write runs mid-rebuild
+        await asyncio.sleep(0)
+        if during:
+            await during()
+        return await hydrate(db, assignments)
+
+    monkeypatch.setattr(canvas_catalog, "hydrate", hydrate_later)
+
+
+def round_trips(collection):
+    """Make each call a separate await, as over the network, and enforce the
+    unique (user_id, day, course) bucket index the fake does not know about."""
+    for name in ("find_one", "insert_many", "delete_many", "update_one", "bulk_write"):
+        method = getattr(collection, name)
+
+        async def call(*args, _method=method, **kwargs):
+            await asyncio.sleep(0)
+            return await _method(*args, **kwargs)
+
+        setattr(collection, name, call)
+    insert_many = collection.insert_many
+
+    async def unique_insert_many(docs, *args, **kwargs):
+        stored = {(d["user_id"], d["day"], d["course"]) for d in collection.docs}
+        if any((d["user_id"], d["day"], d["course"]) in stored for d in docs):
+            raise DuplicateKeyError("E11000 duplicate key error")
+        return await insert_many(docs, *args, **kwargs)
+
+    collection.insert_many = unique_insert_many
+
+
+def test_concurrent_first_reads_build_each_bucket_once(monkeypatch):
+    slow_hydrate(monkeypatch)
+
+    async def scenario():
+        db = FakeDatabase("test")
+        round_trips(db.workload_buckets)
+        await db.workload_buckets.insert_one({"user_id": "u1", "day": "2024-03-01", "course": "Old", "due": 1})
+        for doc in (assignment("2024-03-11T10:00:00+00:00"), assignment("2024-03-11T12:00:00+00:00", completed=True)):
+            await db.assignments.insert_one(doc)
+        first, second = await asyncio.gather(workload(db, "u1", MONDAY, 7), workload(db, "u1", MONDAY, 7))
+        return db, first, second
+
+    db, first, second = asyncio.run(scenario())
+    assert first == second
+    assert (first["days"][0]["due"], first["days"][0]["completed"]) == (2, 1)
+    assert [(b["day"], b["course"], b["due"]) for b in db.workload_buckets.docs] == [("2024-03-11", "Bio", 2)]
+    assert len(db.workload_summaries.docs) == 1
+    assert "built_at" in db.workload_summaries.docs[0]
+
+
+def test_a_write_during_a_rebuild_leaves_the_summary_unbuilt(monkeypatch):
+    db = FakeDatabase("test")
+    late = assignment("2024-03-12T10:00:00+00:00")
+
+    async def add_assignment():
+        if db.assignments.docs[-1]["due_date"] == late["due_date"]:  # only race the first rebuild
+            return
+        await db.assignments.insert_one(dict(late))
+        await record(db, "u1", [(late, 1, 0)])
+
+    slow_hydrate(monkeypatch, add_assignment)
+
+    async def scenario():
+        await db.assignments.insert_one(assignment("2024-03-11T10:00:00+00:00"))
+        built = await rebuild(db, "u1")
+        unbuilt = await db.workload_summaries.find_one({"user_id": "u1"})
+        return built, unbuilt, await workload(db, "u1", MONDAY, 7)
+
+    built, unbuilt, result = asyncio.run(scenario())
+    assert not built
+    assert "built_at" not in unbuilt
+    assert [day["due"] for day in result["days"][:2]] == [1, 1]